@@ -0,0 +1,68 @@
+'''
+Author: Alex Crawford
+Date Created: 18 Oct 2026
+Date Modified: 18 Oct 2026
+Purpose: Extract the hourly time series of every grid cell in a region from the
+daily reanalysis files and store them as memory-mappable (time, cell) arrays
+(one per variable). Stages 1, 2, and 5 can then read from these arrays instead
+of opening every daily netCDF file again.
+
+Default units: same as the reanalysis files
+'''
+
+'''********************
+Import Modules
+********************'''
+import netCDF4 as nc
+import numpy as np
+import RainOnSnow_Module as ros
+
+'''********************
+Define Variables
+********************'''
+
+### File Path Variables ###
+ra = "MERRA2"
+ncpath = "/Volumes/Miranda/"+ra+"_nc"
+ncpath1 = ncpath+"/Hourly/MERRA-LND"
+ncpath2 = ncpath+"/Hourly/T2M"
+region = "Alaska" # Name of the region (see regiondefs in RainOnSnow_Module)
+regpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Regions"
+tspath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/TimeSeries"
+
+### Variables to Extract ###
+vars1 = ['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF'] # from ncpath1
+vars2 = ['T2M'] # from ncpath2
+
+### Time Variables ###
+starttime = [1980,1,1,0,0,0]
+endtime = [2019,1,1,0,0,0]
+reftime = [1900,1,1,0,0,0]
+hrs = 1 # Temporal Resolution in hours
+
+lookahead = 1 # Number of days of data to read in the background ahead of the current day
+
+'''*******************************************
+Main Analysis
+*******************************************'''
+# Index the daily files by date and make sure none are missing
+ind1 = ros.indexFiles(ncpath1)
+ind2 = ros.indexFiles(ncpath2)
+miss = ros.missingDays(ind1,starttime,endtime) + ros.missingDays(ind2,starttime,endtime)
+if len(miss) > 0:
+    raise FileNotFoundError("No reanalysis file for " + ", ".join(sorted(set(miss))))
+
+# Identify the region's grid cells (land only)
+ncf = nc.Dataset(list(ind1.values())[0])
+lats = ncf.variables['lat'][:]
+lons = ncf.variables['lon'][:]
+reg = ros.loadRegion(region,lats,lons,np.isfinite(ncf.variables['PRECTOTLAND'][0,:,:]),cache=regpath)
+ncf.close()
+
+# Extract the time series (with the grid, so that stages reading them need no
+## netCDF file)
+reader = ros.dailyreader([(ind1,vars1),(ind2,vars2)],reg.rows,reg.cols)
+ros.extractTimeSeries(reader,starttime,endtime,tspath,vars1+vars2,hrs,reftime,\
+                      lookahead=lookahead,lats=lats,lons=lons)
+
+print("Completed " + str(len(reg)) + " grid cells from " + str(starttime[0]) + " to " + str(endtime[0]))
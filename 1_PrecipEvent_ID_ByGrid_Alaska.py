@@ -2,6 +2,23 @@
 Author: Alex Crawford
 Date Created: 29 May 2019
 Date Modified: 29 May 2019
+                18 Oct 2026 --> Update all grid cells at once each hour (event state held
+                    as arrays in RainOnSnow_Module)
+                18 Oct 2026 --> Collect events in a columnar buffer instead of
+                    appending one-row data frames
+                18 Oct 2026 --> Read each variable once per day for the region
+                18 Oct 2026 --> Look up daily files in a date index
+                18 Oct 2026 --> Option to run chunks of months in parallel
+                18 Oct 2026 --> Option to run tiles of grid cells in parallel
+                18 Oct 2026 --> Running temperature aggregates (optional means)
+                18 Oct 2026 --> Integer-hour time axis
+                18 Oct 2026 --> Versioned .npz checkpoints for active events
+                18 Oct 2026 --> Optional Parquet event catalog
+                18 Oct 2026 --> Region masks from RainOnSnow_Module (cached)
+                18 Oct 2026 --> Threshold sweep mode (one pass over the data)
+                18 Oct 2026 --> Option to read from the extracted time series
+                18 Oct 2026 --> Incremental mode for newly available months
+                18 Oct 2026 --> Fused mode that also does the work of 2_ROS_ID_ByGrid.py
 Purpose: Identify precipitation events over a grid of locations using reanalysis 
 inputs. Save a separate file for each month of data.
 
@@ -13,10 +30,12 @@ Import Modules
 ********************'''
 import netCDF4 as nc
 import os
+import shutil
 import numpy as np
 import pandas as pd
 from copy import deepcopy
 import MERRA_Module as md
+import RainOnSnow_Module as ros
 
 '''********************
 Define Variables
@@ -27,23 +46,55 @@ ra = "MERRA2"
 ncpath = "/Volumes/Miranda/"+ra+"_nc"
 ncpath1 = ncpath+"/Hourly/MERRA-LND"
 ncpath2 = ncpath+"/Hourly/T2M"
-outpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Alaska/PrecipIdentified"
+region = "Alaska" # Name of the region (see regiondefs in RainOnSnow_Module)
+outpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/PrecipIdentified"
+regpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Regions"
+tspath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/TimeSeries" # from 0_ExtractRegionTimeSeries.py
+rospath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/ROSIdentified_V2" # if fused = 1,
+## preliminary months and the catalog go here (like outpath of 2_ROS_ID_ByGrid.py) and
+## final months go to outpath with an "m" suffix (like csvpath of 2_ROS_ID_ByGrid.py)
 
 ### Physical Variables ###
 pconversion = 3600 # to convert precip to a value of mm
 # In MERRA2 --> kg m^-2 s^-1 --> mm hr^-1 is *3600/1000*1000
 rthresh = 6.096/24 # in mm/hr (equiva. to a rate of 0.254/24 = 0.01 in/day)
 pthresh = 0.254 # total mm (equiv. to 0.01 in/event)
+means = 0 # 1 = also record mean temperatures and number of hours w/ measurable precip
+tthresh = -10 # minimum temperature (deg C) for which rain is allowed to be detected (fused = 1 only)
+minrain = 0.254 # minimum rain (mm) of an icing event (pthresh of 2_ROS_ID_ByGrid.py) (fused = 1 only)
+sthresh = 0.0254 # minimum snow depth in meters (fused = 1 only)
+frzwindows = [24,240,720,2160] # Length (hours) of each window after an event in which
+## frozen hours are counted (fused = 1 only)
 
 ### Time Variables ###
 starttime = [1980,5,1,0,0,0]
 endtime = [2019,1,1,0,0,0]
+reftime = [1900,1,1,0,0,0]
 daystep = [0,0,1,0,0,0]
+monthstep = [0,1,0,0,0,0]
 hrs = 1 # Temporal Resolution in hours
 hthresh = 2 # Number of hours w/out measurable precip needed to mark separate
 # precip events
 
+sweep = [] # List of (rthresh, pthresh, hthresh) to run instead of the single set
+## of thresholds above -- every set is run in the same pass over the data and
+## gets its own output files (e.g., [(6.096/24,0.254,2),(6.096/24,0.254,6)])
+
 init = 1 # 0 = no initialization file; 1 = initialization file present from prior month
+catalog = 1 # 1 = also write events to a Parquet catalog (one file per month)
+fromcache = 0 # 1 = read the time series in tspath instead of the daily netCDF files
+incremental = 0 # 1 = ignore starttime, endtime, and init, and instead continue from the
+## latest checkpoint in ActiveEvents through the last month with every day available
+fused = 0 # 1 = also identify icing events and count frozen hours after each event in the
+## same pass over the data (i.e., do the work of 2_ROS_ID_ByGrid.py), writing only the
+## ROS files, with the names and directories of 2_ROS_ID_ByGrid.py (one set of thresholds
+## in a single process only)
+
+### Parallel Processing Variables ###
+ncores = 1 # Number of processes; 1 = run month by month in a single process
+chunkmonths = 12 # Number of months handled by each process at a time when ncores > 1
+ntiles = 1 # Number of spatial tiles; > 1 = each process handles one tile
+## (i.e., a band of grid cells) for the whole time period instead of a chunk of months
 
 months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
 mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
@@ -57,136 +108,256 @@ hours = ["0000","0100","0200","0300","0400","0500","0600","0700","0800",\
 '''*******************************************
 Main Analysis
 *******************************************'''
-files1 = os.listdir(ncpath1)
-files2 = os.listdir(ncpath2)
-
-# Load latitude and longitude arrays from a sample file
-ncf = nc.Dataset(ncpath1+"/"+files1[0])
-lats = ncf.variables['lat'][:]
-lons = ncf.variables['lon'][:]
-examp = ncf.variables['PRECTOTLAND'][0,:,:]
-ncf.close()
-
-# Identify Alaska Grid Cells
-longrid, latgrid = np.meshgrid(lons, lats)
-reg1 = np.where( ( ((longrid <= -141) & (longrid >= -170) & (latgrid >= 50) & (latgrid <= 75)) |
-        ((longrid <= -130) & (longrid >= -135) & (latgrid >= 54.5) & (latgrid < 56.5)) |
-        ((longrid <= -131.5) & (longrid >= -137) & (latgrid >= 56.5) & (latgrid < 57.5)) |
-        ((longrid <= -132.5) & (longrid >= -139) & (latgrid >= 57.5) & (latgrid < 59)) |
-        ((longrid <= -134.5) & (longrid >= -141) & (latgrid >= 59) & (latgrid < 61)) )
-         & (np.isfinite(examp) == 1), 1, np.nan)
-rows, cols = np.where(reg1 == 1)
-
-del examp
-
-# Set up initial conditions
-if init == 1:
-    evprec, evsnof, evhrs, evtsrf, evt2m, st, stnod = pd.read_pickle(outpath+"/ActiveEvents/Active_"+str(starttime[0])+mons[starttime[1]-1]+".pkl")
-else: 
-    evprec = np.zeros(rows.shape)
-    evsnof = np.zeros(rows.shape)
-    evhrs = np.zeros(rows.shape)
-    evtsrf = [[] for i in range(len(rows))]
-    evt2m = [[] for i in range(len(rows))]
-    st = [[] for i in range(len(rows))]
-    stsnod = np.zeros(rows.shape)
-
-time = deepcopy(starttime)
-pdf = pd.DataFrame(columns = ["Year","Month","Day","Hour","X","Y","Length",\
-                "Precip","Snowfall","StSnoDep","EdSnoDep",\
-                "MaxTSurf","MinTSurf","MaxT2m","MinT2m"])
-
-while time != endtime:
-    # Load data for first day of analysis
-    Y, M, D = str(time[0]), mons[time[1]-1], days[time[2]-1]
+# Worker processes import this script, so only run the analysis when it is
+## the script being executed
+if __name__ == "__main__":
+    # Index the daily files by date (or, if reading the extracted time series,
+    ## the days they cover)
+    if fromcache == 1:
+        reader = ros.seriescache(tspath)
+        indices = [reader.days]
+    else:
+        ind1 = ros.indexFiles(ncpath1)
+        ind2 = ros.indexFiles(ncpath2)
+        indices = [ind1,ind2]
+    
+    # In incremental mode, find the months that have not been processed yet
+    if incremental == 1:
+        # In sweep mode, each set of thresholds has its own checkpoints, so
+        ## continue from the earliest of their latest ones
+        if len(sweep) == 0:
+            ckpaths = [outpath+"/ActiveEvents"]
+        else:
+            ckpaths = [outpath+"/ActiveEvents/PrecipEvents_"+region+"_Gap"+str(h)+"_Rate"+str(np.round(r,4))+"_Total"+str(p) for r, p, h in sweep]
+        starttimes = []
+        for ckpath in ckpaths:
+            st = ros.latestState(ckpath) if os.path.isdir(ckpath) else None
+            if st is None:
+                raise FileNotFoundError("No checkpoint in " + ckpath + " to continue from")
+            starttimes.append(st)
+        starttime = min(starttimes)
+        endtime = ros.completeThrough(indices,starttime)
+        init = 1
     
-    # Load data for current day
-    fN1 = [fN for fN in files1 if Y+M+D in fN][0]
-    fN2 = [fN for fN in files2 if Y+M+D in fN][0]
+    # Make sure no days are missing before starting
+    miss = [k for index in indices for k in ros.missingDays(index,starttime,endtime)]
+    if len(miss) > 0 and fromcache == 1:
+        raise FileNotFoundError("No data in " + tspath + " for " + ", ".join(sorted(set(miss))))
+    elif len(miss) > 0:
+        raise FileNotFoundError("No reanalysis file for " + ", ".join(sorted(set(miss))))
     
-    ncf1 = nc.Dataset(ncpath1+"/"+fN1)
-    ncf2 = nc.Dataset(ncpath2+"/"+fN2)
+    if fromcache == 1:
+        # The region's grid cells are those of the time series
+        rows, cols = reader.rows, reader.cols
     
-    for h in range(24): # For each hour of the day...
-        prec = ncf1['PRECTOTLAND'][h,:,:][(rows,cols)].flatten()*pconversion
-        snof = ncf1['PRECSNOLAND'][h,:,:][(rows,cols)].flatten()*pconversion
-        snod = ncf1['SNODP'][h,:,:][(rows,cols)].flatten()
-        tsrf = ncf1['TSURF'][h,:,:][(rows,cols)].flatten()
-        t2m = ncf2['T2M'][h,:,:][(rows,cols)].flatten()
+    else:
+        # Load latitude and longitude arrays from a sample file
+        ncf = nc.Dataset(list(ind1.values())[0])
+        lats = ncf.variables['lat'][:]
+        lons = ncf.variables['lon'][:]
+        examp = ncf.variables['PRECTOTLAND'][0,:,:]
+        ncf.close()
+        
+        # Identify the region's grid cells (land only)
+        reg = ros.loadRegion(region,lats,lons,np.isfinite(examp),cache=regpath)
+        rows, cols = reg.rows, reg.cols
+        
+        del examp
         
-        # For any grid cell with measurable precip...
-        pis = np.where(prec >= rthresh)[0]
+        # Set up a reader for the region's grid cells
+        reader = ros.dailyreader([(ind1,['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF']),\
+                                  (ind2,['T2M'])],rows,cols)
+    
+    # Directory of the event catalog
+    catpath = outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)
+    
+    # Set up initial conditions
+    if init == 1 and len(sweep) == 0:
+        initfile = outpath+"/ActiveEvents/Active_"+str(starttime[0])+mons[starttime[1]-1]
+        if os.path.exists(initfile+".npz"):
+            state = ros.readState(initfile+".npz",rows,cols)
+        else: # Written by an older version
+            state = ros.readState(initfile+".pkl",rows,cols,reftime)
+    else: 
+        state = None
+    
+    # Break the time period into months
+    mtimes = [deepcopy(starttime)]
+    while mtimes[-1] != endtime:
+        mtimes.append(min(md.timeAdd([mtimes[-1][0],mtimes[-1][1],1,0,0,0],monthstep),endtime))
+    
+    if fused == 1 and (len(sweep) > 0 or ntiles > 1 or ncores > 1):
+        raise ValueError("fused = 1 requires a single set of thresholds and ncores = ntiles = 1")
+    
+    if len(mtimes) == 1:
+        print("No new months to process")
+    
+    elif len(sweep) > 0:
+        # Output names and initial conditions for each set of thresholds
+        names = ["PrecipEvents_"+region+"_Gap"+str(h)+"_Rate"+str(np.round(r,4))+"_Total"+str(p) for r, p, h in sweep]
+        for n in names:
+            os.makedirs(outpath+"/ActiveEvents/"+n,exist_ok=True)
+        
+        if init == 1:
+            states = [ros.readState(outpath+"/ActiveEvents/"+n+"/Active_"+str(starttime[0])+mons[starttime[1]-1]+".npz",rows,cols) for n in names]
+        else:
+            states = None
+        
+        for m in range(len(mtimes)-1): # For each month...
+            Y, M = str(mtimes[m][0]), mons[mtimes[m][1]-1]
+            
+            # Detect events for every set of thresholds at once
+            edfs, states = ros.detectEventsSweep(reader,mtimes[m],mtimes[m+1],sweep,hrs,\
+                        pconversion,states,reftime,means=means)
+            
+            # Write to File
+            for n, edf, st in zip(names,edfs,states):
+                pdf = ros.eventTable(edf,rows,cols,reftime)
+                pdf.to_csv(outpath+"/"+n+"_"+Y+M+".csv",index=0)
+                if catalog == 1:
+                    ros.writeCatalog(pdf,outpath+"/"+n,Y+M)
+                ros.writeState(st,outpath+"/ActiveEvents/"+n+"/Active_"+str(mtimes[m+1][0])+mons[mtimes[m+1][1]-1]+".npz",rows,cols)
+            
+            print("Completed " + Y + M)
     
-        for i in pis:
-            # If there is measurable precip, and a NEW event...
-            if evprec[i] == 0:
-                ### Initiate a new event: ###
-                st[i] = deepcopy(time)
-                st[i][3] = h
-                # Go back 1 hr b/c precip is accumlative over the past hour
-                st[i] = md.timeAdd(starttime,[0,0,md.daysBetweenDates(starttime,st[i])-(1/24.),0,0,0])
-                stsnod[i] = snod[i]
-                evhrs[i] = 0
+    elif ntiles > 1:
+        # Run each tile of grid cells for all months in parallel
+        tilepaths = ros.detectEventsTiled(reader,mtimes,rthresh,pthresh,hthresh,hrs,\
+                        pconversion,state,reftime,means=means,ntiles=ntiles,ncores=ncores,tmppath=outpath+"/Tiles")
+        
+        for m in range(len(mtimes)-1): # For each month...
+            Y, M = str(mtimes[m][0]), mons[mtimes[m][1]-1]
+            
+            # Combine the tiles
+            edf, state = ros.mergeTiles(tilepaths,Y+M)
             
-            ### Add the new precip, snowfall, and temp ###
-            evprec[i] = evprec[i] + prec[i]
-            evsnof[i] = evsnof[i] + snof[i]
-            evtsrf[i].append(tsrf[i])
-            evt2m[i].append(t2m[i])
+            # Write to File
+            pdf = ros.eventTable(edf,rows,cols,reftime)
+            pdf.to_csv(outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv",index=0)
+            if catalog == 1:
+                ros.writeCatalog(pdf,catpath,Y+M)
+            ros.writeState(state,outpath+"/ActiveEvents/Active_"+str(mtimes[m+1][0])+mons[mtimes[m+1][1]-1]+".npz",rows,cols)
         
-        # If there is no measurable precipitation...
-        nis = np.where((prec < rthresh) & (evprec > 0))[0]
+        # Remove the output of each tile
+        for tp in tilepaths:
+            shutil.rmtree(tp)
         
-        for i in nis:
-            # Add one to the tally
-            evhrs[i] = evhrs[i] + hrs
+        print("Completed " + str(starttime[0]) + mons[starttime[1]-1] + " to " + str(endtime[0]) + mons[endtime[1]-1])
+    
+    elif ncores == 1:
+        if fused == 1:
+            # Frozen hours are counted as each event terminates (see
+            ## ros.freezetracker); events wait in df until the freezing windows
+            ## of their month are complete
+            name = "PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)
+            frzfile = outpath+"/ActiveEvents/Frz_"+str(starttime[0])+mons[starttime[1]-1]
+            if init == 1:
+                if not os.path.exists(frzfile+".npz"):
+                    raise FileNotFoundError("No freezing checkpoint " + frzfile + ".npz for the events " + \
+                                            "still waiting on their freezing windows")
+                tracker, tO = ros.readTracker(frzfile+".npz")
+                df = pd.read_parquet(frzfile+".parquet")
+            else:
+                tracker, tO = ros.freezetracker(frzwindows,history=hthresh), []
+                df = pd.DataFrame()
+        else:
+            tracker = None
+        
+        for m in range(len(mtimes)-1): # For each month...
+            Y, M = str(mtimes[m][0]), mons[mtimes[m][1]-1]
             
-            # If the threshold for no-precip observations has past...
-            if evhrs[i] >= hthresh:
-                ### Terminate the event: ###
-                # If there was sufficient precip...
-                if evprec[i] >= pthresh:
-                    # Record the event
-                    ed = deepcopy(time)
-                    ed[3] = h                    
-
-                    rdf = pd.DataFrame([{"Year":st[i][0], "Month":st[i][1], \
-                            "Day":st[i][2],"Hour":st[i][3],"X":cols[i],"Y":rows[i],\
-                            "Length":md.daysBetweenDates(st[i],ed)*24-hthresh,\
-                            "Precip":evprec[i],"Snowfall":evsnof[i],\
-                            "StSnoDep":stsnod[i],"EdSnoDep":snod[i],\
-                            "MaxTSurf":np.max(evtsrf[i]),"MinTSurf":np.min(evtsrf[i]),\
-                            "MaxT2m":np.max(evt2m[i]),"MinT2m":np.min(evt2m[i])},])
+            # Detect events
+            edf, state = ros.detectEvents(reader,mtimes[m],mtimes[m+1],rthresh,pthresh,\
+                        hthresh,hrs,pconversion,state,reftime,means=means,tracker=tracker)
+            pdf = ros.eventTable(edf,rows,cols,reftime)
+            
+            if fused == 1:
+                # Identify icing events
+                pdf['Rain'] = pdf['Precip'] - pdf['Snowfall']
+                pdf['Ice'] = ros.classifyIce(pdf,tthresh,minrain,sthresh)
+                pdf['EndTime'] = ros.hoursSince(reftime,pdf['Year'],pdf['Month'],pdf['Day'],pdf['Hour']) + pdf['Length']
+                pdf['FrzID'] = edf['EndHr'].values*len(rows) + edf['Cell'].values
+                df = pd.concat([df,pdf], ignore_index=1)
+                
+                t = ros.hoursSince(reftime,mtimes[m+1][0],mtimes[m+1][1],mtimes[m+1][2])
+                tO.append(t)
+                
+                # Write each month whose freezing windows are complete
+                while len(tO) > 0 and t-tO[0] >= max(frzwindows):
+                    YO, MO = ros.hoursToStrings(tO[0]-1,reftime,"%Y")[0], mons[int(ros.hoursToStrings(tO[0]-1,reftime,"%m")[0])-1]
+                    
+                    odf = df[df['EndTime'] < tO[0]]
+                    df = df[df['EndTime'] >= tO[0]]
+                    
+                    # Frozen hours for each window (as a %)
+                    ids, cnts = tracker.pop(tO[0])
+                    pos = pd.Series(np.arange(len(ids)),index=ids)[odf['FrzID']].values
+                    odf = odf.drop(columns=['FrzID'])
+                    for k, w in enumerate(frzwindows):
+                        odf['Frz'+str(w//24).zfill(2)] = cnts[pos,k]/float(w)
                     
-                    pdf = pdf.append(rdf, ignore_index=1, sort=1)
+                    odf.to_csv(outpath+"/"+name+"_"+YO+MO+"m.csv",index=0)
+                    if catalog == 1:
+                        ros.writeCatalog(odf,rospath+"/"+name,YO+MO)
+                    tO = tO[1:]
                 
-                # Reset values
-                evprec[i] = 0
-                evsnof[i] = 0
-                evhrs[i] = 0
-                evtsrf[i] = []
-                evt2m[i] = []
-                st[i] = []
-                stsnod[i] = 0
-    
-    # Advance day step
-    ncf1.close(), ncf2.close()
-    time = md.timeAdd(time,daystep)
+                frzfile = outpath+"/ActiveEvents/Frz_"+str(mtimes[m+1][0])+mons[mtimes[m+1][1]-1]
+                df.to_parquet(frzfile+".parquet",index=False)
+                ros.writeTracker(tracker,frzfile+".npz",tO)
+            
+            else:
+                # Write to File
+                pdf.to_csv(outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv",index=0)
+                if catalog == 1:
+                    ros.writeCatalog(pdf,catpath,Y+M)
+            
+            ros.writeState(state,outpath+"/ActiveEvents/Active_"+str(mtimes[m+1][0])+mons[mtimes[m+1][1]-1]+".npz",rows,cols)
+            
+            print("Completed " + Y + M)
+        
+        # Write preliminary files (frozen hours so far) for the remaining months
+        if fused == 1:
+            ids, cnts = tracker.pop(tO[-1] if len(tO) > 0 else 0,keep=True)
+            pos = pd.Series(np.arange(len(ids)),index=ids)
+            for i in range(len(tO)):
+                YO, MO = ros.hoursToStrings(tO[i]-1,reftime,"%Y")[0], mons[int(ros.hoursToStrings(tO[i]-1,reftime,"%m")[0])-1]
+                
+                odf = df[(df['EndTime'] < tO[i]) & (df['EndTime'] >= (tO[i-1] if i > 0 else -np.inf))]
+                odf.index = range(len(odf))
+                p = pos[odf['FrzID']].values
+                odf = odf.drop(columns=['FrzID'])
+                for k, w in enumerate(frzwindows):
+                    odf['Frz'+str(w//24).zfill(2)] = cnts[p,k]/np.minimum(t-odf['EndTime'],float(w))
+                
+                odf.to_csv(rospath+"/"+name+"_"+YO+MO+".csv",index=0)
+                if catalog == 1:
+                    ros.writeCatalog(odf,rospath+"/"+name,YO+MO)
     
-    if time[2] == 1:
-        # Unit Conversions
-        pdf['MaxTSurf'] = pdf['MaxTSurf'] - 273.15
-        pdf['MinTSurf'] = pdf['MinTSurf'] - 273.15
-        pdf['MaxT2m'] = pdf['MaxT2m'] - 273.15
-        pdf['MinT2m'] = pdf['MinT2m'] - 273.15
+    else:
+        # Run chunks of months in parallel (each starting w/out active events),
+        ## then stitch together events that cross from one chunk to the next
+        ctimes = mtimes[::chunkmonths]
+        if ctimes[-1] != endtime:
+            ctimes.append(endtime)
+        
+        edf, states = ros.detectEventsParallel(reader,list(zip(ctimes[:-1],ctimes[1:])),\
+                        rthresh,pthresh,hthresh,hrs,pconversion,state,reftime,means=means,ncores=ncores)
         
-        # Write to File
-        pdf.to_csv(outpath+"/PrecipEvents_Alaska_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv",index=0)
-        pd.to_pickle([evprec,evsnof,evhrs,evtsrf,evt2m,st,stsnod],outpath+"/ActiveEvents/Active_"+str(time[0])+mons[time[1]-1]+".pkl")
+        # Split events into months by the day on which they were terminated
+        endmonth = ros.hoursToStrings(edf['EndHr'],reftime,"%Y%m")
+        
+        for m in range(len(mtimes)-1): # For each month...
+            Y, M = str(mtimes[m][0]), mons[mtimes[m][1]-1]
+            
+            # Write to File
+            pdf = ros.eventTable(edf[endmonth == Y+M],rows,cols,reftime)
+            pdf.to_csv(outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv",index=0)
+            if catalog == 1:
+                ros.writeCatalog(pdf,catpath,Y+M)
         
-        print("Completed " + Y + M)
+        # Write the active events at the end of each chunk (the only times they
+        ## are known, so an interrupted run starts again from the beginning)
+        for c in range(len(states)):
+            ros.writeState(states[c],outpath+"/ActiveEvents/Active_"+str(ctimes[c+1][0])+mons[ctimes[c+1][1]-1]+".npz",rows,cols)
         
-        # Restart PDF
-        pdf = pd.DataFrame(columns = ["Year","Month","Day","Hour","X","Y","Length",\
-                "Precip","Snowfall","StSnoDep","EdSnoDep",\
-                "MaxTSurf","MinTSurf","MaxT2m","MinT2m"])
+        print("Completed " + str(starttime[0]) + mons[starttime[1]-1] + " to " + str(endtime[0]) + mons[endtime[1]-1])
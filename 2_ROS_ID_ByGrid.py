@@ -2,6 +2,19 @@
 Author: Alex Crawford
 Date Created: 13 Mar 2019
 Date Modified: 30 May 2019 --> Added 24-hr slot
+                18 Oct 2026 --> Replace DataFrame.append (removed from pandas)
+                18 Oct 2026 --> Look up daily files in a date index
+                18 Oct 2026 --> Vectorized event end times
+                18 Oct 2026 --> Optional Parquet event catalog
+                18 Oct 2026 --> Read TSURF once per day for the region's box only
+                18 Oct 2026 --> Read the next day in the background
+                18 Oct 2026 --> Option to read from the extracted time series
+                18 Oct 2026 --> Incremental mode that revisits incomplete freezing windows
+                18 Oct 2026 --> Count frozen hours from cumulative sums (any window lengths)
+                18 Oct 2026 --> Option to count frozen hours hour by hour with a freezetracker
+                18 Oct 2026 --> Icing rules moved to RainOnSnow_Module (shared with the
+                    fused mode of stage 1)
+                18 Oct 2026 --> Option to read TSURF only for grid cells with events waiting on it
 Purpose: Given a precipitation event, identify whether it counts as an icing
 event and for how long the ice is likely to persist.
 '''
@@ -15,6 +28,7 @@ import numpy as np
 import pandas as pd
 from copy import deepcopy
 import MERRA_Module as md
+import RainOnSnow_Module as ros
 
 '''********************
 Define Variables
@@ -22,8 +36,11 @@ Define Variables
 ra = "MERRA2"
 
 ncpath = "/Volumes/Miranda/"+ra+"_nc/Hourly/MERRA-LND"
-csvpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Alaska/PrecipIdentified"
-outpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Alaska/ROSIdentified_V2"
+region = "Alaska" # Name of the region (see regiondefs in RainOnSnow_Module)
+csvpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/PrecipIdentified"
+outpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/ROSIdentified_V2"
+regpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Regions"
+tspath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/TimeSeries" # from 0_ExtractRegionTimeSeries.py
 
 ### Physical Variables ###
 pconversion = 3600 # to convert precip to a value of mm
@@ -32,6 +49,10 @@ rthresh = 6.096/24 # in mm/hr (equiva. to a rate of 0.01 in/day)
 pthresh = 0.254 # total mm (equiv. to 0.01 in/event)
 tthresh = -10 # minimum temperature (deg C) for which rain is allowed to be detected
 sthresh = 0.0254 # minimum snow depth in meters
+frzwindows = [24,240,720,2160] # Length (hours) of each window after an event in which
+## frozen hours are counted (named by days, e.g., 240 hours --> Frz10)
+hourly = 0 # 1 = count frozen hours hour by hour as the data are read (freezetracker);
+## 0 = count them from cumulative sums when each month is written
 
 ### Time Variables ###
 starttime = [2000,1,1,0,0,0]
@@ -42,6 +63,15 @@ hrs = 1 # Temporal Resolution in hours
 hthresh = 2 # Number of hours w/out measurable precip needed to mark separate
 # precip events (also used as gap for re-freezing check)
 
+catalog = 1 # 1 = also write events to a Parquet catalog (one file per month)
+lookahead = 1 # Number of days of data to read in the background ahead of the current day
+fromcache = 0 # 1 = read the time series in tspath instead of the daily netCDF files
+sparse = 1 # 1 = read TSURF only for the grid cells that have an event whose freezing
+## windows overlap the day (and skip days with none); 0 = read every grid cell every day
+incremental = 0 # 1 = ignore starttime and endtime, and instead redo every month in the
+## catalog whose freezing windows were not complete, then continue through the
+## last month that stage 1 has finished (requires catalog = 1)
+
 months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
 mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
 days = ["01","02","03","04","05","06","07","08","09","10","11","12","13",\
@@ -55,10 +85,91 @@ hours = ["0000","0100","0200","0300","0400","0500","0600","0700","0800",\
 Main Analysis
 *******************************************'''
 ########## READ IN INITAL DATA ############
-files1 = os.listdir(ncpath)
-files1 = [f for f in files1 if f.startswith(ra)]
+if fromcache == 1: # Days covered by the extracted time series
+    reader = ros.seriescache(tspath)
+    ind1 = reader.days
+else:
+    ind1 = ros.indexFiles(ncpath,ra)
+
+catpath = outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)
+
+if incremental == 1:
+    # The last run ended at the start of the month after the last one in the
+    ## catalog; events that ended within max(frzwindows) of that time had incomplete
+    ## freezing windows, so start again from the month they ended in
+    yms = ros.catalogMonths(catpath)
+    if len(yms) == 0:
+        raise FileNotFoundError("No months in " + catpath + " to continue from")
+    Y0, M0 = int(yms[-1][:4]), int(yms[-1][4:])
+    tE = ros.hoursSince(reftime,Y0+M0//12,M0%12+1,1)
+    starttime = [Y0,M0,1,0,0,0]
+    while ros.hoursSince(reftime,starttime[0],starttime[1],1) > tE - max(frzwindows) and \
+            "%04d%02d" % tuple(starttime[:2]) > yms[0]:
+        starttime = [starttime[0]-(starttime[1] == 1),(starttime[1]-2)%12+1,1,0,0,0]
+    
+    # Continue through the last month with every day available and a file
+    ## from stage 1
+    endtime = ros.completeThrough([ind1],starttime)
+    time1 = deepcopy(starttime)
+    while time1 != endtime and os.path.exists(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+str(time1[0])+mons[time1[1]-1]+".csv"):
+        time1 = [time1[0]+time1[1]//12,time1[1]%12+1,1,0,0,0]
+    endtime = time1
+    print("Running " + str(starttime[0]) + mons[starttime[1]-1] + " to " + str(endtime[0]) + mons[endtime[1]-1])
+
+miss = ros.missingDays(ind1,starttime,endtime)
+if len(miss) > 0 and fromcache == 1:
+    raise FileNotFoundError("No data in " + tspath + " for " + ", ".join(miss))
+elif len(miss) > 0:
+    raise FileNotFoundError("No reanalysis file for " + ", ".join(miss))
+
+if fromcache == 1:
+    # The region's grid cells are those of the time series (stage 1 events
+    ## only lie in these cells, so the grid only needs to extend to them)
+    rows, cols = reader.rows, reader.cols
+    shape = (int(np.max(rows))+1,int(np.max(cols))+1)
+
+else:
+    # Identify the region's grid cells (land only) so that only the box that holds
+    ## them is read from each file
+    ncf = nc.Dataset(ind1[list(ind1.keys())[0]])
+    reg = ros.loadRegion(region,ncf.variables['lat'][:],ncf.variables['lon'][:],\
+                         np.isfinite(ncf.variables['PRECTOTLAND'][0,:,:]),cache=regpath)
+    ncf.close()
+    rows, cols, shape = reg.rows, reg.cols, reg.shape
+
+    # Read each day in the background while the day before is processed
+    reader = ros.dailyreader([(ind1,['TSURF'])],rows,cols)
+
+# Position of each grid cell in the data read for the region
+cellidx = np.full(shape,-1)
+cellidx[rows,cols] = np.arange(len(rows))
+
+def pendingCells(tk):
+    '''Returns the grid cells with an event (loaded so far) whose freezing
+    windows overlap the day that starts at hour tk.
+    '''
+    live = (df['EndTime'] < tk+24) & (df['EndTime']+max(frzwindows) >= tk) if len(df) > 0 else []
+    return np.unique(cellidx[df['Y'][live],df['X'][live]]) if np.any(live) else np.array([],dtype=int)
+
+def dayCells():
+    '''Yields each day with the grid cells needed for it. Days are read ahead,
+    so a month that starts within lookahead days has not been loaded yet
+    (the main loop reads any grid cells that were missed).
+    '''
+    for key, tk in ros.dayKeys(starttime,endtime,reftime):
+        yield key, pendingCells(tk)
+
+if sparse == 1:
+    pf = ros.prefetcher(ros.cellreader(reader,24//hrs,['TSURF']),dayCells(),lookahead)
+else:
+    pf = ros.prefetcher(reader,[k for k, tk in ros.dayKeys(starttime,endtime)],lookahead)
+daydata = iter(pf)
 
 df = pd.DataFrame()
+frz = [] # Frozen surface (True/False) at each grid cell for each day still needed
+frzt0 = 24*md.daysBetweenDates(reftime,starttime) # Time of the first hour in frz
+tracker = ros.freezetracker(frzwindows) # Used instead of frz if hourly == 1
+nid = 0 # Number of events loaded so far
 
 # Start Time Loop
 time1 = deepcopy(starttime)
@@ -69,57 +180,56 @@ while time1 != endtime:
     Y, M, D = str(time1[0]), mons[time1[1]-1], days[time1[2]-1]
     
     # Load data for current day
-    fN = [fN for fN in files1 if Y+M+D in fN][0]
-    ncf = nc.Dataset(ncpath+"/"+fN)
+    key, data = next(daydata)
     
     # If the 1st day of the month, load new CSV file
     if time1[2] == 1:
         print("Starting " + Y + " " + M)
-        pdf = pd.read_csv(csvpath+"/PrecipEvents_Alaska_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv")
+        pdf = pd.read_csv(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+Y+M+".csv")
 
         ########## Identify Icing Events ############
         pdf['Rain'] = pdf['Precip'] - pdf['Snowfall']
-        pdf['Ice'] = 0
-        pdf.loc[(pdf['MaxT2m'] > tthresh) & (pdf['Rain'] > pthresh) & (pdf['StSnoDep'] > sthresh) & (pdf['EdSnoDep'] <= sthresh),'Ice'] = 1
-        pdf.loc[(pdf['MaxT2m'] > tthresh) & (pdf['Rain'] > pthresh) & (pdf['StSnoDep'] <= sthresh) & (pdf['MaxTSurf'] <= 0),'Ice'] = 2
-        pdf.loc[(pdf['MaxT2m'] > tthresh) & (pdf['Rain'] > pthresh) & (pdf['StSnoDep'] > sthresh) & (pdf['EdSnoDep'] > sthresh),'Ice'] = 3
+        pdf['Ice'] = ros.classifyIce(pdf,tthresh,pthresh,sthresh)
         
         ########## Identify Number of Frozen Days that Follow Icing ############
-        pdf['EndTime'] = [24*md.daysBetweenDates(reftime,(pdf['Year'][i],pdf['Month'][i],pdf['Day'][i],pdf['Hour'][i],0,0)) for i in range(len(pdf))] + pdf['Length']
-        pdf['Frz01'] = 0
-        pdf['Frz10'] = 0
-        pdf['Frz30'] = 0
-        pdf['Frz90'] = 0
+        pdf['EndTime'] = ros.hoursSince(reftime,pdf['Year'],pdf['Month'],pdf['Day'],pdf['Hour']) + pdf['Length']
+        
+        # Events in the first file that ended in the month before were written
+        ## with that month by the last run, so an incremental run skips them
+        if incremental == 1 and time1 == starttime and Y+M > yms[0]:
+            pdf = pdf[pdf['EndTime'] >= t].reset_index(drop=True)
+        
+        pdf['FrzStart'] = t # Frozen hours are counted from the time the file is loaded
+        pdf['FrzID'] = np.arange(nid,nid+len(pdf))
+        nid = nid + len(pdf)
+        if hourly == 1:
+            tracker.add(pdf['FrzID'],cellidx[pdf['Y'],pdf['X']],pdf['EndTime'])
         
         ########## Append Input PDF to Main DF #########
-        df = df.append(pdf, ignore_index=1)
+        df = pd.concat([df,pdf], ignore_index=1)
         tO.append( 24*md.daysBetweenDates(reftime,md.timeAdd(time1,[0,1,0,0,0,0])) )
     
-    # Measure Total Number of Frozen Hours
-    for h in range(24): # For each hour of the day...
-        # Extract temperature
-        tsurf = ncf['TSURF'][h,:,:] <= 273.15 # units are Kelvin
-
-        # Identify Relevant Events Based on Time
-        indices01 = df.loc[((t - df['EndTime']) <= 24) & ((t - df['EndTime']) > 0)].index
-        indices10 = df.loc[((t - df['EndTime']) <= 240) & ((t - df['EndTime']) > 0)].index
-        indices30 = df.loc[((t - df['EndTime']) <= 720) & ((t - df['EndTime']) > 0)].index
-        indices90 = df.loc[((t - df['EndTime']) <= 2160) & ((t - df['EndTime']) > 0)].index
-
-        # Add Info For Fixed-Time Examinations        
-        df.loc[indices01,'Frz01'] += tsurf[df.loc[indices01,'Y'],df.loc[indices01,'X']]
-        df.loc[indices10,'Frz10'] += tsurf[df.loc[indices10,'Y'],df.loc[indices10,'X']]
-        df.loc[indices30,'Frz30'] += tsurf[df.loc[indices30,'Y'],df.loc[indices30,'X']]
-        df.loc[indices90,'Frz90'] += tsurf[df.loc[indices90,'Y'],df.loc[indices90,'X']]
-        
-        t =  t + 1
+    # Read any grid cells that were needed but not known when the day was read
+    if sparse == 1:
+        key, cells = key
+        missed = np.setdiff1d(pendingCells(t),cells)
+        if len(missed) > 0:
+            data['TSURF'][:,missed] = pf.read((key,missed))['TSURF'][:,missed]
+    
+    # Record where the surface is frozen for each hour of the day
+    tsurfday = data['TSURF'] <= 273.15 # units are Kelvin
+    if hourly == 1:
+        for h in range(tsurfday.shape[0]): # For each hour of the day...
+            tracker.update(t+h,tsurfday[h])
+    else:
+        frz.append(tsurfday)
+    t = t + tsurfday.shape[0]
     
     # Advance day step
-    ncf.close()
     time1 = md.timeAdd(time1,daystep)
 
     # If it has been long enough, write to file by month...
-    if t-tO[0] >= 2160:
+    if t-tO[0] >= max(frzwindows):
         timeO = md.timeAdd(reftime,[0,0,0,tO[0]-1,0,0])
         
         YO = str(timeO[0])
@@ -129,16 +239,30 @@ while time1 != endtime:
         odf = df[df['EndTime'] < tO[0]]
         df = df[df['EndTime'] >= tO[0]]
         
+        # Count frozen hours for each window (as a %)
+        if hourly == 1:
+            ids, cnts = tracker.pop(tO[0])
+            pos = pd.Series(np.arange(len(ids)),index=ids)[odf['FrzID']].values
+            counts = {w:cnts[pos,k] for k, w in enumerate(frzwindows)}
+        else:
+            counts = ros.countFrozen(frz,frzt0,cellidx[odf['Y'],odf['X']],\
+                        odf['EndTime'],odf['FrzStart'],frzwindows,t)
+        odf = odf.drop(columns=['FrzStart','FrzID'])
+        
         tO = tO[1:] # removes month from consideration
+        for w in frzwindows:
+            odf['Frz'+str(w//24).zfill(2)] = counts[w]/float(w)
         
-        # Unit Conversions (to a %)
-        odf['Frz01'] = odf['Frz01']/24.
-        odf['Frz10'] = odf['Frz10']/240.
-        odf['Frz30'] = odf['Frz30']/720.
-        odf['Frz90'] = odf['Frz90']/2160.
+        # Remove days that no remaining event needs
+        tkeep = df['FrzStart'].min() if len(df) > 0 else t
+        while len(frz) > 0 and frzt0 + frz[0].shape[0] <= tkeep:
+            frzt0 = frzt0 + frz[0].shape[0]
+            frz = frz[1:]
         
         # Write to file
-        odf.to_csv(csvpath+"/PrecipEvents_Alaska_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+YO+MO+"m.csv",index=0)
+        odf.to_csv(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+YO+MO+"m.csv",index=0)
+        if catalog == 1:
+            ros.writeCatalog(odf,catpath,YO+MO)
         
 
 # Write Preliminary Files for all remaining Months
@@ -152,11 +276,19 @@ for i in range(len(tO)):
     odf = df[df['EndTime'] < tO[i]]
     df = df[df['EndTime'] >= tO[i]]
     
-    # Unit Conversions (to a %)
+    # Count frozen hours for each window so far (as a %)
     odf.index = range(len(odf))
-    odf['Frz01'] = [odf['Frz01'][j]/np.min([t-odf['EndTime'][j],24.]) for j in range(len(odf))]
-    odf['Frz10'] = [odf['Frz10'][j]/np.min([t-odf['EndTime'][j],240.]) for j in range(len(odf))]
-    odf['Frz30'] = [odf['Frz30'][j]/np.min([t-odf['EndTime'][j],720.]) for j in range(len(odf))]
-    odf['Frz90'] = [odf['Frz90'][j]/np.min([t-odf['EndTime'][j],2160.]) for j in range(len(odf))]
+    if hourly == 1:
+        ids, cnts = tracker.pop(tO[i])
+        pos = pd.Series(np.arange(len(ids)),index=ids)[odf['FrzID']].values
+        counts = {w:cnts[pos,k] for k, w in enumerate(frzwindows)}
+    else:
+        counts = ros.countFrozen(frz,frzt0,cellidx[odf['Y'],odf['X']],\
+                    odf['EndTime'],odf['FrzStart'],frzwindows,t)
+    odf = odf.drop(columns=['FrzStart','FrzID'])
+    for w in frzwindows:
+        odf['Frz'+str(w//24).zfill(2)] = counts[w]/np.minimum(t-odf['EndTime'],float(w))
     
-    odf.to_csv(outpath+"/PrecipEvents_Alaska_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+YO+MO+".csv",index=0)
\ No newline at end of file
+    odf.to_csv(outpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+YO+MO+".csv",index=0)
+    if catalog == 1:
+        ros.writeCatalog(odf,catpath,YO+MO)
\ No newline at end of file
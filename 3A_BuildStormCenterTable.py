@@ -0,0 +1,63 @@
+'''
+Author: Alex Crawford
+Date Created: 18 Oct 2026
+Date Modified: 18 Oct 2026
+Purpose: Flatten the monthly system tracks of the cyclone tracking into one
+table of storm centers per year (sid, time, location, type, central pressure,
+lifespan, and the month the track ends), sorted by time. Stages 3 and 7D can
+then look up the storms that exist at a given time (or the centers of a given
+storm) without unpickling and scanning every track.
+
+Default units: days since reftime for time (as in the cyclone tracking)
+'''
+
+'''********************
+Import Modules
+********************'''
+import os
+import numpy as np
+import pandas as pd
+from osgeo import gdalnumeric
+import RainOnSnow_Module as ros
+
+'''********************
+Define Variables
+********************'''
+ctpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/SystemTracks"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters"
+suppath = "/Volumes/Ferdinand/Projections"
+latN = "EASE2_N0_100km_Lats.tif"
+lonN = "EASE2_N0_100km_Lons.tif"
+
+### Time Variables ###
+years = range(1980,2020) # Years of track end (tracks are filed by the month they end, so
+## include the year after the last one of stage 3)
+reftime = [1900,1,1,0,0,0]
+
+'''*******************************************
+Main Analysis
+*******************************************'''
+os.makedirs(centerpath,exist_ok=True)
+
+# Load lats and lons of the tracking grid
+elats = gdalnumeric.LoadFile(suppath+"/"+latN)
+elons = gdalnumeric.LoadFile(suppath+"/"+lonN)
+
+cyc = ros.cyclonedata(ctpath,maxtracks=1)
+
+for Y in years:
+    # Flatten each month of tracks that has been produced so far
+    cdfs = []
+    for M in range(1,13):
+        if os.path.exists(ctpath+"/"+str(Y)+"/systemtracks"+str(Y)+str(M).zfill(2)+".pkl"):
+            cdfs.append(ros.centerTable(cyc.tracks(Y,M),elats,elons,reftime))
+    if len(cdfs) == 0:
+        continue
+
+    # Sort by time (keeping the order of the monthly files for ties) and write
+    cdf = pd.concat(cdfs,ignore_index=True)
+    cdf = cdf.iloc[np.argsort(cdf['time'].values,kind='stable')]
+    cdf.to_parquet(ros.centerFile(centerpath,Y)+".tmp",index=False)
+    os.replace(ros.centerFile(centerpath,Y)+".tmp",ros.centerFile(centerpath,Y))
+
+    print("Completed " + str(Y) + " (" + str(len(cdf)) + " centers)")
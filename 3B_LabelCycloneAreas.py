@@ -0,0 +1,74 @@
+'''
+Author: Alex Crawford
+Date Created: 18 Oct 2026
+Date Modified: 18 Oct 2026
+Purpose: Label the cyclone areas of every cyclone field once and store them
+as one (time, y, x) stack per year on the tracking grid, along with a table
+of the storms whose centers lie in each labelled area (label to sid). Stage 3
+then reads a single time step of a memory-mapped stack (see labelpath in
+ros.cyclonedata) instead of unpickling and labelling a cyclone field for each
+event.
+
+Requires the storm center tables of 3A_BuildStormCenterTable.py.
+'''
+
+'''********************
+Import Modules
+********************'''
+import os
+import numpy as np
+import pandas as pd
+import MERRA_Module as md
+import RainOnSnow_Module as ros
+
+'''********************
+Define Variables
+********************'''
+cfpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneFields"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters" # from 3A_BuildStormCenterTable.py
+labelpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneLabels"
+
+### Time Variables ###
+years = range(1980,2019)
+reftime = [1900,1,1,0,0,0]
+t = 3 # Temporal Resolution in hours of the cyclone tracking
+
+months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+
+'''*******************************************
+Main Analysis
+*******************************************'''
+os.makedirs(labelpath,exist_ok=True)
+
+# Storm centers of the years (and the next one, since tracks are filed by
+## the month they end)
+ctab = ros.centertable(centerpath,range(years[0],years[-1]+2))
+
+for Y in years:
+    # Label each cyclone field of the year, keeping each one in the smallest
+    ## type that holds its labels until the year is written
+    times, labels = [], []
+
+    time = [Y,1,1,0,0,0]
+    while time[0] == Y:
+        f = cfpath+"/"+str(Y)+"/"+months[time[1]-1]+"/CF"+str(Y)+str(time[1]).zfill(2)+str(time[2]).zfill(2)+"_"+str(time[3]).zfill(2)+"00.pkl"
+        if os.path.exists(f):
+            label, n = ros.labelField(pd.read_pickle(f).fieldAreas)
+            times.append(ros.labelTime(*time[:4]))
+            labels.append(label.astype(np.min_scalar_type(n)))
+
+        time = md.timeAdd(time,[0,0,0,t,0,0])
+
+    if len(labels) == 0:
+        continue
+
+    # Write the stack, then match each labelled area to its storms
+    ros.writeLabels(labelpath,Y,times,labels)
+
+    ldf = ros.labelTable(times,labels,ctab,reftime)
+    fsids = ros.labelFiles(labelpath,Y)[2]
+    ldf.to_parquet(fsids+".tmp",index=False)
+    os.replace(fsids+".tmp",fsids)
+
+    print("Completed " + str(Y) + " (" + str(len(times)) + " time steps, " + str(len(ldf)) + " storm centers in cyclone areas)")
+    del labels
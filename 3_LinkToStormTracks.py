@@ -1,7 +1,11 @@
 '''
 Author: Alex Crawford
 Date Created: 15 Mar 2019
-Date Modified: ???
+Date Modified: 18 Oct 2026 --> Vectorized median times of events
+                18 Oct 2026 --> Keep recently used cyclone tracks and fields in memory
+                18 Oct 2026 --> Option to look up storm centers in a time-sorted table
+                18 Oct 2026 --> Option to read labelled cyclone areas from yearly stacks
+                18 Oct 2026 --> Vectorized distances to storm centers
 Purpose: Identify which storms from a Lagrangian cyclone algorithm are 
 associated with a particular class of precipitation event at a given location.
 '''
@@ -13,10 +17,10 @@ import netCDF4 as nc
 import os
 import numpy as np
 import pandas as pd
-import scipy
 from copy import deepcopy
 from osgeo import gdal, gdalnumeric
 import MERRA_Module as md
+import RainOnSnow_Module as ros
 
 '''********************
 Define Variables
@@ -29,6 +33,8 @@ csvpath2 = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByPoint_withStorms"
 
 cfpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneFields"
 ctpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/SystemTracks"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters" # from 3A_BuildStormCenterTable.py
+labelpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneLabels" # from 3B_LabelCycloneAreas.py
 suppath = "/Volumes/Ferdinand/Projections"
 latN = "EASE2_N0_100km_Lats.tif"
 lonN = "EASE2_N0_100km_Lons.tif"
@@ -59,6 +65,9 @@ t = 3 # Temporal Resolution in hours of the cyclone tracking
 hthresh = 2 # Number of hours w/out measurable precip needed to mark separate
 # precip events
 
+centers = 1 # 1 = look up storm centers in the tables in centerpath; 0 = search the monthly system tracks
+labels = 1 # 1 = read labelled cyclone areas from labelpath; 0 = label the cyclone fields as needed
+
 months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
 mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
 days = ["01","02","03","04","05","06","07","08","09","10","11","12","13",\
@@ -105,19 +114,24 @@ pdf['CMonth'] = 0
 pdf['CYear'] = 0
 pdf['SID'] = 0
 
+# Find the tracking hour that most closely follows to the median time of 
+## each precip event
+medhrs = np.array(pdf['EndTime']-(pdf['Length']/2.))
+resid = medhrs%t
+medhrs = np.where(resid < t/2., medhrs - resid, medhrs + (t-resid))
+medY, medM, medD, medH = ros.hoursToDates(medhrs,reftime)
+
+# Cyclone tracks and fields are shared by events close in time
+cyc = ros.cyclonedata(ctpath,cfpath,labelpath=(labelpath if labels == 1 else None))
+if centers == 1:
+    ctab = ros.centertable(centerpath,range(starttime[0],endtime[0]+2))
+
 for i in range(0,len(pdf)):
     link = 0
 
-    # Find the tracking hour that most closely follows to the median time of 
-    ## the precip event
-    MedHrs = pdf['EndTime'][i]-(pdf['Length'][i]/2.)
-    resid = MedHrs%t
-    if resid < t/2.:
-        MedHrs = MedHrs - (resid)
-    else:
-        MedHrs = MedHrs + (t-resid)
-    MedTime = md.timeAdd(reftime,(0,0,0,MedHrs,0,0))
-    MedTime1 = md.timeAdd(MedTime,[0,1,0,0,0,0])
+    MedHrs = medhrs[i]
+    MedTime = [medY[i],medM[i],medD[i],medH[i],0,0]
+    MedTime1 = [medY[i]+medM[i]//12,medM[i]%12+1,1,0,0,0] # following month
     
     print(MedTime)
     
@@ -125,36 +139,52 @@ for i in range(0,len(pdf)):
     m = MedTime[1]
     d = MedTime[2]
     h = int(MedTime[3])
-    DATE = str(yr)+mons[m-1]+days[d-1]+"_"+hours[h]
-    
-    # Load Cyclone Field & Tracks for that time
-    ct0 = pd.read_pickle(ctpath+"/"+str(yr)+"/systemtracks"+str(yr)+mons[m-1]+".pkl")
-    ct1 = pd.read_pickle(ctpath+"/"+str(MedTime1[0])+"/systemtracks"+str(MedTime1[0])+mons[MedTime1[1]-1]+".pkl")
-    cf = pd.read_pickle(cfpath+"/"+str(yr)+"/"+months[m-1]+"/CF"+DATE+".pkl")
-    cAreas, nC = scipy.ndimage.measurements.label(cf.fieldAreas)
     
-    # Identify which storms existed at this time
-    cta = [ct for ct in ct0 if (MedHrs/24. in list(ct.data.time))] + [ct for ct in ct1 if (MedHrs/24. in list(ct.data.time))]
+    # Load Cyclone Field for that time (from memory if recently used)
+    cAreas, nC = cyc.areas(yr,m,d,h)
     
-    # Limit to type 1 centers (not ones that have just died or split)
-    cttyp = np.array([int(ct.data['type'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
-    cta = [cta[j] for j in range(len(cta)) if cttyp[j] != 0]
+    if centers == 1:
+        # Identify which storms existed at this time from the storm center
+        ## table (only tracks that end this month or next, like the files below),
+        ## limited to type 1 centers (not ones that have just died or split)
+        ctc = ctab.at(MedHrs/24.)
+        ctk = (ctc['type'] != 0) & (((ctc['EndYear'] == yr) & (ctc['EndMonth'] == m)) | \
+                                    ((ctc['EndYear'] == MedTime1[0]) & (ctc['EndMonth'] == MedTime1[1])))
+        ctsid, ctY, ctM = ctc['sid'][ctk], ctc['EndYear'][ctk], ctc['EndMonth'][ctk]
+        ctaxs, ctays, ctp = ctc['x'][ctk], ctc['y'][ctk], ctc['p_cent'][ctk]
+        ctlsp = ctc['lifespan'][ctk] >= 1
     
-    ctaxs = [int(ct.data['x'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
-    ctays = [int(ct.data['y'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
-    ctp = np.array([float(ct.data['p_cent'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
-    ctlsp = np.array([ct.lifespan() >= 1 for ct in cta])
+    else:
+        # Load Tracks for that time (from memory if recently used)
+        ct0 = cyc.tracks(yr,m)
+        ct1 = cyc.tracks(MedTime1[0],MedTime1[1])
+        
+        # Identify which storms existed at this time
+        cta = [ct for ct in ct0 if (MedHrs/24. in list(ct.data.time))] + [ct for ct in ct1 if (MedHrs/24. in list(ct.data.time))]
+        
+        # Limit to type 1 centers (not ones that have just died or split)
+        cttyp = np.array([int(ct.data['type'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+        cta = [cta[j] for j in range(len(cta)) if cttyp[j] != 0]
+        
+        ctaxs = [int(ct.data['x'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
+        ctays = [int(ct.data['y'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
+        ctp = np.array([float(ct.data['p_cent'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+        ctlsp = np.array([ct.lifespan() >= 1 for ct in cta])
+        
+        # Identifier and month of the end of each storm
+        ctsid = [ct.sid for ct in cta]
+        ctbtimes = [md.timeAdd(reftime,[0,0,list(ct.data.time)[-1],0,0,0]) for ct in cta]
+        ctY, ctM = [ctbt[0] for ctbt in ctbtimes], [ctbt[1] for ctbt in ctbtimes]
 
     # Option 1: Location lies within a system's area:
     if cAreas[eloc[0][0],eloc[1][0]] > 0:
-        ctareas = [cAreas[ctays[j],ctaxs[j]] for j in range(len(cta))]
+        ctareas = [cAreas[ctays[j],ctaxs[j]] for j in range(len(ctsid))]
         
         try:
-            ctb = cta[int(np.where(cAreas[eloc[0][0],eloc[1][0]] == ctareas)[0])]
-            ctbtime = md.timeAdd(reftime,[0,0,list(ctb.data.time)[-1],0,0,0])
-            pdf.loc[i,'SID'] = ctb.sid
-            pdf.loc[i,'CMonth'] = ctbtime[1]
-            pdf.loc[i,'CYear'] = ctbtime[0]
+            jb = int(np.where(cAreas[eloc[0][0],eloc[1][0]] == ctareas)[0])
+            pdf.loc[i,'SID'] = ctsid[jb]
+            pdf.loc[i,'CMonth'] = ctM[jb]
+            pdf.loc[i,'CYear'] = ctY[jb]
             
             link = 1
         
@@ -165,16 +195,15 @@ for i in range(0,len(pdf)):
     ## Only comes into play if there isn't a more direct area overlap.
     if link == 0:
         # Calculate distance to each system center
-        dista = np.array([md.haversine(y,elats[ctays[j],ctaxs[j]],x,elons[ctays[j],ctaxs[j]]) < dthresh for j in range(len(cta))])
+        dista = ros.haversine(y,elats[ctays,ctaxs],x,elons[ctays,ctaxs]) < dthresh
         
         # If there's only 1 possible storm
         if sum(dista) == 1:
             # Record it's infor in the main data frame
-            ctb = cta[np.where(dista == 1)[0][0]]
-            ctbtime = md.timeAdd(reftime,[0,0,list(ctb.data.time)[-1],0,0,0])
-            pdf.loc[i,'SID'] = ctb.sid
-            pdf.loc[i,'CMonth'] = ctbtime[1]
-            pdf.loc[i,'CYear'] = ctbtime[0]
+            jb = np.where(dista == 1)[0][0]
+            pdf.loc[i,'SID'] = ctsid[jb]
+            pdf.loc[i,'CMonth'] = ctM[jb]
+            pdf.loc[i,'CYear'] = ctY[jb]
         
         # If there is more than one possible storm:
         elif sum(dista) > 0:
@@ -182,19 +211,18 @@ for i in range(0,len(pdf)):
             if sum(dista*ctlsp) > 0:
                 # Then choose the system center with the lowest pressure
                 minp = np.min(ctp[np.where(dista*ctlsp == 1)[0][0]])
-                ctb = cta[np.where((ctp == minp) & (dista*ctlsp == 1))[0][0]]
+                jb = np.where((ctp == minp) & (dista*ctlsp == 1))[0][0]
             
             # If all are shorter than 24-hr
             else:
                 # Still select the center with the lowest pressure
                 minp = np.min(ctp[np.where(dista == 1)[0][0]])
-                ctb = cta[np.where((ctp == minp) & (dista == 1))[0][0]]
+                jb = np.where((ctp == minp) & (dista == 1))[0][0]
             
             # Record storm info
-            ctbtime = md.timeAdd(reftime,[0,0,list(ctb.data.time)[-1],0,0,0])
-            pdf.loc[i,'SID'] = ctb.sid
-            pdf.loc[i,'CMonth'] = ctbtime[1]
-            pdf.loc[i,'CYear'] = ctbtime[0]                
+            pdf.loc[i,'SID'] = ctsid[jb]
+            pdf.loc[i,'CMonth'] = ctM[jb]
+            pdf.loc[i,'CYear'] = ctY[jb]
         
         # If there are no possible storms:
         else:
@@ -204,3 +232,4 @@ for i in range(0,len(pdf)):
             pdf.loc[i,'CYear'] = np.nan 
 
 pdf.to_csv(csvpath2+"/"+name+"_"+SDAY+"_"+EDAY+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_X"+str(col)+"_Y"+str(row)+".csv",index=0)
+print(cyc.stats())
@@ -0,0 +1,201 @@
+'''
+Author: Alex Crawford
+Date Created: 18 Oct 2026
+Date Modified: 18 Oct 2026
+Purpose: Identify which storms from a Lagrangian cyclone algorithm are
+associated with each precipitation event in the grid-based event catalog.
+Same linkage as 3_LinkToStormTracks_FromGrid_V2A.py, but for every grid cell
+at once instead of one station per run: events are grouped by the tracking
+timestep closest to their median time, so that the storms, cyclone areas, and
+distances of each timestep are found once for all cells with events then.
+The output is a catalog of the events with SID, CMonth, and CYear added.
+'''
+
+'''********************
+Import Modules
+********************'''
+import netCDF4 as nc
+import os
+import numpy as np
+import pandas as pd
+from copy import deepcopy
+from osgeo import gdalnumeric
+import MERRA_Module as md
+import RainOnSnow_Module as ros
+
+'''********************
+Define Variables
+********************'''
+ra = "MERRA2"
+region = "Alaska"
+V = "V2"
+
+ncpath = "/Volumes/Miranda/"+ra+"_nc/Hourly/MERRA-LND"
+csvpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/"+region+"/ROSIdentified_"+V
+linkpath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid_withStorms/"+region+"/"+V+"A"
+
+cfpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneFields"
+ctpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/SystemTracks"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters" # from 3A_BuildStormCenterTable.py
+labelpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneLabels" # from 3B_LabelCycloneAreas.py
+suppath = "/Volumes/Ferdinand/Projections"
+latN = "EASE2_N0_100km_Lats.tif"
+lonN = "EASE2_N0_100km_Lons.tif"
+
+### Physical Variables ###
+rthresh = 6.096/24 # in mm/hr (equiva. to a rate of 0.01 in/day)
+pthresh = 0.254 # total mm (equiv. to 0.01 in/event)
+dthresh = 1200000 # max distance between a point and it's assoc. sys center
+
+### Time Variables ###
+starttime = [1980,1,1,0,0,0]
+endtime = [2019,1,1,0,0,0]
+reftime = [1900,1,1,0,0,0]
+monthstep = [0,1,0,0,0,0]
+hrs = 1 # Temporal Resolution in hours of the ROS
+t = 3 # Temporal Resolution in hours of the cyclone tracking
+hthresh = 2 # Number of hours w/out measurable precip needed to mark separate
+# precip events
+
+centers = 1 # 1 = look up storm centers in the tables in centerpath; 0 = search the monthly system tracks
+labels = 1 # 1 = read labelled cyclone areas from labelpath; 0 = label the cyclone fields as needed
+
+months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
+
+'''*******************************************
+Main Analysis
+*******************************************'''
+print("Load Data")
+files1 = os.listdir(ncpath)
+files1 = [f for f in files1 if f.startswith(ra)]
+
+# Load latitude and longitude arrays from a sample file
+ncf = nc.Dataset(ncpath+"/"+files1[0])
+lats = ncf.variables['lat'][:]
+lons = ncf.variables['lon'][:]
+ncf.close()
+
+# Load lats and lons of the cyclone tracking grid
+elats = gdalnumeric.LoadFile(suppath+"/"+latN)
+elons = gdalnumeric.LoadFile(suppath+"/"+lonN)
+
+# Location of each grid cell in the cyclone tracking grid (found the first
+## time the cell has an event)
+elocs = {}
+
+# Cyclone tracks and fields are shared by events close in time
+cyc = ros.cyclonedata(ctpath,cfpath,labelpath=(labelpath if labels == 1 else None))
+if centers == 1:
+    ctab = ros.centertable(centerpath,range(starttime[0],endtime[0]+2))
+
+inpath = csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)
+outpath = linkpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)
+
+time = deepcopy(starttime)
+while time != endtime:
+    YM = str(time[0])+mons[time[1]-1]
+    time1 = md.timeAdd(time,monthstep)
+
+    # Load all precip events of the month
+    pdf = ros.readCatalog(inpath,time,time1).reset_index(drop=True)
+    pdf['SID'] = np.nan
+    pdf['CMonth'] = np.nan
+    pdf['CYear'] = np.nan
+
+    # Find the tracking hour that most closely follows to the median time of
+    ## each precip event
+    medhrs = np.array(pdf['EndTime']-(pdf['Length']/2.))
+    resid = medhrs%t
+    medhrs = np.where(resid < t/2., medhrs - resid, medhrs + (t-resid))
+
+    # Location of each event's grid cell in the tracking grid
+    cells = np.array(pdf['Y'],dtype=np.int64)*len(lons) + np.array(pdf['X'],dtype=np.int64)
+    for c in np.unique(cells):
+        if c not in elocs:
+            eloc = md.findNearest_latlong(elats,elons,lats[c//len(lons)],lons[c%len(lons)])
+            elocs[c] = (eloc[0][0],eloc[1][0])
+
+    sids, cmonths, cyears = np.array(pdf['SID']), np.array(pdf['CMonth']), np.array(pdf['CYear'])
+
+    # Group events by tracking timestep
+    tsteps, tinv = np.unique(medhrs,return_inverse=True)
+    for ti, MedHrs in enumerate(tsteps):
+        ei = np.where(tinv == ti)[0]
+
+        MedTime = [int(v) for v in ros.hoursToDates(MedHrs,reftime)] + [0,0]
+        MedTime1 = [MedTime[0]+MedTime[1]//12,MedTime[1]%12+1,1,0,0,0] # following month
+        yr, m, d, h = MedTime[:4]
+
+        # Load Cyclone Field for that time (from memory if recently used)
+        cAreas, nC = cyc.areas(yr,m,d,h)
+
+        if centers == 1:
+            # Identify which storms existed at this time from the storm center
+            ## table (only tracks that end this month or next, like the files below),
+            ## limited to type 1 centers (not ones that have just died or split)
+            ctc = ctab.at(MedHrs/24.)
+            ctk = (ctc['type'] != 0) & (((ctc['EndYear'] == yr) & (ctc['EndMonth'] == m)) | \
+                                        ((ctc['EndYear'] == MedTime1[0]) & (ctc['EndMonth'] == MedTime1[1])))
+            ctsid, ctY, ctM = ctc['sid'][ctk], ctc['EndYear'][ctk], ctc['EndMonth'][ctk]
+            ctaxs, ctays = ctc['x'][ctk], ctc['y'][ctk]
+
+        else:
+            # Load Tracks for that time (from memory if recently used)
+            ct0 = cyc.tracks(yr,m)
+            ct1 = cyc.tracks(MedTime1[0],MedTime1[1])
+
+            # Identify which storms existed at this time
+            cta = [ct for ct in ct0 if (MedHrs/24. in list(ct.data.time))] + [ct for ct in ct1 if (MedHrs/24. in list(ct.data.time))]
+
+            # Limit to type 1 centers (not ones that have just died or split)
+            cttyp = np.array([int(ct.data['type'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+            cta = [cta[j] for j in range(len(cta)) if cttyp[j] != 0]
+
+            ctaxs = np.array([int(ct.data['x'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta],dtype=np.int64)
+            ctays = np.array([int(ct.data['y'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta],dtype=np.int64)
+
+            # Identifier and month of the end of each storm
+            ctsid = np.array([ct.sid for ct in cta])
+            ctbtimes = [md.timeAdd(reftime,[0,0,list(ct.data.time)[-1],0,0,0]) for ct in cta]
+            ctY, ctM = np.array([ctbt[0] for ctbt in ctbtimes]), np.array([ctbt[1] for ctbt in ctbtimes])
+
+        # Each grid cell with events at this time is linked once
+        ucells, uinv = np.unique(cells[ei],return_inverse=True)
+        erows = np.array([elocs[c][0] for c in ucells],dtype=np.int64)
+        ecols = np.array([elocs[c][1] for c in ucells],dtype=np.int64)
+        jb = np.repeat(-1,len(ucells))
+
+        # Option 1: Location lies within a system's area (and only one of the
+        ## storm centers lies in that area)
+        careas = cAreas[erows,ecols]
+        ctareas = cAreas[ctays,ctaxs]
+        matches = (careas[:,np.newaxis] == ctareas[np.newaxis,:]) & (careas[:,np.newaxis] > 0)
+        link = np.sum(matches,axis=1) == 1
+        if np.any(link):
+            jb[link] = np.argmax(matches[link],axis=1)
+
+        # Option 2: Location lies within some distance of a cyclone system
+        ## Only comes into play if there isn't a more direct area overlap.
+        ## Index the system centers once, then find the closest one within
+        ## dthresh of every remaining cell at once
+        u = np.where(~link)[0]
+        cti = ros.centerindex(elats[ctays,ctaxs],elons[ctays,ctaxs])
+        jb[u] = cti.nearest(lats[ucells[u]//len(lons)],lons[ucells[u]%len(lons)],dthresh)
+
+        # Record storm info for every event (NANs if no good link exists)
+        jbe = jb[uinv]
+        sids[ei[jbe >= 0]] = ctsid[jbe[jbe >= 0]]
+        cmonths[ei[jbe >= 0]] = ctM[jbe[jbe >= 0]]
+        cyears[ei[jbe >= 0]] = ctY[jbe[jbe >= 0]]
+
+    pdf['SID'], pdf['CMonth'], pdf['CYear'] = sids, cmonths, cyears
+    ros.writeCatalog(pdf,outpath,YM)
+
+    print("Completed " + YM + " (" + str(len(pdf)) + " events, " + str(len(tsteps)) + " tracking times, " + \
+          str(int(np.sum(np.isfinite(sids)))) + " linked)")
+
+    # Advance to next time
+    time = time1
+
+print(cyc.stats())
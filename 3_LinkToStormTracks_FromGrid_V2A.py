@@ -2,6 +2,13 @@
 Author: Alex Crawford
 Date Created: 15 Mar 2019
 Date Modified: 3 Jun 2019 --> modified to work with a "grid-based" detection of precip events
+                18 Oct 2026 --> Concatenate monthly events once instead of appending
+                18 Oct 2026 --> Vectorized median times of events
+                18 Oct 2026 --> Read one grid cell from the Parquet event catalog
+                18 Oct 2026 --> Keep recently used cyclone tracks and fields in memory
+                18 Oct 2026 --> Option to look up storm centers in a time-sorted table
+                18 Oct 2026 --> Option to read labelled cyclone areas from yearly stacks
+                18 Oct 2026 --> Vectorized distances to storm centers
 Purpose: Identify which storms from a Lagrangian cyclone algorithm are 
 associated with a particular class of precipitation event at a given location.
 '''
@@ -13,10 +20,10 @@ import netCDF4 as nc
 import os
 import numpy as np
 import pandas as pd
-import scipy
 from copy import deepcopy
 from osgeo import gdal, gdalnumeric
 import MERRA_Module as md
+import RainOnSnow_Module as ros
 
 '''********************
 Define Variables
@@ -31,6 +38,8 @@ csvpath2 = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByPoint_withStorms/"+V+"
 
 cfpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneFields"
 ctpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/SystemTracks"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters" # from 3A_BuildStormCenterTable.py
+labelpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/CycloneLabels" # from 3B_LabelCycloneAreas.py
 suppath = "/Volumes/Ferdinand/Projections"
 latN = "EASE2_N0_100km_Lats.tif"
 lonN = "EASE2_N0_100km_Lons.tif"
@@ -65,6 +74,10 @@ t = 3 # Temporal Resolution in hours of the cyclone tracking
 hthresh = 2 # Number of hours w/out measurable precip needed to mark separate
 # precip events
 
+catalog = 1 # 1 = read events from the Parquet catalog; 0 = read the monthly csv files
+centers = 1 # 1 = look up storm centers in the tables in centerpath; 0 = search the monthly system tracks
+labels = 1 # 1 = read labelled cyclone areas from labelpath; 0 = label the cyclone fields as needed
+
 months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
 mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
 days = ["01","02","03","04","05","06","07","08","09","10","11","12","13",\
@@ -97,21 +110,30 @@ row = md.findNearest(lats,y)[1]
 col = md.findNearest(lons,x)[1]
 
 # Load precip events for the location of choice
-pdf = pd.DataFrame()
-
-time = deepcopy(starttime)
-while time != endtime:
-    # Open monthly PDF
-    tdf = pd.read_csv(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+str(time[0])+mons[time[1]-1]+".csv")
-
-    # Subset to the location of interest
-    ldf = tdf[(tdf["X"] == col) & (tdf["Y"] == row)]
+if catalog == 1:
+    # Read only the rows for the grid cell from the event catalog
+    pdf = ros.readCatalog(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh),\
+                          starttime,endtime,filters=[("X","==",col),("Y","==",row)])
+    pdf = pdf[sorted(pdf.columns)].reset_index(drop=True)
+
+else:
+    ldfs = []
+    
+    time = deepcopy(starttime)
+    while time != endtime:
+        # Open monthly PDF
+        tdf = pd.read_csv(csvpath+"/PrecipEvents_"+region+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_"+str(time[0])+mons[time[1]-1]+".csv")
     
-    # Append to main pdf
-    pdf = pdf.append(ldf, sort=True, ignore_index=True)
+        # Subset to the location of interest
+        ldf = tdf[(tdf["X"] == col) & (tdf["Y"] == row)]
+        
+        # Append to list
+        ldfs.append(ldf)
+        
+        # Advance to next time
+        time = md.timeAdd(time,monthstep)
     
-    # Advance to next time
-    time = md.timeAdd(time,monthstep)
+    pdf = pd.concat(ldfs, sort=True, ignore_index=True)
 
 ########## READ IN BASIC CYCLONE INFO ############
 # Load lats and lons
@@ -127,53 +149,73 @@ pdf['SID'] = 0
 SDAY = str(starttime[0]) + mons[starttime[1]-1] + days[starttime[2]-1]
 EDAY = str(endtime[0]) + mons[endtime[1]-1] + days[endtime[2]-1]
 
+# Find the tracking hour that most closely follows to the median time of 
+## each precip event
+medhrs = np.array(pdf['EndTime']-(pdf['Length']/2.))
+resid = medhrs%t
+medhrs = np.where(resid < t/2., medhrs - resid, medhrs + (t-resid))
+medY, medM, medD, medH = ros.hoursToDates(medhrs,reftime)
+
+# Cyclone tracks and fields are shared by events close in time
+cyc = ros.cyclonedata(ctpath,cfpath,labelpath=(labelpath if labels == 1 else None))
+if centers == 1:
+    ctab = ros.centertable(centerpath,range(starttime[0],endtime[0]+2))
+
 for i in range(0,len(pdf)):
     link = 0
 
-    # Find the tracking hour that most closely follows to the median time of 
-    ## the precip event
-    MedHrs = pdf['EndTime'][i]-(pdf['Length'][i]/2.)
-    resid = MedHrs%t
-    if resid < t/2.:
-        MedHrs = MedHrs - (resid)
-    else:
-        MedHrs = MedHrs + (t-resid)
-    MedTime = md.timeAdd(reftime,(0,0,0,MedHrs,0,0))
-    MedTime1 = md.timeAdd(MedTime,[0,1,0,0,0,0])
+    MedHrs = medhrs[i]
+    MedTime = [medY[i],medM[i],medD[i],medH[i],0,0]
+    MedTime1 = [medY[i]+medM[i]//12,medM[i]%12+1,1,0,0,0] # following month
         
     yr = MedTime[0]
     m = MedTime[1]
     d = MedTime[2]
     h = int(MedTime[3])
-    DATE = str(yr)+mons[m-1]+days[d-1]+"_"+hours[h]
-    
-    # Load Cyclone Field & Tracks for that time
-    ct0 = pd.read_pickle(ctpath+"/"+str(yr)+"/systemtracks"+str(yr)+mons[m-1]+".pkl")
-    ct1 = pd.read_pickle(ctpath+"/"+str(MedTime1[0])+"/systemtracks"+str(MedTime1[0])+mons[MedTime1[1]-1]+".pkl")
-    cf = pd.read_pickle(cfpath+"/"+str(yr)+"/"+months[m-1]+"/CF"+DATE+".pkl")
-    cAreas, nC = scipy.ndimage.measurements.label(cf.fieldAreas)
     
-    # Identify which storms existed at this time
-    cta = [ct for ct in ct0 if (MedHrs/24. in list(ct.data.time))] + [ct for ct in ct1 if (MedHrs/24. in list(ct.data.time))]
+    # Load Cyclone Field for that time (from memory if recently used)
+    cAreas, nC = cyc.areas(yr,m,d,h)
     
-    # Limit to type 1 centers (not ones that have just died or split)
-    cttyp = np.array([int(ct.data['type'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
-    cta = [cta[j] for j in range(len(cta)) if cttyp[j] != 0]
+    if centers == 1:
+        # Identify which storms existed at this time from the storm center
+        ## table (only tracks that end this month or next, like the files below),
+        ## limited to type 1 centers (not ones that have just died or split)
+        ctc = ctab.at(MedHrs/24.)
+        ctk = (ctc['type'] != 0) & (((ctc['EndYear'] == yr) & (ctc['EndMonth'] == m)) | \
+                                    ((ctc['EndYear'] == MedTime1[0]) & (ctc['EndMonth'] == MedTime1[1])))
+        ctsid, ctY, ctM = ctc['sid'][ctk], ctc['EndYear'][ctk], ctc['EndMonth'][ctk]
+        ctaxs, ctays, ctp = ctc['x'][ctk], ctc['y'][ctk], ctc['p_cent'][ctk]
     
-    ctaxs = [int(ct.data['x'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
-    ctays = [int(ct.data['y'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
-    ctp = np.array([float(ct.data['p_cent'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+    else:
+        # Load Tracks for that time (from memory if recently used)
+        ct0 = cyc.tracks(yr,m)
+        ct1 = cyc.tracks(MedTime1[0],MedTime1[1])
+        
+        # Identify which storms existed at this time
+        cta = [ct for ct in ct0 if (MedHrs/24. in list(ct.data.time))] + [ct for ct in ct1 if (MedHrs/24. in list(ct.data.time))]
+        
+        # Limit to type 1 centers (not ones that have just died or split)
+        cttyp = np.array([int(ct.data['type'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+        cta = [cta[j] for j in range(len(cta)) if cttyp[j] != 0]
+        
+        ctaxs = [int(ct.data['x'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
+        ctays = [int(ct.data['y'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta]
+        ctp = np.array([float(ct.data['p_cent'].loc[ct.data['time'] == MedHrs/24.]) for ct in cta])
+        
+        # Identifier and month of the end of each storm
+        ctsid = [ct.sid for ct in cta]
+        ctbtimes = [md.timeAdd(reftime,[0,0,list(ct.data.time)[-1],0,0,0]) for ct in cta]
+        ctY, ctM = [ctbt[0] for ctbt in ctbtimes], [ctbt[1] for ctbt in ctbtimes]
 
     # Option 1: Location lies within a system's area:
     if cAreas[eloc[0][0],eloc[1][0]] > 0:
-        ctareas = [cAreas[ctays[j],ctaxs[j]] for j in range(len(cta))]
+        ctareas = [cAreas[ctays[j],ctaxs[j]] for j in range(len(ctsid))]
         
         try:
-            ctb = cta[int(np.where(cAreas[eloc[0][0],eloc[1][0]] == ctareas)[0])]
-            ctbtime = md.timeAdd(reftime,[0,0,list(ctb.data.time)[-1],0,0,0])
-            pdf.loc[i,'SID'] = ctb.sid
-            pdf.loc[i,'CMonth'] = ctbtime[1]
-            pdf.loc[i,'CYear'] = ctbtime[0]
+            jb = int(np.where(cAreas[eloc[0][0],eloc[1][0]] == ctareas)[0])
+            pdf.loc[i,'SID'] = ctsid[jb]
+            pdf.loc[i,'CMonth'] = ctM[jb]
+            pdf.loc[i,'CYear'] = ctY[jb]
             
             link = 1
         
@@ -184,17 +226,16 @@ for i in range(0,len(pdf)):
     ## Only comes into play if there isn't a more direct area overlap.
     if link == 0:
         # Calculate distance to each system center
-        dista = np.array([md.haversine(y,elats[ctays[j],ctaxs[j]],x,elons[ctays[j],ctaxs[j]]) for j in range(len(cta))])
+        dista = ros.haversine(y,elats[ctays,ctaxs],x,elons[ctays,ctaxs])
         
         # If there's 1 or more possible storm(s)
         if sum(dista < dthresh) > 0:
             # Identify the closest storm
-            ctb = cta[np.where(dista == np.min(dista))[0][0]]
+            jb = np.where(dista == np.min(dista))[0][0]
             # Record its info in the main data frame
-            ctbtime = md.timeAdd(reftime,[0,0,list(ctb.data.time)[-1],0,0,0])
-            pdf.loc[i,'SID'] = ctb.sid
-            pdf.loc[i,'CMonth'] = ctbtime[1]
-            pdf.loc[i,'CYear'] = ctbtime[0]
+            pdf.loc[i,'SID'] = ctsid[jb]
+            pdf.loc[i,'CMonth'] = ctM[jb]
+            pdf.loc[i,'CYear'] = ctY[jb]
         
         # If there are no possible storms:
         else:
@@ -206,3 +247,5 @@ for i in range(0,len(pdf)):
     if i%100 == 0:
         print(str(i) + " of " + str(len(pdf)))
         pdf.to_csv(csvpath2+"/"+name+"_"+SDAY+"_"+EDAY+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_X"+str(col)+"_Y"+str(row)+".csv",index=0)
+
+print(cyc.stats())
@@ -2,6 +2,8 @@
 Author: Alex Crawford
 Date Created: 19 Mar 2019
 Date Modified: 29 May 2019 --> Update for Python 3
+                18 Oct 2026 --> Collect storm stats in a columnar buffer
+                18 Oct 2026 --> SOS criteria from the rules in RainOnSnow_Module
 Purpose: Aggregate storm characteristics (e.g., genesis and track location) for
 all storms that relate to precipitation at a given location.
 '''
@@ -13,6 +15,7 @@ import numpy as np
 import pandas as pd
 from osgeo import gdal, gdalnumeric, gdalconst
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 '''*******************************************
 Define Variables
@@ -88,17 +91,19 @@ EDAY = str(endtime[0]) + mons[endtime[1]-1] + days[endtime[2]-1]
 pdf = pd.read_csv(csvpath+"/"+name+"_"+SDAY+"_"+EDAY+"_Gap"+str(hthresh)+"_Rate"+str(np.round(rthresh,4))+"_Total"+str(pthresh)+"_X"+str(col)+"_Y"+str(row)+".csv")
 
 # Limit the events based on ROS criteria
-qdf = pdf[(pdf['Precip'] >= minprecip) & (pdf['Rain'] < pthresh) & (np.isfinite(pdf['SID'])) & \
-          (pdf['EdSnoDep'] > sthresh) & (pdf['StSnoDep'] > sthresh) & \
-          (np.apply_along_axis(np.sum,0,np.array([pdf['Month'] == m for m in vmons])))]
+qdf = pdf[ros.evaluateRules(pdf,"SOS",{"minprecip":minprecip,"maxrain":pthresh,"sthresh":sthresh}) & \
+          (np.isfinite(pdf['SID'])) & np.isin(pdf['Month'],vmons)]
 
 ######### READ IN ALL STORM TRACKS #######
 # Identify the unique months to parse through
 YM = np.unique([str(int(qdf.iloc[i]['CYear']))+mons[int(qdf.iloc[i]['CMonth'])-1] for i in range(len(qdf))])
 
-# Prep empty pdf & list
-sdf = pd.DataFrame(columns=["tid","year","month","genLat","genLon",\
-"maxuv","maxdpdt","maxdepth","minp","lifespan","trlen","avgarea","mcc"])
+# Prep empty buffer & list (columns in alphabetical order, as read by
+## 7_WilcoxTests_forCyclones.r; tid is always empty)
+sbuf = ros.eventbuffer([("avgarea",float),("genLat",float),("genLon",float),\
+("lifespan",float),("maxdepth",float),("maxdpdt",float),("maxdsqp",float),\
+("maxuv",float),("mcc",float),("minp",float),("month",int),("sid",int),\
+("tid",float),("trlen",float),("year",int)])
 
 st = [] # Empty list to store all storm tracks
 
@@ -118,14 +123,15 @@ for i in YM: # For each valid month...
         
         st.append(tr)
         
-        # Store a row for each storm in a pandas dataframe
-        row = pd.DataFrame([{"sid":tr.sid, "year":int(i[0:4]), \
-        "month":int(i[4:6]), "maxuv":tr.maxUV()[0], "maxdpdt":tr.maxDpDt()[0], \
-        "maxdepth":tr.maxDepth()[0], "maxdsqp":tr.maxDsqP()[0], "minp":tr.minP()[0], \
-        "lifespan":tr.lifespan(), "trlen":tr.trackLength(), "avgarea":tr.avgArea(), \
-        "mcc":tr.mcc(), "genLat":tr.data.loc[tr.data['type'] != 0]['lat'].iloc[0], \
-        "genLon":tr.data.loc[tr.data['type'] != 0]['long'].iloc[0]},])
-        sdf = sdf.append(row,ignore_index=True,sort=True)
+        # Store a row for each storm in the buffer
+        sbuf.append(sid=tr.sid, year=int(i[0:4]), \
+        month=int(i[4:6]), maxuv=tr.maxUV()[0], maxdpdt=tr.maxDpDt()[0], \
+        maxdepth=tr.maxDepth()[0], maxdsqp=tr.maxDsqP()[0], minp=tr.minP()[0], \
+        lifespan=tr.lifespan(), trlen=tr.trackLength(), avgarea=tr.avgArea(), \
+        mcc=tr.mcc(), genLat=tr.data.loc[tr.data['type'] != 0]['lat'].iloc[0], \
+        genLon=tr.data.loc[tr.data['type'] != 0]['long'].iloc[0], tid=np.nan)
+
+sdf = sbuf.toDataFrame()
 
 pd.to_pickle(st,outpath+"/"+name+"_"+V+"/SOS_systemtracks_"+SDAY+"_"+EDAY+".pkl")
 sdf.to_csv(outpath+"/"+name+"_"+V+"/SOS_AggregatedStats"+SDAY+"_"+EDAY+".csv",index=0)
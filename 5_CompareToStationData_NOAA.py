@@ -1,7 +1,10 @@
 '''
 Author: Alex Crawford
 Date Created: 21 Mar 2019
-Date Modified: ???
+Date Modified: 18 Oct 2026 --> Look up daily files in a date index
+                18 Oct 2026 --> Vectorized day counts for station records
+                18 Oct 2026 --> Read upcoming days in the background
+                18 Oct 2026 --> Option to read from the extracted time series
 Purpose: Compares snow presence, precip occurrence, and temperature between a 
 reanalysis and station data. Assumes the original station data is in inches and
 F and the reanlysis is in C.
@@ -21,6 +24,7 @@ import numpy as np
 import pandas as pd
 from osgeo import gdal, gdalnumeric, gdalconst
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 '''*******************************************
 Define Variables
@@ -32,6 +36,7 @@ ncpath1 = ncpath+"/Hourly/MERRA-LND"
 ncpath2 = ncpath+"/Hourly/T2M"
 stationpath = "/Volumes/Miranda/RainOnSnow/NOAA Data"#SNOTEL Data"
 outpath = "/Volumes/Miranda/RainOnSnow/StationComparisons"
+tspath = "/Volumes/Miranda/RainOnSnow/PrecipDetection_ByGrid/Alaska/TimeSeries" # from 0_ExtractRegionTimeSeries.py
 
 ### Location Variables ###
 v = 19 # (0-4, 5-9, 10-15, 16-19)
@@ -60,6 +65,8 @@ reftime = [1900,1,1,0,0,0]
 daystep = [0,0,1,0,0,0]
 hrs = 1 # Temporal Resolution in hours of the ROS
 dt = -9 # Time difference in hours between UTC and Local Time; -9 for Alaska
+lookahead = 1 # Number of days of data to read in the background ahead of the current day
+fromcache = 0 # 1 = read the time series in tspath instead of the daily netCDF files
 
 months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
 mons = ["01","02","03","04","05","06","07","08","09","10","11","12"]
@@ -99,7 +106,7 @@ else:
     endtime = endtime2
     
 # Subset the data frame to just these times:
-sdf['Days'] = [md.daysBetweenDates(reftime,[int(sdf['Year'][i]),int(sdf['Month'][i]),int(sdf['Day'][i]),0,0,0]) for i in range(len(sdf))]
+sdf['Days'] = ros.hoursSince(reftime,sdf['Year'],sdf['Month'],sdf['Day'])/24.
 sdf2 = sdf[( sdf['Days'] >= md.daysBetweenDates(reftime,starttime) ) & ( sdf['Days'] < md.daysBetweenDates(reftime,endtime) )]
 
 # Convert form F to C and in. to mm
@@ -109,28 +116,44 @@ sdf2['SNWD'] = sdf2['SNWD']*25.4
 sdf2['SNOW'] = sdf2['SNOW']*25.4
 sdf2['PRCP'] = sdf2['PRCP']*25.4
 
-# Load latitude and longitude arrays from a sample file
-files1 = os.listdir(ncpath1)
-files2 = os.listdir(ncpath2)
-
-ncf = nc.Dataset(ncpath1+"/"+files1[0])
-lats = ncf.variables['lat'][:]
-lons = ncf.variables['lon'][:]
-ncf.close()
+# Index the daily files by date (or, if reading the extracted time series,
+## the days they cover) and make sure none are missing, including the day
+## before the start
+if fromcache == 1:
+    reader = ros.seriescache(tspath)
+    indices = [reader.days]
+else:
+    ind1 = ros.indexFiles(ncpath1)
+    ind2 = ros.indexFiles(ncpath2)
+    indices = [ind1,ind2]
+miss = [k for index in indices for k in ros.missingDays(index,md.timeAdd(starttime,[0,0,-1,0,0,0]),endtime)]
+if len(miss) > 0 and fromcache == 1:
+    raise FileNotFoundError("No data in " + tspath + " for " + ", ".join(sorted(set(miss))))
+elif len(miss) > 0:
+    raise FileNotFoundError("No reanalysis file for " + ", ".join(sorted(set(miss))))
+
+# Load latitude and longitude arrays (stored with the time series or from a
+## sample file)
+if fromcache == 1:
+    if reader.lats is None:
+        raise ValueError(tspath + " has no latitudes and longitudes; run 0_ExtractRegionTimeSeries.py again")
+    lats, lons = reader.lats, reader.lons
+else:
+    ncf = nc.Dataset(list(ind1.values())[0])
+    lats = ncf.variables['lat'][:]
+    lons = ncf.variables['lon'][:]
+    ncf.close()
 
 # Find nearest grid cell to the desired location
 row = md.findNearest(lats,y)[1]
 col = md.findNearest(lons,x)[1]
 
-# Run loop
-p, sf, sd, tmax, tmin = [], [], [], [], []
+# Identify the files needed for each day (the day before, then the day itself),
+## which are read in the background ahead of the day being processed
+keys = []
 for i in np.arange(len(sdf2)):
-    ii = sdf2.index[i]
-    
     # Identify time
     time = [int(sdf2['Year'].iloc[i]),int(sdf2['Month'].iloc[i]),int(sdf2['Day'].iloc[i]),0,0,0]
-    if time[2] == 1:
-        print(time)
     
     Y = str(time[0])
     M = mons[time[1]-1]
@@ -142,28 +165,40 @@ for i in np.arange(len(sdf2)):
     MA = mons[time[1]-1]
     DA = days[int(time[2]-1)]
     
-    # Load NC files
-    nc1 = nc.Dataset(ncpath1+"/"+[f for f in files1 if Y+M+D in f][0])
-    nc2 = nc.Dataset(ncpath2+"/"+[f for f in files2 if Y+M+D in f][0])
-    nc1a = nc.Dataset(ncpath1+"/"+[f for f in files1 if YA+MA+DA in f][0])
-    nc2a = nc.Dataset(ncpath2+"/"+[f for f in files2 if YA+MA+DA in f][0])
+    keys.extend([YA+MA+DA,Y+M+D])
+
+if fromcache == 1:
+    cell = np.where((reader.rows == row) & (reader.cols == col))[0]
+    if len(cell) == 0:
+        raise ValueError("The grid cell for " + name + " is not in the time series in " + tspath)
+    reader = reader.subset(cell)
+else:
+    reader = ros.dailyreader([(ind1,['PRECTOTLAND','PRECSNOLAND','SNODP']),(ind2,['T2M'])],[row],[col])
+daydata = iter(ros.prefetcher(reader,keys,2*lookahead))
+
+# Run loop
+p, sf, sd, tmax, tmin = [], [], [], [], []
+for i in np.arange(len(sdf2)):
+    ii = sdf2.index[i]
+    if int(sdf2['Day'].iloc[i]) == 1:
+        print([int(sdf2['Year'].iloc[i]),int(sdf2['Month'].iloc[i]),int(sdf2['Day'].iloc[i]),0,0,0])
+    
+    # Load data for the day before and the day itself
+    keyA, dataA = next(daydata)
+    key, data = next(daydata)
     
     # Extract from the given point
-    p = np.sum(np.hstack((nc1a.variables['PRECTOTLAND'][dt:,row,col],nc1.variables['PRECTOTLAND'][:dt,row,col])))
-    sf = np.sum(np.hstack((nc1a.variables['PRECSNOLAND'][dt:,row,col],nc1.variables['PRECSNOLAND'][:dt,row,col]))) 
-    sd = np.mean(np.hstack((nc1a.variables['SNODP'][dt:,row,col],nc1.variables['SNODP'][:dt,row,col]))) 
-    tmax = np.max(np.hstack((nc2a.variables['T2M'][dt:,row,col],nc2.variables['T2M'][:dt,row,col])))
-    tmin = np.min(np.hstack((nc2a.variables['T2M'][dt:,row,col],nc2.variables['T2M'][:dt,row,col])))
+    p = np.sum(np.hstack((dataA['PRECTOTLAND'][dt:,0],data['PRECTOTLAND'][:dt,0])))
+    sf = np.sum(np.hstack((dataA['PRECSNOLAND'][dt:,0],data['PRECSNOLAND'][:dt,0]))) 
+    sd = np.mean(np.hstack((dataA['SNODP'][dt:,0],data['SNODP'][:dt,0]))) 
+    tmax = np.max(np.hstack((dataA['T2M'][dt:,0],data['T2M'][:dt,0])))
+    tmin = np.min(np.hstack((dataA['T2M'][dt:,0],data['T2M'][:dt,0])))
     
     sdf2.loc[ii,ra+'Precip'] = p
     sdf2.loc[ii,ra+'Snowfall'] = sf
     sdf2.loc[ii,ra+'SnowDepth'] = sd
     sdf2.loc[ii,ra+'TMax'] = tmax
     sdf2.loc[ii,ra+'TMin'] = tmin
-    
-    # Transition to Next Day
-    nc1a.close(), nc2a.close()
-    nc1.close(), nc2.close()
 
 # Write to File
 sdf2[ra+'Precip'] = sdf2[ra+'Precip'] * pconversion
@@ -4,6 +4,8 @@ Date Created: 24 Apr 2019
 Date Modified: 31 May 2019 --> Added more parameterizaton
                 11 Jun 2019 --> Switch from absolute to relative measure of storm density for determining area of interest
                 4 Jul 2019 --> Make it relative
+                18 Oct 2026 --> Keep recently used months of cyclone tracks in memory
+                18 Oct 2026 --> Option to read storm centers from the storm center tables
 Purpose: Runs a chi-square distance test for grid cells around Alaska for storm
 track presence/absence.
 '''
@@ -15,6 +17,7 @@ import numpy as np
 import pandas as pd
 from osgeo import gdal, gdalnumeric
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 def chidist(inArr):
     '''Calculates the chi-square distance for an array of counts with rows 
@@ -74,6 +77,8 @@ T1, T2 = "ROS", "SOS"
 path = "/Volumes/Miranda/RainOnSnow"
 inpath = path+"/PrecipDetection_Aggregation/"
 cpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/SystemTracks"
+centerpath = "/Volumes/Ferdinand/ArcticCyclone/detection11_3AM2/StormCenters" # from 3A_BuildStormCenterTable.py
+centers = 1 # 1 = read storm centers from the tables in centerpath; 0 = from the monthly system tracks
 
 dtype = gdal.GDT_Float64
 suppath = "/Volumes/Ferdinand/Projections"
@@ -126,6 +131,12 @@ print("Calculate Observed Dissimilarity")
 counts1 = [] # For First Category
 counts2 = [] # For Second Category
 
+# Months of cyclone tracks are shared by storms in the same month
+if centers == 1:
+    ctab = ros.centertable(centerpath,range(starttime[0],endtime[0]+1))
+else:
+    cyclones = ros.cyclonedata(cpath,maxtracks=24)
+
 # Find each storm for PDF #1
 print (T1 + " Count: " + str(n1))
 
@@ -138,9 +149,12 @@ for i in range(n1):
     m = int(pdf1.iloc[i]['month'])
      
     # Read in Cyclone data, extract the data frame for locations    
-    cycs = pd.read_pickle(cpath+"/"+str(y)+"/systemtracks"+str(y)+mons[m-1]+".pkl")
-    cyc = [c for c in cycs if c.sid == sid][0]
-    cdata = cyc.data.loc[cyc.data.type != 0]
+    if centers == 1:
+        cdata = pd.DataFrame(ctab.track(sid,y,m))
+    else:
+        cycs = cyclones.tracks(y,m)
+        cdata = [c for c in cycs if c.sid == sid][0].data
+    cdata = cdata.loc[cdata.type != 0]
     
     counts1a = np.zeros_like(td1) # Create empty count field for storm
 
@@ -166,9 +180,12 @@ for i in range(n2):
     m = int(pdf2.iloc[i]['month'])
     
     # Read in Cyclone data, extract the data frame for locations
-    cycs = pd.read_pickle(cpath+"/"+str(y)+"/systemtracks"+str(y)+mons[m-1]+".pkl")
-    cyc = [c for c in cycs if c.sid == sid][0]
-    cdata = cyc.data.loc[cyc.data.type != 0]
+    if centers == 1:
+        cdata = pd.DataFrame(ctab.track(sid,y,m))
+    else:
+        cycs = cyclones.tracks(y,m)
+        cdata = [c for c in cycs if c.sid == sid][0].data
+    cdata = cdata.loc[cdata.type != 0]
 
     counts2a = np.zeros_like(td2) # Create empty count field for storm
 
@@ -183,6 +200,9 @@ for i in range(n2):
     # Append to list
     counts2.append(counts2a > 0)
     
+if centers == 0:
+    print(cyclones.stats())
+
 # Find total counts for both categories of storm
 sum1 = np.apply_along_axis(np.sum,0,np.array(counts1))
 sum2 = np.apply_along_axis(np.sum,0,np.array(counts2))
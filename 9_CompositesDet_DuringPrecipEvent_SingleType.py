@@ -2,6 +2,8 @@
 Author: Alex Crawford
 Date Created: 31 May 2019
 Date Modified: 7 Jun 2019
+                18 Oct 2026 --> Vectorized event hours
+                18 Oct 2026 --> Event classes from the rules in RainOnSnow_Module
 Purpose: Generates composites of atmospheric fields for Rain events, Non-Rain Events, 
 ROS Events, Non-ROS Events, ROSF Events, and ROSNonF Events; includes tests of difference
 to assess statistical significance. Must be done by point location.
@@ -18,6 +20,7 @@ import netCDF4 as nc
 from scipy import stats
 from copy import deepcopy
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 '''*******************************************
 Define Variables
@@ -61,6 +64,7 @@ v2 = "500"
 
 ### Time Variables ###
 YYYY = "19800101_20190101"
+reftime = [1900,1,1,0,0,0]
 YY = "1980_2018"
 hrs = 1 # Temporal Resolution in hours of the ROS
 t = 3 # Temporal Resolution in hours of the cyclone tracking
@@ -94,20 +98,17 @@ except:
 #####################
 
 print("Load all instances for Case 3")
-df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.isin(pdf["Month"], mos[v])]
+df1 = pdf[ros.evaluateRules(pdf,"ROS",{"minrain":minrain,"vice":vice}) & np.isin(pdf["Month"], mos[v])]
 
-# Loop through each hour of each precip event, record the time
-ts = []
-for i in range(len(df1)): 
-    t0 = [int(df1.iloc[i].Year),int(df1.iloc[i].Month),int(df1.iloc[i].Day),int(df1.iloc[i].Hour),0,0]
-    for j in range(int(df1.iloc[i].Length)):        
-        ts.append( md.timeAdd(t0,[0,0,0,j,0,0]) )
+# Record the time of each hour of each precip event
+ts = ros.eventHours(ros.hoursSince(reftime,df1['Year'],df1['Month'],df1['Day'],df1['Hour']),df1['Length'])
 
 # For each of those month/day/hour combos, load every relevant year
 # Extract values per hour and place in an array stack
 # Do this for EVERY variable of interest
-ts = [t for t in ts if ((t[1] != 2) | (t[2] != 29))]
-MDHs = [mons[t[1]-1]+days[t[2]-1]+"_"+hours[t[3]] for t in ts]
+ts = ts[ros.hoursToStrings(ts,reftime,"%m%d") != "0229"]
+tYs = ros.hoursToDates(ts,reftime)[0]
+MDHs = ros.hoursToStrings(ts,reftime,"%m%d_%H00")
 
 listD = []     
 for MDH in np.unique(MDHs):
@@ -116,7 +117,7 @@ for MDH in np.unique(MDHs):
     tis = np.where(np.array(MDHs) == MDH)[0]
     
     for t in tis:
-        y = ts[t][0] - int(YYYY[:4])
+        y = tYs[t] - int(YYYY[:4])
         listD.append(ncfD.variables[v1+'det'][y,:,:])
     
     # Close NetCDF
@@ -126,21 +127,17 @@ for MDH in np.unique(MDHs):
 var1 = np.array(listD)
 
 print("Load all instances for Case 4")
-df2 = pdf[np.array(pdf["Precip"] >= minrain) & np.array(pdf["Rain"] < minrain) & \
-          np.array(pdf["StSnoDep"] > sthresh) & np.array(pdf["EdSnoDep"] > sthresh) & np.isin(pdf["Month"], mos[v])]
+df2 = pdf[ros.evaluateRules(pdf,"SOS",{"minprecip":minrain,"maxrain":minrain,"sthresh":sthresh}) & np.isin(pdf["Month"], mos[v])]
 
-# Loop through each hour of each precip event, record the time
-ts = []
-for i in range(len(df2)): 
-    t0 = [int(df2.iloc[i].Year),int(df2.iloc[i].Month),int(df2.iloc[i].Day),int(df2.iloc[i].Hour),0,0]
-    for j in range(int(df2.iloc[i].Length)):        
-        ts.append( md.timeAdd(t0,[0,0,0,j,0,0]) )
+# Record the time of each hour of each precip event
+ts = ros.eventHours(ros.hoursSince(reftime,df2['Year'],df2['Month'],df2['Day'],df2['Hour']),df2['Length'])
 
 # For each of those month/day/hour combos, load every relevant year
 # Extract values per hour and place in an array stack
 # Do this for EVERY variable of interest
-ts = [t for t in ts if ((t[1] != 2) | (t[2] != 29))]
-MDHs = [mons[t[1]-1]+days[t[2]-1]+"_"+hours[t[3]] for t in ts]
+ts = ts[ros.hoursToStrings(ts,reftime,"%m%d") != "0229"]
+tYs = ros.hoursToDates(ts,reftime)[0]
+MDHs = ros.hoursToStrings(ts,reftime,"%m%d_%H00")
 
 listD = []   
 for MDH in np.unique(MDHs):
@@ -149,7 +146,7 @@ for MDH in np.unique(MDHs):
     tis = np.where(np.array(MDHs) == MDH)[0]
     
     for t in tis:
-        y = ts[t][0] - int(YYYY[:4])
+        y = tYs[t] - int(YYYY[:4])
         listD.append(ncfD.variables[v1+'det'][y,:,:])
     
     # Close NetCDF
@@ -186,7 +183,7 @@ del var1avg, var2avg
 ##### ROSF v. ROSNonF ####
 ##########################
 #print("Load all instances for Case 5")
-#df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] >= f30thresh) & np.isin(pdf["Month"], mos[v])]
+#df1 = pdf[ros.evaluateRules(pdf,"ROSF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
 ## Loop through each hour of each precip event, record the time
 #ts = []
 #for i in range(len(df1)): 
@@ -217,7 +214,7 @@ del var1avg, var2avg
 #var1 = np.array(listD)
 #
 #print("Load all instances for Case 6")
-#df2 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] < f30thresh) & np.isin(pdf["Month"], mos[v])]
+#df2 = pdf[ros.evaluateRules(pdf,"ROSNonF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
 ## Loop through each hour of each precip event, record the time
 #ts = []
 #for i in range(len(df2)): 
@@ -2,6 +2,8 @@
 Author: Alex Crawford
 Date Created: 31 May 2019
 Date Modified: 7 Jun 2019
+                18 Oct 2026 --> Vectorized event hours
+                18 Oct 2026 --> Event classes from the rules in RainOnSnow_Module
 Purpose: Generates composites of atmospheric fields for Rain events, Non-Rain Events, 
 ROS Events, Non-ROS Events, ROSF Events, and ROSNonF Events; includes tests of difference
 to assess statistical significance. Must be done by point location.
@@ -18,6 +20,7 @@ import netCDF4 as nc
 from scipy import stats
 from copy import deepcopy
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 '''*******************************************
 Define Variables
@@ -61,6 +64,7 @@ v2s = ["","","500",""]
 
 ### Time Variables ###
 YYYY = "19800101_20190101"
+reftime = [1900,1,1,0,0,0]
 YY = "1980_2018"
 hrs = 1 # Temporal Resolution in hours of the ROS
 t = 3 # Temporal Resolution in hours of the cyclone tracking
@@ -100,19 +104,17 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
     pdf = pd.read_csv(csvpath+"/"+names[v]+"_"+YYYY+"_Gap"+str(hthresh)+"_Rate"+str(rthresh)+"_Total"+str(pthresh)+"_X"+str(cols[v])+"_Y"+str(rows[v])+".csv")
 
     print("Load all instances for Case 3 " + names[v])
-    df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.isin(pdf["Month"], mos[v])]
+    df1 = pdf[ros.evaluateRules(pdf,"ROS",{"minrain":minrain,"vice":vice}) & np.isin(pdf["Month"], mos[v])]
     
-    # Loop through each hour of each precip event, record the time
-    ts = []
-    for i in range(len(df1)): 
-        t0 = [int(df1.iloc[i].Year),int(df1.iloc[i].Month),int(df1.iloc[i].Day),int(df1.iloc[i].Hour),0,0]
-        ts.append( md.timeAdd(t0,[0,0,0,-1*hshift,0,0]) )
+    # Record the time hshift hours before each precip event
+    ts = ros.hoursSince(reftime,df1['Year'],df1['Month'],df1['Day'],df1['Hour']) - hshift
     
     # For each of those month/day/hour combos, load every relevant year
     # Extract values per hour and place in an array stack
     # Do this for EVERY variable of interest
-    ts = [t for t in ts if ((t[1] != 2) | (t[2] != 29))]
-    MDHs = [mons[t[1]-1]+days[t[2]-1]+"_"+hours[t[3]] for t in ts]
+    ts = ts[ros.hoursToStrings(ts,reftime,"%m%d") != "0229"]
+    tYs = ros.hoursToDates(ts,reftime)[0]
+    MDHs = ros.hoursToStrings(ts,reftime,"%m%d_%H00")
     
     listD = []     
     for MDH in np.unique(MDHs):
@@ -121,7 +123,7 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
         tis = np.where(np.array(MDHs) == MDH)[0]
         
         for t in tis:
-            y = ts[t][0] - int(YYYY[:4])
+            y = tYs[t] - int(YYYY[:4])
             listD.append(ncfD.variables[v1+'det'][y,:,:])
         
         # Close NetCDF
@@ -131,20 +133,17 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
     var1 = np.array(listD)
     
     print("Load all instances for Case 4")
-    df2 = pdf[np.array(pdf["Precip"] >= minrain) & np.array(pdf["Rain"] < minrain) & \
-              np.array(pdf["StSnoDep"] > sthresh) & np.array(pdf["EdSnoDep"] > sthresh) & np.isin(pdf["Month"], mos[v])]
+    df2 = pdf[ros.evaluateRules(pdf,"SOS",{"minprecip":minrain,"maxrain":minrain,"sthresh":sthresh}) & np.isin(pdf["Month"], mos[v])]
     
-    # Loop through each hour of each precip event, record the time
-    ts = []
-    for i in range(len(df2)): 
-        t0 = [int(df2.iloc[i].Year),int(df2.iloc[i].Month),int(df2.iloc[i].Day),int(df2.iloc[i].Hour),0,0]
-        ts.append( md.timeAdd(t0,[0,0,0,-1*hshift,0,0]) )
+    # Record the time hshift hours before each precip event
+    ts = ros.hoursSince(reftime,df2['Year'],df2['Month'],df2['Day'],df2['Hour']) - hshift
     
     # For each of those month/day/hour combos, load every relevant year
     # Extract values per hour and place in an array stack
     # Do this for EVERY variable of interest
-    ts = [t for t in ts if ((t[1] != 2) | (t[2] != 29))]
-    MDHs = [mons[t[1]-1]+days[t[2]-1]+"_"+hours[t[3]] for t in ts]
+    ts = ts[ros.hoursToStrings(ts,reftime,"%m%d") != "0229"]
+    tYs = ros.hoursToDates(ts,reftime)[0]
+    MDHs = ros.hoursToStrings(ts,reftime,"%m%d_%H00")
     
     listD = []   
     for MDH in np.unique(MDHs):
@@ -153,7 +152,7 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
         tis = np.where(np.array(MDHs) == MDH)[0]
         
         for t in tis:
-            y = ts[t][0] - int(YYYY[:4])
+            y = tYs[t] - int(YYYY[:4])
             listD.append(ncfD.variables[v1+'det'][y,:,:])
         
         # Close NetCDF
@@ -190,7 +189,7 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
     ##### ROSF v. ROSNonF ####
     ##########################
     #print("Load all instances for Case 5")
-    #df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] >= f30thresh) & np.isin(pdf["Month"], mos[v])]
+    #df1 = pdf[ros.evaluateRules(pdf,"ROSF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
     ## Loop through each hour of each precip event, record the time
     #ts = []
     #for i in range(len(df1)): 
@@ -220,7 +219,7 @@ for v in [15]: #[3,10,11,12,14,15,16,18,19]:# [16]: #[3,18]:#
     #var1 = np.array(listD)
     #
     #print("Load all instances for Case 6")
-    #df2 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] < f30thresh) & np.isin(pdf["Month"], mos[v])]
+    #df2 = pdf[ros.evaluateRules(pdf,"ROSNonF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
     ## Loop through each hour of each precip event, record the time
     #ts = []
     #for i in range(len(df2)): 
@@ -2,6 +2,8 @@
 Author: Alex Crawford
 Date Created: 31 May 2019
 Date Modified: 7 Jun 2019
+                18 Oct 2026 --> Vectorized event hours
+                18 Oct 2026 --> Event classes from the rules in RainOnSnow_Module
 Purpose: Generates composites of atmospheric fields for Rain events, Non-Rain Events, 
 ROS Events, Non-ROS Events, ROSF Events, and ROSNonF Events; includes tests of difference
 to assess statistical significance. Must be done by point location.
@@ -18,6 +20,7 @@ import netCDF4 as nc
 from scipy import stats
 from copy import deepcopy
 import CycloneModule_11_1 as md
+import RainOnSnow_Module as ros
 
 '''*******************************************
 Define Variables
@@ -63,6 +66,7 @@ ncvars = ["T2M","TQV","H500","SLP"]
 
 ### Time Variables ###
 YYYY = "19800101_20190101"
+reftime = [1900,1,1,0,0,0]
 YY = "1980_2018"
 hrs = 1 # Temporal Resolution in hours of the ROS
 t = 3 # Temporal Resolution in hours of the cyclone tracking
@@ -102,19 +106,19 @@ for v in [3,18]:#[3,10,11,12,14,15,16,17,18,19]:
     pdf = pd.read_csv(csvpath+"/"+names[v]+"_"+YYYY+"_Gap"+str(hthresh)+"_Rate"+str(rthresh)+"_Total"+str(pthresh)+"_X"+str(cols[v])+"_Y"+str(rows[v])+".csv")
 
     print("Load all instances for Case 3 " + names[v])
-    df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.isin(pdf["Month"], mos[v])]
+    df1 = pdf[ros.evaluateRules(pdf,"ROS",{"minrain":minrain,"vice":vice}) & np.isin(pdf["Month"], mos[v])]
     
-    # Loop through each hour of each precip event, extract the variable
+    # Find the time hshift hours before each precip event
+    tYs, tMs, tDs, tHs = ros.hoursToDates(ros.hoursSince(reftime,df1['Year'],df1['Month'],df1['Day'],df1['Hour']) - hshift, reftime)
+    
+    # Loop through each precip event, extract the variable
     listD = []    
     for i in range(len(df1)): 
-        t0 = [int(df1.iloc[i].Year),int(df1.iloc[i].Month),int(df1.iloc[i].Day),int(df1.iloc[i].Hour),0,0]
-        t = md.timeAdd(t0,[0,0,0,-1*hshift,0,0])
-        
-        YDM = str(t[0])+mons[t[1]-1]+days[t[2]-1]
+        YDM = str(tYs[i])+mons[tMs[i]-1]+days[tDs[i]-1]
         
         ncfD = nc.Dataset(ncpath+"/"+v1+"/"+v2+"/"+v3+YDM+".SUB.nc")
         
-        listD.append(ncfD.variables[ncvar][t[3],:,:])
+        listD.append(ncfD.variables[ncvar][tHs[i],:,:])
         
         # Close NetCDF
         ncfD.close()
@@ -123,20 +127,19 @@ for v in [3,18]:#[3,10,11,12,14,15,16,17,18,19]:
     var1 = np.array(listD)
     
     print("Load all instances for Case 4")
-    df2 = pdf[np.array(pdf["Precip"] >= minrain) & np.array(pdf["Rain"] < minrain) & \
-              np.array(pdf["StSnoDep"] > sthresh) & np.array(pdf["EdSnoDep"] > sthresh) & np.isin(pdf["Month"], mos[v])]
+    df2 = pdf[ros.evaluateRules(pdf,"SOS",{"minprecip":minrain,"maxrain":minrain,"sthresh":sthresh}) & np.isin(pdf["Month"], mos[v])]
     
-    # Loop through each hour of each precip event, extract the variable
+    # Find the time hshift hours before each precip event
+    tYs, tMs, tDs, tHs = ros.hoursToDates(ros.hoursSince(reftime,df2['Year'],df2['Month'],df2['Day'],df2['Hour']) - hshift, reftime)
+    
+    # Loop through each precip event, extract the variable
     listD = []    
     for i in range(len(df2)): 
-        t0 = [int(df2.iloc[i].Year),int(df2.iloc[i].Month),int(df2.iloc[i].Day),int(df2.iloc[i].Hour),0,0]
-        t = md.timeAdd(t0,[0,0,0,-1*hshift,0,0])
-        
-        YDM = str(t[0])+mons[t[1]-1]+days[t[2]-1]
+        YDM = str(tYs[i])+mons[tMs[i]-1]+days[tDs[i]-1]
         
         ncfD = nc.Dataset(ncpath+"/"+v1+"/"+v2+"/"+v3+YDM+".SUB.nc")
         
-        listD.append(ncfD.variables[ncvar][t[3],:,:])
+        listD.append(ncfD.variables[ncvar][tHs[i],:,:])
         
         # Close NetCDF
         ncfD.close()
@@ -172,7 +175,7 @@ for v in [3,18]:#[3,10,11,12,14,15,16,17,18,19]:
     ##### ROSF v. ROSNonF ####
     ##########################
     #print("Load all instances for Case 5")
-    #df1 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] >= f30thresh) & np.isin(pdf["Month"], mos[v])]
+    #df1 = pdf[ros.evaluateRules(pdf,"ROSF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
     ## Loop through each hour of each precip event, record the time
     #ts = []
     #for i in range(len(df1)): 
@@ -202,7 +205,7 @@ for v in [3,18]:#[3,10,11,12,14,15,16,17,18,19]:
     #var1 = np.array(listD)
     #
     #print("Load all instances for Case 6")
-    #df2 = pdf[np.array(pdf["Rain"] >= minrain) & np.array(pdf["Ice"] == 3) & np.array(pdf["Frz30"] < f30thresh) & np.isin(pdf["Month"], mos[v])]
+    #df2 = pdf[ros.evaluateRules(pdf,"ROSNonF",{"minrain":minrain,"vice":vice,"f30thresh":f30thresh}) & np.isin(pdf["Month"], mos[v])]
     ## Loop through each hour of each precip event, record the time
     #ts = []
     #for i in range(len(df2)): 
@@ -0,0 +1,2003 @@
+'''
+Author: Alex Crawford
+Date Created: 18 Oct 2026
+Date Modified: 18 Oct 2026
+Purpose: Shared functions and classes for the rain-on-snow scripts. Anything
+that more than one stage of the analysis needs (or that is too slow to leave
+as a loop inside a script) lives here.
+
+Default units: mm for precip/snow, m for snow depth, hours for time, and K for
+temperature (conversion to deg C happens when results are written to file)
+'''
+
+'''********************
+Import Modules
+********************'''
+import os
+import hashlib
+import re
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+'''*******************************************
+Time Functions
+*******************************************'''
+def toDatetime64(time):
+    '''Converts a date list in the format [Y,M,D,H,M,S] to a numpy datetime64
+    with a resolution of hours (rounded to the nearest hour, so that a date
+    list like [1980,1,1,22.9999,0,0] becomes 1980-01-01T23).
+    '''
+    hrs = float(time[3]) + float(time[4])/60. + float(time[5])/3600.
+    return np.datetime64("%04d-%02d-%02d" % tuple(time[:3]),'h') + np.timedelta64(int(np.round(hrs)),'h')
+
+def hoursSince(reftime,years,months,days,hours=0):
+    '''Calculates the number of hours between reftime and one or more dates
+    at once. Inputs can be scalars, arrays, or columns of a data frame (e.g.,
+    hoursSince(reftime,pdf['Year'],pdf['Month'],pdf['Day'],pdf['Hour'])).
+    Hours are rounded to the nearest integer.
+
+    reftime = a date list in the format [Y,M,D,H,M,S]
+    years, months, days, hours = the parts of each date
+
+    Returns an array (or a scalar) of integer hours since reftime.
+    '''
+    Y = np.asarray(years).astype(np.int64)
+    M = np.asarray(months).astype(np.int64)
+    D = np.asarray(days).astype(np.int64)
+    H = np.round(np.asarray(hours,dtype=float)).astype(np.int64)
+
+    t = ((Y-1970).astype('datetime64[Y]').astype('datetime64[M]') + (M-1).astype('timedelta64[M]'))
+    t = t.astype('datetime64[D]') + (D-1).astype('timedelta64[D]')
+    t = t.astype('datetime64[h]') + H.astype('timedelta64[h]')
+
+    return (t - toDatetime64(reftime)).astype(np.int64)
+
+def hoursToDates(hrs,reftime=[1900,1,1,0,0,0]):
+    '''Converts hours since reftime to dates for many time steps at once
+    (rounding to the nearest hour).
+
+    hrs = a scalar or an array of hours since reftime
+    reftime = a date list in the format [Y,M,D,H,M,S]
+
+    Returns four integer arrays: year, month, day, and hour.
+    '''
+    t = toDatetime64(reftime) + np.round(np.asarray(hrs,dtype=float)).astype(np.int64).astype('timedelta64[h]')
+
+    Y = t.astype('datetime64[Y]').astype(np.int64) + 1970
+    M = t.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    D = (t.astype('datetime64[D]') - t.astype('datetime64[M]')).astype(np.int64) + 1
+    H = (t - t.astype('datetime64[D]')).astype(np.int64)
+
+    return Y, M, D, H
+
+def hoursToStrings(hrs,reftime=[1900,1,1,0,0,0],fmt="%Y%m%d_%H00"):
+    '''Converts hours since reftime to strings for many time steps at once
+    (e.g., fmt="%Y%m" gives YYYYMM and fmt="%m%d_%H00" gives the MMDD_HHHH
+    used to name the detrended files).
+
+    Returns an array of strings.
+    '''
+    t = toDatetime64(reftime) + np.round(np.asarray(hrs,dtype=float)).astype(np.int64).astype('timedelta64[h]')
+    return np.array(pd.DatetimeIndex(np.atleast_1d(t)).strftime(fmt))
+
+def eventHours(starts,lengths):
+    '''Lists every hour of every event at once -- each event contributes the
+    hours from its start (inclusive) to start + length (exclusive).
+
+    starts = array of start times for each event (in hours since reftime)
+    lengths = array of the length of each event (in hours)
+
+    Returns an array of hours since reftime.
+    '''
+    starts = np.asarray(starts).astype(np.int64)
+    lengths = np.asarray(lengths).astype(np.int64)
+
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths)-lengths,lengths)
+
+    return np.repeat(starts,lengths) + offsets
+
+def dayKeys(starttime,endtime,reftime=[1900,1,1,0,0,0]):
+    '''Lists every day from starttime (inclusive) to endtime (exclusive).
+
+    starttime, endtime, reftime = date lists in the format [Y,M,D,H,M,S]
+
+    Returns a list of (YYYYMMDD, t) pairs, where t is the number of hours
+    between reftime and the start of that day.
+    '''
+    d0 = np.datetime64("%04d-%02d-%02d" % tuple(starttime[:3]),'D')
+    d1 = np.datetime64("%04d-%02d-%02d" % tuple(endtime[:3]),'D')
+    ds = np.arange(d0,d1)
+    ts = (ds.astype('datetime64[h]') - toDatetime64(reftime)).astype(np.int64)
+
+    return [(str(d).replace("-",""), int(t)) for d, t in zip(ds,ts)]
+
+'''*******************************************
+Finding Files
+*******************************************'''
+def indexFiles(path,prefix="",pattern=r"(?<!\d)(\d{8})(?!\d)",cache=None):
+    '''Scans a directory once and builds a dictionary that maps the date in
+    each file name to the full path of that file, so that finding the file
+    for a given day is a single lookup instead of a search through the whole
+    directory listing. If more than one file has the same date, the first
+    in alphabetical order is used.
+
+    path = the directory to scan
+    prefix = only files whose names start with this string are indexed
+    pattern = a regular expression whose first group is the date key; the
+        default is 8 digits in a row (YYYYMMDD), but r"_(\\d{4}_\\d{4})\\.nc$"
+        would index the detrended files by month, day, and hour (MMDD_HHHH)
+    cache = optional path of a pickle file for storing the index; if the
+        file exists and is newer than the directory, it is loaded instead of
+        scanning the directory again
+
+    Returns a dictionary of date key : file path.
+    '''
+    if cache is not None and os.path.exists(cache) and \
+            os.path.getmtime(cache) >= os.path.getmtime(path):
+        return pd.read_pickle(cache)
+
+    regex = re.compile(pattern)
+    index = {}
+    for f in sorted(os.listdir(path)):
+        if f.startswith(prefix):
+            m = regex.search(f)
+            if m is not None and m.group(1) not in index:
+                index[m.group(1)] = path+"/"+f
+
+    if cache is not None:
+        pd.to_pickle(index,cache)
+
+    return index
+
+def missingDays(index,starttime,endtime):
+    '''Identifies every day from starttime (inclusive) to endtime (exclusive)
+    that does not have a file in an index made by indexFiles (using the
+    default YYYYMMDD keys).
+
+    index = a dictionary of date key : file path (or the days of a
+        seriescache)
+    starttime, endtime = date lists in the format [Y,M,D,H,M,S]
+
+    Returns a list of date keys (YYYYMMDD) that are missing from the index.
+    '''
+    return [k for k, t in dayKeys(starttime,endtime) if k not in index]
+
+def completeThrough(indices,starttime,reftime=[1900,1,1,0,0,0]):
+    '''Finds how far the daily files go in whole months -- i.e., the first
+    month after starttime for which at least one day is missing from at
+    least one index made by indexFiles.
+
+    indices = a list of dictionaries of YYYYMMDD : file path
+    starttime = a date list for the first day of a month
+
+    Returns a date list for the start of the first incomplete month (equal
+    to starttime if the month of starttime is itself incomplete).
+    '''
+    keys = set.intersection(*[set(index.keys()) for index in indices])
+    endtime = list(starttime)
+    while True:
+        nexttime = [endtime[0]+endtime[1]//12,endtime[1]%12+1,1,0,0,0]
+        if any(k not in keys for k, t in dayKeys(endtime,nexttime,reftime)):
+            return endtime
+        endtime = nexttime
+
+'''*******************************************
+Regions
+*******************************************'''
+# Definitions of each study region. A region can have a list of boxes, given
+## as (west lon, east lon, south lat, north lat, closed) where the north edge
+## is only included if closed is True (all other edges are always included),
+## and/or a list of polygons, each given as a list of (lon, lat) vertices.
+## A grid cell is in the region if it is in any of the boxes or polygons.
+regiondefs = {"Alaska":{"boxes":[(-170,-141,50,75,True),(-135,-130,54.5,56.5,False),\
+                                 (-137,-131.5,56.5,57.5,False),(-139,-132.5,57.5,59,False),\
+                                 (-141,-134.5,59,61,False)]}}
+
+def inPolygon(x,y,poly):
+    '''Tests whether each point is inside a polygon using the even-odd rule
+    (a ray cast from the point crosses the edges an odd number of times).
+
+    x, y = arrays of the x (e.g., longitude) and y (e.g., latitude) of points
+    poly = a list of (x, y) vertices (the last vertex connects to the first)
+
+    Returns a boolean array with the shape of x.
+    '''
+    x, y = np.asarray(x,dtype=float), np.asarray(y,dtype=float)
+    px, py = np.array([p[0] for p in poly],dtype=float), np.array([p[1] for p in poly],dtype=float)
+
+    inside = np.zeros(x.shape,dtype=bool)
+    for i in range(len(px)):
+        x1, y1, x2, y2 = px[i-1], py[i-1], px[i], py[i]
+        if y1 == y2:
+            continue
+        cross = ((y1 > y) != (y2 > y)) & (x < x1 + (y-y1)*(x2-x1)/(y2-y1))
+        inside = inside ^ cross
+
+    return inside
+
+def regionMask(lats,lons,definition):
+    '''Builds a boolean mask of the grid cells in a region.
+
+    lats, lons = 1-D arrays of the latitude and longitude of the grid
+    definition = a dictionary with "boxes" and/or "polygons" (see regiondefs)
+
+    Returns a boolean array with the shape (len(lats), len(lons)).
+    '''
+    longrid, latgrid = np.meshgrid(np.asarray(lons), np.asarray(lats))
+
+    mask = np.zeros(longrid.shape,dtype=bool)
+    for w, e, s, n, closed in definition.get("boxes",[]):
+        north = (latgrid <= n) if closed else (latgrid < n)
+        mask = mask | ((longrid >= w) & (longrid <= e) & (latgrid >= s) & north)
+    for poly in definition.get("polygons",[]):
+        mask = mask | inPolygon(longrid,latgrid,poly)
+
+    return mask
+
+class region:
+    '''An object that holds the grid cells of a region in the forms that the
+    different stages need them.
+
+    name = the name of the region
+    rows, cols = arrays with the row and column of each grid cell
+    shape = the shape of the full grid
+
+    Attributes also include flat (the index of each grid cell in the
+    flattened grid) and rowslice and colslice (the smallest box that holds
+    every grid cell, so that ncf.variables[v][:,reg.rowslice,reg.colslice]
+    reads only that box).
+    '''
+    def __init__(self,name,rows,cols,shape):
+        self.name = name
+        self.shape = tuple(int(s) for s in shape)
+        self.rows = np.asarray(rows,dtype=np.int64)
+        self.cols = np.asarray(cols,dtype=np.int64)
+        self.flat = np.ravel_multi_index((self.rows,self.cols),self.shape)
+        if len(self.rows) > 0:
+            self.rowslice = slice(int(self.rows.min()),int(self.rows.max())+1)
+            self.colslice = slice(int(self.cols.min()),int(self.cols.max())+1)
+        else:
+            self.rowslice, self.colslice = slice(0,0), slice(0,0)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def mask(self):
+        '''Returns the region as a boolean array with the shape of the grid.'''
+        m = np.zeros(self.shape,dtype=bool)
+        m[self.rows,self.cols] = True
+        return m
+
+def loadRegion(name,lats,lons,valid=None,definition=None,cache=None):
+    '''Finds the grid cells of a region, loading them from a cache if the same
+    region has already been found for the same grid. Cached files are keyed
+    by a hash of the latitudes and longitudes of the grid, the definition of
+    the region, and the mask of valid grid cells, so any change to these
+    leads to a new file.
+
+    name = the name of the region
+    lats, lons = 1-D arrays of the latitude and longitude of the grid
+    valid = optional boolean array with the shape of the grid that is True
+        where the data are valid (e.g., np.isfinite of a land-only variable)
+    definition = the boxes and/or polygons of the region (default is
+        regiondefs[name])
+    cache = optional directory for storing regions (created if needed)
+
+    Returns a region.
+    '''
+    if definition is None:
+        definition = regiondefs[name]
+
+    lats = np.asarray(lats,dtype=float)
+    lons = np.asarray(lons,dtype=float)
+
+    if cache is not None:
+        h = hashlib.sha1()
+        h.update(lats.tobytes())
+        h.update(lons.tobytes())
+        h.update(repr(sorted(definition.items())).encode())
+        if valid is not None:
+            h.update(np.packbits(np.asarray(valid,dtype=bool)).tobytes())
+        f = cache+"/Region_"+name+"_"+h.hexdigest()[:16]+".npz"
+
+        if os.path.exists(f):
+            with np.load(f) as reg:
+                return region(name,reg['rows'],reg['cols'],reg['shape'])
+
+    mask = regionMask(lats,lons,definition)
+    if valid is not None:
+        mask = mask & np.asarray(valid,dtype=bool)
+    rows, cols = np.where(mask)
+    reg = region(name,rows,cols,mask.shape)
+
+    if cache is not None:
+        os.makedirs(cache,exist_ok=True)
+        np.savez(f,rows=reg.rows,cols=reg.cols,shape=np.array(reg.shape))
+
+    return reg
+
+'''*******************************************
+Reading Reanalysis Data
+*******************************************'''
+def readDailyBlock(ncf,varnames,rows,cols,bbox=True):
+    '''Reads every time step of each variable in varnames from an open netCDF
+    file at once and extracts the grid cells given by rows and cols. By
+    default, only the smallest box that contains all of the grid cells is
+    read from disk (set bbox to False to read the whole grid instead).
+    Masking and scaling are done here (once per variable) rather than by
+    netCDF4 for every slice, and missing values become NaNs. Arrays keep the
+    type that netCDF4 would give them (e.g., float32 for MERRA2), so that
+    unit conversions and thresholds are applied with the same precision.
+
+    ncf = an open netCDF4 Dataset with dimensions of (time, lat, lon)
+    varnames = a list of variable names
+    rows, cols = arrays with the row and column of each grid cell
+
+    Returns a dictionary with a (time, ncells) float array for each variable.
+    '''
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    if bbox and len(rows) > 0:
+        r0, r1, c0, c1 = rows.min(), rows.max()+1, cols.min(), cols.max()+1
+    else:
+        r0, r1, c0, c1 = 0, None, 0, None
+
+    data = {}
+    for v in varnames:
+        var = ncf.variables[v]
+        var.set_auto_maskandscale(False)
+        arr = var[:,r0:r1,c0:c1][:,rows-r0,cols-c0]
+        var.set_auto_maskandscale(True)
+
+        # Identify missing values before any scaling is applied
+        miss = np.zeros(arr.shape,dtype=bool)
+        for att in ['_FillValue','missing_value']:
+            if att in var.ncattrs():
+                miss = miss | np.isin(arr,np.atleast_1d(var.getncattr(att)))
+
+        if 'scale_factor' in var.ncattrs():
+            arr = arr*np.asarray(var.getncattr('scale_factor'))
+        if 'add_offset' in var.ncattrs():
+            arr = arr+np.asarray(var.getncattr('add_offset'))
+        if not np.issubdtype(arr.dtype,np.floating):
+            arr = arr.astype(float)
+        arr[miss] = np.nan
+
+        data[v] = arr
+
+    return data
+
+class dailyreader:
+    '''An object that reads one day of data for a set of grid cells from one
+    or more streams of daily reanalysis files (e.g., MERRA-LND and T2M).
+    Because it only holds file indices and grid cell locations, it can be
+    passed to other processes.
+
+    streams = a list of (index, varnames) pairs, where index is a dictionary
+        of YYYYMMDD : file path (see indexFiles) and varnames is a list of the
+        variables to read from those files
+    rows, cols = arrays with the row and column of each grid cell
+    bbox = whether to read only the bounding box of the grid cells
+    '''
+    def __init__(self,streams,rows,cols,bbox=True):
+        self.streams = streams
+        self.rows = np.asarray(rows)
+        self.cols = np.asarray(cols)
+        self.bbox = bbox
+
+    def read(self,key):
+        '''Returns a dictionary with a (time, ncells) array for every variable
+        in every stream for the day given by key (YYYYMMDD).
+        '''
+        data = {}
+        for index, varnames in self.streams:
+            ncf = nc.Dataset(index[key])
+            data.update(readDailyBlock(ncf,varnames,self.rows,self.cols,self.bbox))
+            ncf.close()
+
+        return data
+
+    def subset(self,cells):
+        '''Returns a new reader for only the grid cells in cells (an array of
+        indices or a boolean mask).
+        '''
+        return dailyreader(self.streams,self.rows[cells],self.cols[cells],self.bbox)
+
+class prefetcher:
+    '''An iterator that reads days from a reader in a background thread so
+    that the next day is read from disk while the current day is processed.
+    At most lookahead days are read ahead of the one being processed, which
+    caps the memory used. All reads happen one at a time in the same thread,
+    so netCDF files are never read from two threads at once.
+
+    reader = any object with a read(key) method (e.g., a dailyreader)
+    keys = the keys (e.g., YYYYMMDD) in the order they are needed; this can
+        be a generator, which is only advanced when a day is about to be
+        read (i.e., lookahead days ahead of the one being processed)
+    lookahead = the number of days to read ahead (0 = read each day only
+        when it is needed, without a background thread)
+
+    Iterating yields (key, data) pairs, where data is the output of
+    reader.read(key).
+    '''
+    def __init__(self,reader,keys,lookahead=1):
+        self.reader = reader
+        self.keys = keys
+        self.lookahead = lookahead
+        self.pool = None
+
+    def __iter__(self):
+        if self.lookahead < 1:
+            for key in self.keys:
+                yield key, self.reader.read(key)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            self.pool = pool
+            queue = deque()
+            for key in self.keys:
+                queue.append((key,pool.submit(self.reader.read,key)))
+                if len(queue) > self.lookahead:
+                    k, f = queue.popleft()
+                    yield k, f.result()
+            while len(queue) > 0:
+                k, f = queue.popleft()
+                yield k, f.result()
+        self.pool = None
+
+    def read(self,key):
+        '''Reads a key that was not in keys (e.g., data found to be missing
+        after a day was read) in the same thread as all other reads, after
+        the days already queued, and waits for it.
+        '''
+        if self.pool is None:
+            return self.reader.read(key)
+
+        return self.pool.submit(self.reader.read,key).result()
+
+class cellreader:
+    '''An object that reads each day for only the grid cells that are needed
+    that day (e.g., the ones that still have events waiting on them) out of
+    all the grid cells of a reader. Only the bounding box of those grid cells
+    is read from each file (see readDailyBlock), and if no grid cells are
+    needed, nothing is read at all.
+
+    reader = a dailyreader (or seriescache) for all grid cells
+    nsteps = the number of time steps in a day
+    varnames = the variables to return
+
+    Keys are (key, cells) pairs, where key is YYYYMMDD and cells is an array
+    with the index of each grid cell to read. The arrays returned by read
+    have a column for every grid cell of the reader, with NaNs for the ones
+    that were not read.
+    '''
+    def __init__(self,reader,nsteps,varnames):
+        self.reader = reader
+        self.rows, self.cols = reader.rows, reader.cols
+        self.nsteps = nsteps
+        self.varnames = varnames
+        self.dtypes = {} # of the reader (learned from the first day read)
+
+    def read(self,item):
+        '''Returns a dictionary with a (time, ncells) array for every variable
+        for the day and grid cells given by item (a (key, cells) pair).
+        '''
+        key, cells = item
+        if len(cells) > 0:
+            sub = self.reader.subset(cells).read(key)
+            self.dtypes = {v:sub[v].dtype for v in self.varnames}
+
+        data = {v:np.full((self.nsteps,len(self.rows)),np.nan,dtype=self.dtypes.get(v,float)) for v in self.varnames}
+        if len(cells) > 0:
+            for v in self.varnames:
+                data[v][:,cells] = sub[v]
+
+        return data
+
+'''*******************************************
+Time Series Cache
+*******************************************'''
+def extractTimeSeries(reader,starttime,endtime,path,varnames,hrs=1,\
+        reftime=[1900,1,1,0,0,0],dtype=np.float32,lookahead=1,lats=None,lons=None):
+    '''Reads every day from starttime (inclusive) to endtime (exclusive) with
+    a reader and writes each variable to a (time, cell) array on disk
+    (VARNAME.npy in path) that can be memory-mapped, so that later stages can
+    read the time series of the region's grid cells without opening any
+    netCDF files (see seriescache). A file called Meta.npz holds the rows
+    and columns of the grid cells, the days that are covered, and (if given)
+    the latitudes and longitudes of the grid.
+
+    reader = a dailyreader for the grid cells of interest
+    starttime, endtime = date lists in the format [Y,M,D,H,M,S]
+    path = directory to write to (created if needed)
+    varnames = list of variables to extract (must all be read by reader)
+    hrs = temporal resolution of the data in hours
+    reftime = the reference time for the hours stored in Meta.npz
+    dtype = data type for storage (MERRA2 stores float32, so this loses
+        nothing unless the files are packed with a scale factor)
+    lookahead = the number of days to read ahead (see prefetcher)
+    lats, lons = optional 1-D arrays of the latitude and longitude of the
+        grid, so that grid cells can be located without opening a netCDF file
+    '''
+    os.makedirs(path,exist_ok=True)
+    days = dayKeys(starttime,endtime,reftime)
+    nsteps = int(24/hrs)
+
+    arrs = {v:np.lib.format.open_memmap(path+"/"+v+".npy",mode="w+",dtype=dtype,\
+                shape=(len(days)*nsteps,len(reader.rows))) for v in varnames}
+
+    for d, (key, data) in enumerate(prefetcher(reader,[k for k, t in days],lookahead)):
+        for v in varnames:
+            if data[v].shape[0] != nsteps:
+                raise ValueError(key + " has " + str(data[v].shape[0]) + " time steps of " + v + " instead of " + str(nsteps))
+            arrs[v][d*nsteps:(d+1)*nsteps] = data[v]
+
+    for v in varnames:
+        arrs[v].flush()
+    del arrs
+
+    np.savez(path+"/Meta.npz",rows=np.asarray(reader.rows),cols=np.asarray(reader.cols),\
+             days=np.array([k for k, t in days]),t0=np.array([t for k, t in days]),\
+             nsteps=np.array(nsteps),varnames=np.array(varnames),\
+             **({} if lats is None else {'lats':np.asarray(lats),'lons':np.asarray(lons)}))
+
+class seriescache:
+    '''An object that reads the time series written by extractTimeSeries. It
+    has the same read(key) and subset(cells) methods as a dailyreader, so it
+    can be passed to detectEvents (or any other function that takes a
+    dailyreader) in place of the netCDF files. Arrays are memory-mapped, so
+    only the days and grid cells that are read are loaded from disk. The
+    memory maps are opened when first needed, so the object can be passed to
+    other processes.
+
+    path = the directory written by extractTimeSeries
+    cells = optional array with the index of the grid cells to read (as for
+        dailyreader.subset); default is all of them
+
+    The days attribute maps each day that is covered (YYYYMMDD) to its
+    position, so it can be checked with missingDays like a file index. The
+    lats and lons attributes are the latitudes and longitudes of the grid
+    (None if they were not given to extractTimeSeries).
+    '''
+    def __init__(self,path,cells=None):
+        self.path = path
+        with np.load(path+"/Meta.npz") as meta:
+            self.days = {str(k):i for i, k in enumerate(meta['days'])}
+            self.nsteps = int(meta['nsteps'])
+            self.varnames = [str(v) for v in meta['varnames']]
+            rows, cols = meta['rows'], meta['cols']
+            self.lats = meta['lats'] if 'lats' in meta.files else None
+            self.lons = meta['lons'] if 'lons' in meta.files else None
+        self.cells = np.arange(len(rows)) if cells is None else np.arange(len(rows))[cells]
+        self.rows = rows[self.cells]
+        self.cols = cols[self.cells]
+        self.arrs = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['arrs'] = None
+        return state
+
+    def read(self,key):
+        '''Returns a dictionary with a (time, ncells) array for every variable
+        for the day given by key (YYYYMMDD).
+        '''
+        if self.arrs is None:
+            self.arrs = {v:np.load(self.path+"/"+v+".npy",mmap_mode="r") for v in self.varnames}
+        if key not in self.days:
+            raise KeyError(key + " is not in the time series in " + self.path)
+
+        i = self.days[key]*self.nsteps
+        return {v:np.array(a[i:i+self.nsteps][:,self.cells]) for v, a in self.arrs.items()}
+
+    def subset(self,cells):
+        '''Returns a new seriescache for only the grid cells in cells (an array
+        of indices or a boolean mask).
+        '''
+        return seriescache(self.path,self.cells[cells])
+
+'''*******************************************
+Event Storage
+*******************************************'''
+class eventbuffer:
+    '''A preallocated set of typed columns for collecting events (or any
+    other records) one batch at a time. Columns are numpy arrays that double
+    in size whenever they run out of room, so appending costs no more than
+    the values being added. Convert to a data frame once per month (or
+    whenever results are written to file) rather than after every event.
+
+    columns = a list of (name, dtype) pairs in the order they should appear
+        in the output (e.g., [("Year",int),("Precip",float)])
+    size = the number of rows to allocate at the start
+    '''
+    def __init__(self,columns,size=1024):
+        self.columns = [c[0] for c in columns]
+        self.dtypes = dict(columns)
+        self.size = max(int(size),1)
+        self.data = {c:np.empty(self.size,dtype=self.dtypes[c]) for c in self.columns}
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def grow(self,n):
+        '''Makes sure there is room for at least n rows.'''
+        if n > self.size:
+            self.size = max(n,2*self.size)
+            for c in self.columns:
+                arr = np.empty(self.size,dtype=self.dtypes[c])
+                arr[:self.n] = self.data[c][:self.n]
+                self.data[c] = arr
+
+    def append(self,**values):
+        '''Adds rows to the buffer. Each keyword is a column name and each
+        value is either a scalar (for one row) or an array with one entry per
+        row. Every column must be given the same number of rows.
+        '''
+        values = {c:np.atleast_1d(values[c]) for c in self.columns}
+        k = len(values[self.columns[0]])
+        if np.any([len(values[c]) != k for c in self.columns]):
+            raise ValueError("All columns must have the same number of rows.")
+
+        self.grow(self.n+k)
+        for c in self.columns:
+            self.data[c][self.n:self.n+k] = values[c]
+        self.n += k
+
+    def toDataFrame(self):
+        '''Returns the rows stored so far as a pandas data frame.'''
+        return pd.DataFrame({c:self.data[c][:self.n].copy() for c in self.columns},columns=self.columns)
+
+    def clear(self):
+        '''Empties the buffer but keeps the allocated space.'''
+        self.n = 0
+
+    def flush(self,path=None):
+        '''Returns the rows stored so far as a data frame (also writing them to
+        a csv file if a path is given) and empties the buffer.
+        '''
+        df = self.toDataFrame()
+        if path is not None:
+            df.to_csv(path,index=0)
+        self.clear()
+        return df
+
+# Columns of the precipitation event files
+eventcolumns = [("Year",int),("Month",int),("Day",int),("Hour",int),\
+    ("X",int),("Y",int),("Length",int),("Precip",float),("Snowfall",float),\
+    ("StSnoDep",float),("EdSnoDep",float),("MaxTSurf",float),("MinTSurf",float),\
+    ("MaxT2m",float),("MinT2m",float)]
+
+# Columns of the events returned by detectEvents -- start and end (i.e., the
+## hour the event was terminated) are in hours since reftime and Cell is the
+## index of the grid cell in the list of rows and cols
+detectcolumns = [("StartHr",np.int64),("EndHr",np.int64),("Cell",np.int64),\
+    ("Length",np.int64),("Precip",float),("Snowfall",float),("StSnoDep",float),\
+    ("EdSnoDep",float),("MaxTSurf",float),("MinTSurf",float),("MaxT2m",float),\
+    ("MinT2m",float)]
+
+# Extra columns recorded when an eventstate is created with means=True
+meancolumns = [("MeanTSurf",float),("MeanT2m",float),("WetHrs",np.int64)]
+
+'''*******************************************
+Precipitation Event Detection
+*******************************************'''
+class eventstate:
+    '''An object that holds the state of the precipitation event (if any) that
+    is active at each grid cell. Every attribute is an array with one entry per
+    grid cell so that all grid cells can be updated at once for each hour of
+    data instead of one at a time. Temperatures are kept as running
+    aggregates, so the size of the state does not depend on how long any
+    event lasts.
+
+    ncells = the number of grid cells being tracked
+    means = whether to also track the mean of each temperature and the
+        number of hours with measurable precip for each event
+    '''
+    def __init__(self,ncells,means=False):
+        self.means = means
+        self.evprec = np.zeros(ncells) # accumulated precip (mm)
+        self.evsnof = np.zeros(ncells) # accumulated snowfall (mm)
+        self.evhrs = np.zeros(ncells) # hours w/out measurable precip
+        self.st = np.zeros(ncells,dtype=np.int64) # start time (hours since reftime)
+        self.stsnod = np.zeros(ncells) # snow depth at start of event (m)
+        self.maxtsrf = np.repeat(-np.inf,ncells) # max surface temperature (K)
+        self.mintsrf = np.repeat(np.inf,ncells) # min surface temperature (K)
+        self.maxt2m = np.repeat(-np.inf,ncells) # max 2-m temperature (K)
+        self.mint2m = np.repeat(np.inf,ncells) # min 2-m temperature (K)
+        if means:
+            self.sumtsrf = np.zeros(ncells) # sum of surface temperature (K)
+            self.sumt2m = np.zeros(ncells) # sum of 2-m temperature (K)
+            self.wethrs = np.zeros(ncells,dtype=np.int64) # hours w/ measurable precip
+
+    def __len__(self):
+        return len(self.evprec)
+
+    def active(self):
+        '''Returns a boolean array that is True for every grid cell with an
+        active precipitation event.
+        '''
+        return self.evprec > 0
+
+    def fields(self):
+        '''Returns the names of the arrays that make up the state.'''
+        return [k for k, v in vars(self).items() if isinstance(v,np.ndarray)]
+
+    def columns(self):
+        '''Returns the columns of the events recorded by this eventstate (see
+        detectcolumns and meancolumns).
+        '''
+        return detectcolumns + (meancolumns if self.means else [])
+
+    def subset(self,ind):
+        '''Returns a new eventstate with only the grid cells in ind (an array
+        of indices or a boolean mask).
+        '''
+        sub = eventstate(0,self.means)
+        for k in self.fields():
+            setattr(sub,k,getattr(self,k)[ind])
+        return sub
+
+    def assign(self,ind,other):
+        '''Replaces the state of the grid cells in ind with the state held by
+        other (an eventstate with one grid cell for each entry of ind).
+        '''
+        for k in self.fields():
+            getattr(self,k)[ind] = getattr(other,k)
+
+    def combine(self,others):
+        '''Returns a new eventstate that has the grid cells of this eventstate
+        followed by those of each eventstate in the list others.
+        '''
+        new = eventstate(0,self.means)
+        for k in self.fields():
+            setattr(new,k,np.concatenate([getattr(self,k)]+[getattr(o,k) for o in others]))
+        return new
+
+    def reset(self,ind):
+        '''Clears the event state for the grid cells in ind (either an array
+        of indices or a boolean mask).
+        '''
+        self.evprec[ind] = 0
+        self.evsnof[ind] = 0
+        self.evhrs[ind] = 0
+        self.st[ind] = 0
+        self.stsnod[ind] = 0
+        self.maxtsrf[ind], self.mintsrf[ind] = -np.inf, np.inf
+        self.maxt2m[ind], self.mint2m[ind] = -np.inf, np.inf
+        if self.means:
+            self.sumtsrf[ind], self.sumt2m[ind], self.wethrs[ind] = 0, 0, 0
+
+    def update(self,t,prec,snof,snod,tsrf,t2m,rthresh,pthresh,hthresh,hrs=1):
+        '''Updates the event state of every grid cell with one time step of
+        data. New events are started wherever there is measurable precip and
+        no active event, precip and temperature are accumulated wherever there
+        is measurable precip, and the gap is tallied wherever an active event
+        has no measurable precip. Once the gap reaches hthresh, the event is
+        terminated (and recorded if its total precip is at least pthresh).
+
+        t = the time step of the data (integer hours since reftime)
+        prec, snof = arrays of precip and snowfall (mm) for each grid cell
+        snod = array of snow depth (m) for each grid cell
+        tsrf, t2m = arrays of surface and 2-m air temperature (K)
+        rthresh = minimum precip rate (mm/hr) that counts as measurable
+        pthresh = minimum total precip (mm) for an event to be recorded
+        hthresh = hours w/out measurable precip needed to end an event
+        hrs = temporal resolution of the data in hours
+
+        Returns (1) an array with the index of each grid cell for which an
+        event was recorded and (2) a dictionary of arrays that hold the
+        characteristics of those events (start time in hours since reftime,
+        length in hours, precip, snowfall, start and end snow depth, the max
+        and min of each temperature, and if means is True, the mean of each
+        temperature and the number of hours with measurable precip).
+        '''
+        prec = np.asarray(prec)
+
+        # For any grid cell with measurable precip...
+        wet = prec >= rthresh
+
+        # ...initiate new events where none are active. Go back 1 hr because
+        ## precip is accumulated over the past hour
+        new = wet & (self.evprec == 0)
+        self.st[new] = t - 1
+        self.stsnod[new] = np.asarray(snod)[new]
+        self.evhrs[new] = 0
+
+        # Add the new precip, snowfall, and temp
+        self.evprec[wet] += prec[wet]
+        self.evsnof[wet] += np.asarray(snof)[wet]
+        self.maxtsrf[wet] = np.maximum(self.maxtsrf[wet],np.asarray(tsrf)[wet])
+        self.mintsrf[wet] = np.minimum(self.mintsrf[wet],np.asarray(tsrf)[wet])
+        self.maxt2m[wet] = np.maximum(self.maxt2m[wet],np.asarray(t2m)[wet])
+        self.mint2m[wet] = np.minimum(self.mint2m[wet],np.asarray(t2m)[wet])
+        if self.means:
+            self.sumtsrf[wet] += np.asarray(tsrf)[wet]
+            self.sumt2m[wet] += np.asarray(t2m)[wet]
+            self.wethrs[wet] += 1
+
+        # For any active event w/out measurable precip, add to the tally (an
+        ## hour with missing precip is neither wet nor dry)
+        dry = np.isfinite(prec) & (~wet) & (self.evprec > 0)
+        self.evhrs[dry] += hrs
+
+        # Terminate events for which the threshold of no-precip hours has past
+        end = dry & (self.evhrs >= hthresh)
+
+        # Record those with sufficient precip
+        ei = np.where(end & (self.evprec >= pthresh))[0]
+        events = {"StartHr":self.st[ei], "Length":t-self.st[ei]-hthresh,\
+            "Precip":self.evprec[ei], "Snowfall":self.evsnof[ei],\
+            "StSnoDep":self.stsnod[ei], "EdSnoDep":np.asarray(snod)[ei],\
+            "MaxTSurf":self.maxtsrf[ei], "MinTSurf":self.mintsrf[ei],\
+            "MaxT2m":self.maxt2m[ei], "MinT2m":self.mint2m[ei]}
+        if self.means:
+            events["MeanTSurf"] = self.sumtsrf[ei]/self.wethrs[ei]
+            events["MeanT2m"] = self.sumt2m[ei]/self.wethrs[ei]
+            events["WetHrs"] = self.wethrs[ei]
+
+        # Reset values
+        self.reset(end)
+
+        return ei, events
+
+def legacyState(active,reftime=[1900,1,1,0,0,0]):
+    '''Converts a carry-over file written by the older version of stage 1,
+    which held [evprec,evsnof,evhrs,evtsrf,evt2m,st,stsnod] with a list of
+    temperatures and a start date list for each grid cell, to an eventstate.
+
+    active = the list loaded from the old ActiveEvents pickle
+    reftime = the reference time for the start of each event
+    '''
+    evprec, evsnof, evhrs, evtsrf, evt2m, st, stsnod = active
+
+    state = eventstate(len(evprec))
+    state.evprec = np.array(evprec,dtype=float)
+    state.evsnof = np.array(evsnof,dtype=float)
+    state.evhrs = np.array(evhrs,dtype=float)
+    state.stsnod = np.array(stsnod,dtype=float)
+
+    for i in np.where(state.active())[0]:
+        state.st[i] = (toDatetime64(st[i]) - toDatetime64(reftime)).astype(np.int64)
+        state.maxtsrf[i], state.mintsrf[i] = np.max(evtsrf[i]), np.min(evtsrf[i])
+        state.maxt2m[i], state.mint2m[i] = np.max(evt2m[i]), np.min(evt2m[i])
+
+    return state
+
+# Version of the checkpoint format written by writeState
+stateversion = 1
+
+def writeState(state,path,rows=None,cols=None):
+    '''Writes an eventstate to a checkpoint file (an uncompressed .npz with
+    one fixed-width array per field), along with the format version and the
+    rows and columns of the grid cells so that the file can be checked
+    against the grid when it is loaded. The file is written to a temporary
+    name first and then moved into place, so an interrupted run never leaves
+    a partial checkpoint behind.
+
+    state = the eventstate to save
+    path = the file path (should end in .npz)
+    rows, cols = arrays with the row and column of each grid cell (optional)
+    '''
+    arrays = {k:getattr(state,k) for k in state.fields()}
+    arrays['version'] = np.array(stateversion)
+    arrays['means'] = np.array(state.means)
+    if rows is not None:
+        arrays['rows'] = np.asarray(rows,dtype=np.int64)
+        arrays['cols'] = np.asarray(cols,dtype=np.int64)
+
+    with open(path+".tmp","wb") as f:
+        np.savez(f,**arrays)
+    os.replace(path+".tmp",path)
+
+def readState(path,rows=None,cols=None,reftime=[1900,1,1,0,0,0]):
+    '''Loads an eventstate from a checkpoint file written by writeState. Older
+    pickle files (either a pickled eventstate or the list-based format of
+    the first version of stage 1) are also accepted if the path ends in .pkl.
+
+    path = the file path
+    rows, cols = arrays with the row and column of each grid cell; if given,
+        they must match the grid cells stored in the checkpoint
+    reftime = the reference time (only used for list-based pickles)
+
+    Returns an eventstate.
+    '''
+    if path.endswith(".pkl"):
+        state = pd.read_pickle(path)
+        if isinstance(state,list):
+            state = legacyState(state,reftime)
+        if rows is not None and len(state) != len(rows):
+            raise ValueError(path + " has " + str(len(state)) + " grid cells, but the grid has " + str(len(rows)))
+        return state
+
+    with np.load(path) as f:
+        if int(f['version']) != stateversion:
+            raise ValueError(path + " is checkpoint version " + str(int(f['version'])) + \
+                             ", but version " + str(stateversion) + " is expected")
+        if rows is not None:
+            if 'rows' not in f or not (np.array_equal(f['rows'],rows) and np.array_equal(f['cols'],cols)):
+                raise ValueError(path + " does not match the grid cells of the region")
+
+        state = eventstate(0,bool(f['means']))
+        for k in state.fields():
+            setattr(state,k,f[k])
+
+    return state
+
+def latestState(path,prefix="Active_"):
+    '''Finds the most recent checkpoint written by writeState to a directory
+    (files named prefix+YYYYMM+".npz", where YYYYMM is the month that the
+    checkpoint is the start of).
+
+    path = the directory of checkpoints
+
+    Returns a date list for the start of that month, or None if there are
+    no checkpoints.
+    '''
+    regex = re.compile("^"+re.escape(prefix)+r"(\d{4})(\d{2})\.npz$")
+    yms = sorted([m.groups() for m in [regex.match(f) for f in os.listdir(path)] if m is not None])
+    if len(yms) == 0:
+        return None
+
+    return [int(yms[-1][0]),int(yms[-1][1]),1,0,0,0]
+
+def detectEvents(reader,starttime,endtime,rthresh,pthresh,hthresh,hrs=1,\
+        pconversion=3600,state=None,reftime=[1900,1,1,0,0,0],\
+        varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M'],means=False,lookahead=1,\
+        tracker=None):
+    '''Identifies precipitation events at every grid cell of a dailyreader for
+    each day from starttime (inclusive) to endtime (exclusive).
+
+    reader = a dailyreader for the grid cells of interest
+    starttime, endtime = date lists in the format [Y,M,D,H,M,S]
+    rthresh, pthresh, hthresh, hrs = see eventstate.update
+    pconversion = factor that converts the precip variables to mm
+    state = the eventstate at starttime (e.g., from the previous month); if
+        None, there are no active events at starttime
+    reftime = the reference time for all time steps
+    varnames = names of the precip, snowfall, snow depth, surface temperature,
+        and 2-m temperature variables (in that order)
+    means = whether to also record mean temperatures and the number of hours
+        with measurable precip (only used if state is None)
+    lookahead = the number of days to read ahead in a background thread
+        while the current day is processed (see prefetcher)
+    tracker = a freezetracker to count frozen hours after each event from the
+        same data (optional); each recorded event is added as it terminates,
+        with the id EndHr*ncells + Cell, and every time step of surface
+        temperature is passed to it as a frozen mask (TSURF <= 273.15 K)
+
+    Returns (1) a data frame of recorded events in the order they were
+    terminated (see eventstate.columns) and (2) the eventstate at endtime.
+    '''
+    edfs, states = detectEventsSweep(reader,starttime,endtime,[(rthresh,pthresh,hthresh)],\
+                        hrs,pconversion,(None if state is None else [state]),reftime,varnames,means,lookahead,\
+                        (None if tracker is None else [tracker]))
+
+    return edfs[0], states[0]
+
+def detectEventsSweep(reader,starttime,endtime,thresholds,hrs=1,pconversion=3600,\
+        states=None,reftime=[1900,1,1,0,0,0],\
+        varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M'],means=False,lookahead=1,\
+        trackers=None):
+    '''Runs detectEvents for several sets of thresholds at once. Each set of
+    thresholds keeps its own eventstate, but every day of data is only read
+    once and shared by all of them, so a sweep of many thresholds costs about
+    as much disk access as a single run.
+
+    thresholds = a list of (rthresh, pthresh, hthresh) tuples
+    states = a list with the eventstate at starttime for each set of
+        thresholds; if None, there are no active events at starttime
+    trackers = a list with a freezetracker for each set of thresholds
+        (optional; see detectEvents)
+    all other arguments are the same as for detectEvents
+
+    Returns (1) a list with a data frame of recorded events and (2) a list
+    of eventstates at endtime, each in the same order as thresholds.
+    '''
+    if states is None:
+        states = [eventstate(len(reader.rows),means) for th in thresholds]
+    bufs = [eventbuffer(state.columns()) for state in states]
+
+    # Read all time steps of each variable for the day at once (the next day
+    ## is read in the background while this one is processed)
+    days = dayKeys(starttime,endtime,reftime)
+    for (dkey, t0), (key, data) in zip(days,prefetcher(reader,[k for k, t in days],lookahead)):
+        if dkey != key:
+            raise ValueError("Read " + key + " for " + dkey)
+        # Converted in the type of the data (float32 for MERRA2), as in the
+        ## original, so that values near the thresholds fall on the same side
+        prec = data[varnames[0]]*pconversion
+        snof = data[varnames[1]]*pconversion
+        snod, tsrf, t2m = data[varnames[2]], data[varnames[3]], data[varnames[4]]
+
+        for h in range(prec.shape[0]): # For each hour of the day...
+            t = t0 + h*hrs
+            for i, ((rthresh, pthresh, hthresh), state, buf) in enumerate(zip(thresholds,states,bufs)):
+                ei, ev = state.update(t,prec[h],snof[h],snod[h],tsrf[h],t2m[h],rthresh,pthresh,hthresh,hrs)
+                buf.append(EndHr=np.repeat(t,len(ei)),Cell=ei,**ev)
+
+                # Start counting frozen hours for the events that just
+                ## terminated (from the start of this call at the earliest,
+                ## like stage 2 does for the events of each month)
+                if trackers is not None:
+                    trackers[i].add(t*len(reader.rows)+ei,ei,np.repeat(t-hthresh,len(ei)),days[0][1])
+
+            if trackers is not None:
+                frozen = np.asarray(tsrf[h]) <= 273.15 # units are Kelvin
+                for tracker in trackers:
+                    tracker.update(t,frozen)
+
+    return [buf.toDataFrame() for buf in bufs], states
+
+def stitchEvents(reader,chunks,rthresh,pthresh,hthresh,hrs=1,pconversion=3600,\
+        reftime=[1900,1,1,0,0,0],varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M']):
+    '''Combines the output of detectEvents for consecutive chunks of time
+    that were each started with no active events so that the result is the
+    same as running detectEvents once over the whole period. For each chunk,
+    any grid cell that had an active event at the end of the chunk before it
+    is run again from the start of the chunk twice -- once carrying the
+    active event forward and once without it -- until the two runs reach an
+    hour with no active event in either. Events from the run without the
+    carry-over are then replaced by those from the run with it up to that
+    hour. Only the first day or so of each chunk usually has to be re-read.
+
+    reader = the dailyreader used for every chunk
+    chunks = a list of (starttime, endtime, events, state) for each chunk in
+        time order, where events and state are the outputs of detectEvents
+    all other arguments are the same as for detectEvents
+
+    Returns (1) a data frame of all events, sorted by the hour they were
+    terminated and then by grid cell (the same order as a serial run), and
+    (2) a list of the corrected eventstate at the end of each chunk.
+    '''
+    edfs, states = [chunks[0][2]], [chunks[0][3]]
+
+    for starttime, endtime, edf, state in chunks[1:]:
+        # Identify grid cells with an active event carried over from before
+        cells = np.where(states[-1].active())[0]
+
+        if len(cells) > 0:
+            warm = states[-1].subset(cells) # with the carry-over
+            cold = eventstate(len(cells),warm.means) # without the carry-over
+            synced = np.repeat(-1,len(cells)) # hour when both runs matched
+            buf = eventbuffer(warm.columns())
+            sub = reader.subset(cells)
+
+            for key, t0 in dayKeys(starttime,endtime,reftime):
+                data = sub.read(key)
+                prec = data[varnames[0]]*pconversion
+                snof = data[varnames[1]]*pconversion
+                snod, tsrf, t2m = data[varnames[2]], data[varnames[3]], data[varnames[4]]
+
+                for h in range(prec.shape[0]):
+                    t = t0 + h*hrs
+                    ei, ev = warm.update(t,prec[h],snof[h],snod[h],tsrf[h],t2m[h],rthresh,pthresh,hthresh,hrs)
+                    cold.update(t,prec[h],snof[h],snod[h],tsrf[h],t2m[h],rthresh,pthresh,hthresh,hrs)
+
+                    # Keep events from the run with the carry-over until synced
+                    keep = synced[ei] < 0
+                    buf.append(EndHr=np.repeat(t,keep.sum()),Cell=cells[ei[keep]],\
+                               **{k:v[keep] for k, v in ev.items()})
+
+                    # Once neither run has an active event, they stay the same
+                    synced[(synced < 0) & ~warm.active() & ~cold.active()] = t
+
+                if np.all(synced >= 0):
+                    break
+
+            # Swap out events from the run without the carry-over
+            lastHr = pd.Series(np.where(synced >= 0,synced,np.iinfo(np.int64).max),index=cells)
+            drop = edf['Cell'].isin(cells) & (edf['EndHr'] <= edf['Cell'].map(lastHr))
+            edf = pd.concat([edf[~drop],buf.toDataFrame()],ignore_index=True)
+
+            # Grid cells that never synced end the chunk in the carry-over run's state
+            state.assign(cells[synced < 0],warm.subset(synced < 0))
+
+        edfs.append(edf)
+        states.append(state)
+
+    events = pd.concat(edfs,ignore_index=True)
+    events = events.sort_values(['EndHr','Cell'],kind='stable').reset_index(drop=True)
+
+    return events, states
+
+def detectEventsParallel(reader,chunktimes,rthresh,pthresh,hthresh,hrs=1,\
+        pconversion=3600,state=None,reftime=[1900,1,1,0,0,0],\
+        varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M'],means=False,ncores=None):
+    '''Runs detectEvents for several chunks of time at once in a pool of
+    processes and then stitches the chunks together (see stitchEvents). Any
+    script that calls this must do so from inside an
+    if __name__ == "__main__": block.
+
+    chunktimes = a list of (starttime, endtime) pairs for each chunk in time
+        order, with each endtime equal to the next starttime
+    state = the eventstate at the start of the first chunk (if any)
+    ncores = the number of processes (default is the number of CPUs)
+    all other arguments are the same as for detectEvents
+
+    The eventstate is only known at the end of each chunk once every chunk
+    has finished, so checkpoints (see writeState) can only be made at chunk
+    boundaries after this returns, not monthly. A run that is interrupted
+    starts again from its beginning; shorter runs (or a single process,
+    which checkpoints every month) lose less work.
+
+    Returns the same outputs as stitchEvents.
+    '''
+    with ProcessPoolExecutor(ncores) as pool:
+        futures = [pool.submit(detectEvents,reader,st,ed,rthresh,pthresh,hthresh,\
+                    hrs,pconversion,(state if i == 0 else None),reftime,varnames,means) \
+                    for i, (st, ed) in enumerate(chunktimes)]
+        results = [f.result() for f in futures]
+
+    chunks = [(chunktimes[i][0],chunktimes[i][1],results[i][0],results[i][1]) for i in range(len(chunktimes))]
+
+    return stitchEvents(reader,chunks,rthresh,pthresh,hthresh,hrs,pconversion,reftime,varnames)
+
+def detectEventsTile(reader,cells,monthtimes,rthresh,pthresh,hthresh,hrs=1,\
+        pconversion=3600,state=None,reftime=[1900,1,1,0,0,0],\
+        varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M'],means=False,tilepath="."):
+    '''Runs detectEvents month by month over the whole time period for one
+    tile (a subset of the grid cells of a reader). The events and the
+    eventstate at the end of each month are written to tilepath as
+    Events_YYYYMM.csv and Active_YYYYMM.npz (named for the month they start),
+    with Cell still referring to the grid cell's index in the full reader.
+
+    cells = array with the index of each grid cell in the tile
+    monthtimes = list of date lists that break up the time period (usually
+        the start of each month), ending with the end of the period
+    state = the eventstate of the tile's grid cells at the start (if any)
+    tilepath = directory to write the output to (created if needed)
+    all other arguments are the same as for detectEvents
+
+    Returns tilepath.
+    '''
+    os.makedirs(tilepath,exist_ok=True)
+    sub = reader.subset(cells)
+
+    for m in range(len(monthtimes)-1):
+        YM = "%04d%02d" % tuple(monthtimes[m][:2])
+        edf, state = detectEvents(sub,monthtimes[m],monthtimes[m+1],rthresh,pthresh,\
+                        hthresh,hrs,pconversion,state,reftime,varnames,means)
+        edf['Cell'] = cells[edf['Cell'].values]
+
+        edf.to_csv(tilepath+"/Events_"+YM+".csv",index=0)
+        writeState(state,tilepath+"/Active_"+YM+".npz",sub.rows,sub.cols)
+
+    return tilepath
+
+def detectEventsTiled(reader,monthtimes,rthresh,pthresh,hthresh,hrs=1,\
+        pconversion=3600,state=None,reftime=[1900,1,1,0,0,0],\
+        varnames=['PRECTOTLAND','PRECSNOLAND','SNODP','TSURF','T2M'],means=False,\
+        ntiles=2,ncores=None,tmppath="."):
+    '''Splits the grid cells of a reader into ntiles tiles and runs
+    detectEventsTile for each tile in a pool of processes. Because the
+    event history of each grid cell does not depend on any other grid cell,
+    no stitching is needed -- use mergeTiles to combine the tiles for each
+    month. Tiles are consecutive runs of grid cells, so each covers a band
+    of rows and only that band is read from each file. Any script that calls
+    this must do so from inside an if __name__ == "__main__": block.
+
+    ntiles = the number of tiles
+    ncores = the number of processes (default is the number of CPUs)
+    tmppath = directory in which a folder is made for each tile's output
+    all other arguments are the same as for detectEventsTile
+
+    Returns a list of the directories with each tile's output.
+    '''
+    tiles = np.array_split(np.arange(len(reader.rows)),ntiles)
+
+    with ProcessPoolExecutor(ncores) as pool:
+        futures = [pool.submit(detectEventsTile,reader,tiles[i],monthtimes,rthresh,\
+                    pthresh,hthresh,hrs,pconversion,(None if state is None else state.subset(tiles[i])),\
+                    reftime,varnames,means,tmppath+"/Tile"+str(i)) for i in range(len(tiles))]
+        tilepaths = [f.result() for f in futures]
+
+    return tilepaths
+
+def mergeTiles(tilepaths,YM):
+    '''Combines the output of detectEventsTile from each tile for one month.
+
+    tilepaths = list of tile directories in the order of their grid cells
+        (as returned by detectEventsTiled)
+    YM = the month to combine (YYYYMM)
+
+    Returns (1) a data frame of all events for the month, sorted by the hour
+    they were terminated and then by grid cell (the same order as a single
+    run of detectEvents), and (2) the eventstate of all grid cells at the
+    end of the month.
+    '''
+    # Read with the types of detectEvents, since a tile with no events in the
+    ## month has only a header (which would otherwise be read as objects)
+    dtypes = dict(detectcolumns+meancolumns)
+    edf = pd.concat([pd.read_csv(tp+"/Events_"+YM+".csv",dtype=dtypes,float_precision="round_trip") \
+            for tp in tilepaths],ignore_index=True)
+    edf = edf.sort_values(['EndHr','Cell'],kind='stable').reset_index(drop=True)
+
+    states = [readState(tp+"/Active_"+YM+".npz") for tp in tilepaths]
+
+    return edf, states[0].combine(states[1:])
+
+def eventTable(events,rows,cols,reftime=[1900,1,1,0,0,0]):
+    '''Converts the output of detectEvents into the format of the precip
+    event files (see eventcolumns, plus meancolumns if they were recorded),
+    with the start time split into year, month, day, and hour, grid cell
+    locations as X (column) and Y (row), and temperatures converted to deg C.
+
+    events = a data frame from detectEvents or stitchEvents
+    rows, cols = arrays with the row and column of each grid cell
+    '''
+    Y, M, D, H = hoursToDates(events['StartHr'].values,reftime)
+
+    pdf = pd.DataFrame({"Year":Y, "Month":M, "Day":D, "Hour":H,\
+        "X":np.asarray(cols)[events['Cell'].values], "Y":np.asarray(rows)[events['Cell'].values]},\
+        index=events.index)
+    for c in [c[0] for c in eventcolumns[6:]+meancolumns]:
+        if c in events.columns:
+            pdf[c] = events[c]
+
+    # Unit Conversions
+    for c in ['MaxTSurf','MinTSurf','MaxT2m','MinT2m','MeanTSurf','MeanT2m']:
+        if c in pdf.columns:
+            pdf[c] = pdf[c] - 273.15
+
+    return pdf.reset_index(drop=True)
+
+'''*******************************************
+Event Catalog
+*******************************************'''
+def catalogFile(path,YM):
+    '''Returns the path of the file that holds one month (YYYYMM) of an event
+    catalog. Months are grouped into a folder for each year.
+    '''
+    return path+"/"+YM[:4]+"/"+YM+".parquet"
+
+# Types of the columns of an event catalog (the event files of stage 1, plus
+## the columns added by stage 2 and stage 3); Frz columns are float, and any
+## other column that has no type (e.g., read from a csv file with no rows) is
+## written as float
+catalogtypes = dict([(c,(np.int64 if t in (int,np.int64) else float)) for c, t in eventcolumns+meancolumns] + \
+    [("Rain",float),("Ice",np.int64),("EndTime",np.int64),("SID",float),("CMonth",float),("CYear",float)])
+
+def catalogTypes(df):
+    '''Returns a copy of df with each column cast to its type in an event
+    catalog (see catalogtypes), so that every month of a catalog has the same
+    schema whether or not it has any events.
+    '''
+    types = {}
+    for c in df.columns:
+        if c in catalogtypes:
+            types[c] = catalogtypes[c]
+        elif c.startswith("Frz") or (df[c].dtype == object and df[c].isna().all()):
+            types[c] = float
+
+    return df.astype(types)
+
+def writeCatalog(df,path,YM,rowgroup=4096):
+    '''Writes one month of events to a columnar (Parquet) event catalog. Rows
+    are sorted by grid cell (Y, then X) and written in row groups of a fixed
+    size, so that the min/max statistics that Parquet keeps for each row
+    group let readCatalog skip every row group that does not hold the grid
+    cells it is asked for. Any existing file for the month is replaced.
+    Columns are cast to the types in catalogtypes first. Requires pyarrow
+    (or fastparquet).
+
+    df = a data frame of events (e.g., the output of eventTable)
+    path = the directory of the catalog
+    YM = the month that the events belong to (YYYYMM)
+    rowgroup = the number of rows in each row group
+    '''
+    f = catalogFile(path,YM)
+    os.makedirs(os.path.dirname(f),exist_ok=True)
+
+    df = catalogTypes(df)
+    df = df.sort_values(['Y','X'],kind='stable') if len(df) > 0 else df
+    df.to_parquet(f+".tmp",index=False,row_group_size=rowgroup)
+    os.replace(f+".tmp",f)
+
+def readCatalog(path,starttime=None,endtime=None,filters=None,columns=None):
+    '''Reads events from an event catalog made by writeCatalog. Only the
+    files for months from starttime (inclusive) to endtime (exclusive) are
+    opened, and filters are pushed down to Parquet so that only the row
+    groups (and columns) that are needed are read from disk. Each month is
+    read on its own and cast to the types in catalogtypes, so months written
+    without a schema (e.g., with no events) do not change the types of the
+    others.
+
+    path = the directory of the catalog
+    starttime, endtime = date lists in the format [Y,M,D,H,M,S] (default
+        is every month in the catalog)
+    filters = a list of (column, operator, value) tuples that every row must
+        satisfy, e.g. [("X","==",col),("Y","==",row),("Ice",">",0)]
+    columns = list of the columns to read (default is all of them)
+
+    Returns a data frame of events in the order of their months.
+    '''
+    s = "000000" if starttime is None else "%04d%02d" % tuple(starttime[:2])
+    e = "999999" if endtime is None else "%04d%02d" % tuple(endtime[:2])
+
+    yms = [ym for ym in catalogMonths(path) if s <= ym < e]
+    if len(yms) == 0:
+        raise FileNotFoundError("No months of " + path + " in the time period")
+
+    dfs = [catalogTypes(pd.read_parquet(catalogFile(path,ym),filters=filters,columns=columns)) for ym in yms]
+    dfs = [df for df in dfs if len(df) > 0] or dfs[:1]
+
+    return catalogTypes(pd.concat(dfs,ignore_index=True))
+
+def catalogMonths(path):
+    '''Returns a sorted list of the months (YYYYMM) in an event catalog made by
+    writeCatalog (an empty list if the catalog does not exist yet).
+    '''
+    if not os.path.isdir(path):
+        return []
+
+    return sorted([f[:6] for yd in os.listdir(path) if os.path.isdir(path+"/"+yd) \
+                    for f in os.listdir(path+"/"+yd) if f.endswith(".parquet")])
+
+'''*******************************************
+Event Classes
+*******************************************'''
+# Each class of event is a list of conditions that must all be met. A condition
+## is either the name of another class or a (column, operator, value) tuple,
+## where the value is a number (or list for "in") or the name of a threshold
+## that is looked up when the rules are evaluated (see evaluateRules)
+eventrules = {
+    # Icing (rain on snow that melted the snowpack, rain on frozen bare
+    ## ground, and rain on snow that left snow behind)
+    "Ice1":[("MaxT2m",">","tthresh"),("Rain",">","pthresh"),("StSnoDep",">","sthresh"),("EdSnoDep","<=","sthresh")],
+    "Ice2":[("MaxT2m",">","tthresh"),("Rain",">","pthresh"),("StSnoDep","<=","sthresh"),("MaxTSurf","<=",0)],
+    "Ice3":[("MaxT2m",">","tthresh"),("Rain",">","pthresh"),("StSnoDep",">","sthresh"),("EdSnoDep",">","sthresh")],
+    # Rain on snow (enough rain w/ a valid icing class) and whether or not the
+    ## surface stayed frozen for most of the next 30 days
+    "ROS":[("Ice","in","vice"),("Rain",">=","minrain")],
+    "ROSF":["ROS",("Frz30",">=","f30thresh")],
+    "ROSNonF":["ROS",("Frz30","<","f30thresh")],
+    # Snow on snow (enough precip, but little rain, on a lasting snowpack)
+    "SOS":[("Precip",">=","minprecip"),("Rain","<","maxrain"),("StSnoDep",">","sthresh"),("EdSnoDep",">","sthresh")]
+    }
+
+ruleops = {">":np.greater, ">=":np.greater_equal, "<":np.less, "<=":np.less_equal, "==":np.equal, "!=":np.not_equal}
+
+def evaluateRules(df,classes,thresholds,rules=eventrules):
+    '''Decides which events belong to each class of event. Every condition is
+    evaluated as an array operation over all events, and if a list of
+    threshold sets is given, over all sets at once (each condition that uses
+    a threshold compares the column to a column vector of its values), so a
+    sensitivity test of many thresholds takes a single call.
+
+    Rain is computed as Precip - Snowfall if there is no Rain column. The Ice
+    column is recomputed from the Ice1, Ice2, and Ice3 rules if tthresh is
+    one of the thresholds (e.g., to test other icing thresholds on output
+    that has already been classified); otherwise the column in df is used.
+
+    df = a data frame of events (e.g., from a catalog)
+    classes = the name of a class or a list of names (keys of rules)
+    thresholds = a dictionary of threshold name : value (e.g., {"minrain":2.54,
+        "vice":[3]}), or a list of such dictionaries
+    rules = a dictionary of class name : list of conditions (see eventrules)
+
+    Returns a boolean array with a row for each event and a column for each
+    class (no column axis if classes is a single name), with an extra first
+    axis for each threshold set if thresholds is a list.
+    '''
+    sets = [thresholds] if isinstance(thresholds,dict) else list(thresholds)
+    names = [classes] if isinstance(classes,str) else list(classes)
+    masks = {}
+
+    def column(c):
+        if c == "Ice" and np.all(["tthresh" in ts for ts in sets]):
+            return member("Ice1")*1 + member("Ice2")*2 + member("Ice3")*3
+        if c == "Rain" and "Rain" not in df.columns:
+            return (np.asarray(df['Precip']) - np.asarray(df['Snowfall']))[np.newaxis,:]
+        return np.asarray(df[c])[np.newaxis,:]
+
+    def member(name):
+        if name not in masks:
+            m = np.ones((len(sets),len(df)),dtype=bool)
+            for cond in rules[name]:
+                if isinstance(cond,str):
+                    m = m & member(cond)
+                    continue
+                c, op, v = cond
+                x = column(c)
+                vals = [ts[v] for ts in sets] if isinstance(v,str) else [v]*len(sets)
+                if op == "in":
+                    m = m & np.array([np.isin(x[min(i,len(x)-1)],vals[i]) for i in range(len(sets))])
+                else:
+                    m = m & ruleops[op](x,np.array(vals)[:,np.newaxis])
+            masks[name] = m
+        return masks[name]
+
+    out = np.stack([member(n) for n in names],axis=-1)
+    if isinstance(classes,str):
+        out = out[...,0]
+    if isinstance(thresholds,dict):
+        out = out[0]
+
+    return out
+
+def classifyIce(pdf,tthresh,pthresh,sthresh):
+    '''Classifies precip events by whether (and how) they could leave ice
+    behind, following the Ice1, Ice2, and Ice3 rules in eventrules (all other
+    events are 0).
+
+    pdf = a data frame of events (e.g., the output of eventTable, with
+        temperatures in deg C)
+    tthresh = minimum temperature (deg C) for which rain can be detected
+    pthresh = minimum rain (mm)
+    sthresh = minimum snow depth (m)
+
+    Returns an integer array with the class of each event.
+    '''
+    ice = evaluateRules(pdf,["Ice1","Ice2","Ice3"],{"tthresh":tthresh,"pthresh":pthresh,"sthresh":sthresh})
+
+    return ice @ np.array([1,2,3])
+
+'''*******************************************
+Freezing After Events
+*******************************************'''
+def countFrozen(frozen,t0,cells,ends,starts,windows,tend):
+    '''Counts the hours with a frozen surface in windows that follow the end of
+    each event, using a cumulative sum of the frozen hours at each grid cell
+    so that each count is the difference of two lookups. The window of
+    length w for an event that ended at hour E holds the hours from E+1 to
+    E+w (inclusive), but no hours before the hour given by starts (i.e.,
+    when counting started for that event) or after tend-1 are counted.
+
+    frozen = a (time, ncells) boolean array that is True where the surface
+        is frozen, with the first time step at hour t0, or a list of them in
+        time order (e.g., one for each day), which are not joined whole --
+        only the columns of the grid cells in cells are summed
+    t0 = the time of the first row of frozen (hours since reftime)
+    cells = array with the column of frozen for each event
+    ends = array with the end time of each event (hours since reftime)
+    starts = array with the first hour that can be counted for each event
+    windows = list of window lengths in hours (e.g., [24,240,720,2160])
+    tend = the hour after the last hour of data that has been read
+
+    Returns a dictionary of window length : array of frozen hours for each
+    event.
+    '''
+    ucells, cells = np.unique(np.asarray(cells),return_inverse=True)
+    ends = np.asarray(ends).astype(np.int64)
+    starts = np.asarray(starts).astype(np.int64)
+    t0, tend = int(np.round(t0)), int(np.round(tend))
+
+    if isinstance(frozen,(list,tuple)):
+        frozen = np.concatenate([f[:,ucells] for f in frozen]) if len(frozen) > 0 else np.zeros((0,len(ucells)),dtype=bool)
+    else:
+        frozen = frozen[:,ucells]
+
+    csum = np.zeros((frozen.shape[0]+1,frozen.shape[1]),dtype=np.int32)
+    np.cumsum(frozen,axis=0,out=csum[1:])
+
+    lo = np.maximum(ends+1,starts) - t0
+    counts = {}
+    for w in windows:
+        hi = np.maximum(np.minimum(ends+w,tend-1)+1-t0,lo)
+        counts[w] = csum[hi,cells] - csum[lo,cells]
+
+    return counts
+
+class freezetracker:
+    '''An object that counts frozen hours after events hour by hour as the
+    data are read (instead of after the fact like countFrozen). Events are
+    kept in a ring buffer sorted by end time, so the events whose window of
+    length w covers hour t (i.e., those that ended from t-w to t-1) are
+    always one contiguous slice, found by binary search. Events leave the
+    front of the buffer when they are popped, so the work for each hour
+    depends only on the number of events with an open window.
+
+    windows = list of window lengths in hours (e.g., [24,240,720,2160])
+    size = the number of events to allocate space for at first (the buffer
+        grows as needed)
+    history = the number of most recent time steps passed to update to keep,
+        so that events added late (e.g., when they are terminated a few
+        hours after they ended) can still count those hours
+    '''
+    def __init__(self,windows,size=1024,history=0):
+        self.windows = list(windows)
+        self.ids = np.zeros(size,dtype=np.int64)
+        self.cells = np.zeros(size,dtype=np.int64)
+        self.ends = np.zeros(size,dtype=np.int64)
+        self.counts = np.zeros((size,len(self.windows)),dtype=np.int32)
+        self.head, self.tail = 0, 0 # events are in [head, tail)
+        self.recent = deque(maxlen=history) # (t, frozen) for the latest time steps
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def compact(self,n):
+        '''Moves the events to the front of the buffer, growing the buffer if
+        it cannot hold n more events.
+        '''
+        size = len(self.ends)
+        if len(self) + n > size:
+            size = max(2*size,len(self)+n)
+        for k in ['ids','cells','ends','counts']:
+            old = getattr(self,k)
+            new = np.zeros((size,)+old.shape[1:],dtype=old.dtype)
+            new[:len(self)] = old[self.head:self.tail]
+            setattr(self,k,new)
+        self.head, self.tail = 0, len(self)
+
+    def add(self,ids,cells,ends,start=None):
+        '''Starts tracking new events. Counting begins with the next call to
+        update, except that if start is given, hours from start onward that
+        are still held in the history are counted right away.
+
+        ids = array with an identifier for each event (returned by pop)
+        cells = array with the grid cell of each event (its column in the
+            frozen arrays passed to update)
+        ends = array with the end time of each event (hours since reftime)
+        start = the first hour that can be counted for these events
+        '''
+        ids, cells, ends = np.asarray(ids), np.asarray(cells), np.asarray(ends).astype(np.int64)
+        if self.tail + len(ends) > len(self.ends):
+            self.compact(len(ends))
+
+        o = np.argsort(ends,kind='stable')
+        i0, i1 = self.tail, self.tail + len(ends)
+        self.ids[i0:i1], self.cells[i0:i1], self.ends[i0:i1] = ids[o], cells[o], ends[o]
+        self.counts[i0:i1] = 0
+        self.tail = i1
+
+        # Count the hours that passed before the events were added
+        if start is not None:
+            for th, fr in self.recent:
+                ok = (th >= np.maximum(self.ends[i0:i1]+1,start)) & fr[self.cells[i0:i1]]
+                for k, w in enumerate(self.windows):
+                    self.counts[i0:i1,k] += ok & (th <= self.ends[i0:i1]+w)
+
+        # Events usually arrive in order of end time, but re-sort if not
+        if i0 > self.head and len(ends) > 0 and self.ends[i0-1] > self.ends[i0]:
+            o = np.argsort(self.ends[self.head:self.tail],kind='stable') + self.head
+            for k in ['ids','cells','ends','counts']:
+                getattr(self,k)[self.head:self.tail] = getattr(self,k)[o]
+
+    def update(self,t,frozen):
+        '''Adds one hour of data to the counts of every event whose window
+        covers that hour.
+
+        t = the time of the data (hours since reftime)
+        frozen = boolean array that is True where the surface is frozen
+        '''
+        ends = self.ends[self.head:self.tail]
+        i1 = self.head + np.searchsorted(ends,t,'left')
+        for k, w in enumerate(self.windows):
+            i0 = self.head + np.searchsorted(ends,t-w,'left')
+            self.counts[i0:i1,k] += frozen[self.cells[i0:i1]]
+
+        if self.recent.maxlen > 0:
+            self.recent.append((t,np.array(frozen,dtype=bool)))
+
+    def pop(self,tend,keep=False):
+        '''Stops tracking every event that ended before tend.
+
+        keep = if True, the events are left in place (e.g., to get the counts
+            so far for preliminary output)
+
+        Returns (1) an array of the ids of those events and (2) an array with
+        the frozen hours counted for each window (one column per window).
+        '''
+        i1 = self.head + np.searchsorted(self.ends[self.head:self.tail],tend,'left')
+        ids, counts = self.ids[self.head:i1].copy(), self.counts[self.head:i1].copy()
+        if not keep:
+            self.head = i1
+
+        return ids, counts
+
+def writeTracker(tracker,path,pending=[]):
+    '''Writes a freezetracker (and the end times of the months whose events
+    are still waiting on it) to a checkpoint file, the same way as
+    writeState.
+
+    tracker = the freezetracker to save
+    path = the file path (should end in .npz)
+    pending = list of times (hours since reftime) that mark the end of each
+        month not yet written
+    '''
+    arrays = {k:getattr(tracker,k)[tracker.head:tracker.tail] for k in ['ids','cells','ends','counts']}
+    arrays['windows'] = np.array(tracker.windows,dtype=np.int64)
+    arrays['history'] = np.array(tracker.recent.maxlen)
+    arrays['recentt'] = np.array([th for th, fr in tracker.recent],dtype=np.int64)
+    arrays['recentfrz'] = np.array([fr for th, fr in tracker.recent],dtype=bool)
+    arrays['pending'] = np.array(pending,dtype=np.int64)
+
+    with open(path+".tmp","wb") as f:
+        np.savez(f,**arrays)
+    os.replace(path+".tmp",path)
+
+def readTracker(path):
+    '''Loads a freezetracker from a checkpoint file written by writeTracker.
+
+    Returns (1) the freezetracker and (2) the list of pending month end times.
+    '''
+    with np.load(path) as f:
+        tracker = freezetracker(f['windows'].tolist(),max(len(f['ends']),1024),int(f['history']))
+        n = len(f['ends'])
+        for k in ['ids','cells','ends','counts']:
+            getattr(tracker,k)[:n] = f[k]
+        tracker.tail = n
+        for th, fr in zip(f['recentt'],f['recentfrz']):
+            tracker.recent.append((int(th),fr))
+        pending = f['pending'].tolist()
+
+    return tracker, pending
+
+'''*******************************************
+Cyclone Data
+*******************************************'''
+class lrucache:
+    '''A dictionary that holds at most maxsize items, dropping the least
+    recently used item when it is full. It counts hits and misses so that the
+    size can be tuned.
+
+    maxsize = the maximum number of items to keep
+    '''
+    def __init__(self,maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self,key,load):
+        '''Returns the item for key, calling load() to create it (and keeping
+        the result) if it is not in the cache.
+        '''
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+        self.misses += 1
+        item = load()
+        self.items[key] = item
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+        return item
+
+class cyclonedata:
+    '''An object that loads the output of the cyclone tracking (monthly lists
+    of system tracks and the cyclone field of each time step) and keeps the
+    most recently used ones in memory, so that events close in time do not
+    unpickle the same files again. Cyclone fields are kept as their labelled
+    cyclone areas. Items in the cache are shared, so they should not be
+    modified.
+
+    ctpath = the directory of system tracks (YYYY/systemtracksYYYYMM.pkl)
+    cfpath = the directory of cyclone fields (YYYY/Mon/CFYYYYMMDD_HHHH.pkl)
+    maxtracks = the number of months of system tracks to keep
+    maxfields = the number of time steps of cyclone areas to keep
+    labelpath = the directory of labelled cyclone areas written by
+        3B_LabelCycloneAreas.py (optional); if given, cyclone areas are read
+        from there (one time step of a memory-mapped stack) instead of
+        labelling the cyclone fields, which are only used for time steps
+        missing from the stacks
+    '''
+    months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+
+    def __init__(self,ctpath,cfpath=None,maxtracks=3,maxfields=256,labelpath=None):
+        self.ctpath = ctpath
+        self.cfpath = cfpath
+        self.labelpath = labelpath
+        self.trackcache = lrucache(maxtracks)
+        self.areacache = lrucache(maxfields)
+        self.labelcache = lrucache(2)
+
+    def tracks(self,Y,M):
+        '''Returns the list of system tracks for year Y and month M.'''
+        Y, M = int(Y), int(M)
+        f = self.ctpath+"/"+str(Y)+"/systemtracks"+str(Y)+str(M).zfill(2)+".pkl"
+        return self.trackcache.get((Y,M),lambda: pd.read_pickle(f))
+
+    def areas(self,Y,M,D,H):
+        '''Returns (1) an array that labels the area of each cyclone in the
+        cyclone field at the time Y, M, D, H (0 outside of cyclones) and (2)
+        the number of cyclone areas.
+        '''
+        Y, M, D, H = int(Y), int(M), int(D), int(H)
+        if self.labelpath is not None:
+            times, stack = self.labelcache.get(Y,lambda: readLabels(self.labelpath,Y) \
+                if os.path.exists(labelFiles(self.labelpath,Y)[0]) else (np.array([],dtype='datetime64[h]'),None))
+            i = np.searchsorted(times,labelTime(Y,M,D,H))
+            if i < len(times) and times[i] == labelTime(Y,M,D,H):
+                return self.areacache.get((Y,M,D,H),lambda: (np.array(stack[i]),int(np.max(stack[i]))))
+
+        f = self.cfpath+"/"+str(Y)+"/"+self.months[M-1]+"/CF"+str(Y)+str(M).zfill(2)+str(D).zfill(2)+"_"+str(H).zfill(2)+"00.pkl"
+        return self.areacache.get((Y,M,D,H),lambda: labelField(pd.read_pickle(f).fieldAreas))
+
+    def stats(self):
+        '''Returns a summary of cache hits and misses.'''
+        return "System tracks: " + str(self.trackcache.hits) + " hits, " + str(self.trackcache.misses) + \
+            " misses; Cyclone areas: " + str(self.areacache.hits) + " hits, " + str(self.areacache.misses) + " misses"
+
+# Columns of the storm center table -- time is in days since reftime (as in
+## the cyclone tracking), lifespan is in days, and EndYear and EndMonth give
+## the month of the last center of the track (i.e., the monthly file of
+## system tracks that holds it)
+centercolumns = [("sid",np.int64),("time",float),("x",np.int64),("y",np.int64),\
+    ("lat",float),("lon",float),("type",np.int64),("p_cent",float),("lifespan",float),\
+    ("EndYear",np.int64),("EndMonth",np.int64)]
+
+def centerTable(tracks,lats=None,lons=None,reftime=[1900,1,1,0,0,0]):
+    '''Flattens a list of system tracks (e.g., one month of the output of the
+    cyclone tracking) into a table with one row for each center of each
+    track (see centercolumns).
+
+    tracks = a list of track objects, each with a sid and a data frame of
+        centers (data) with time, x, y, type, and p_cent columns
+    lats, lons = arrays with the latitude and longitude of each cell of the
+        tracking grid (optional; lat and lon are NaN if not given)
+    reftime = the reference time of the tracking
+
+    Returns a data frame in the order of the tracks and then their centers.
+    '''
+    buf = eventbuffer(centercolumns,sum([len(ct.data) for ct in tracks]))
+    for ct in tracks:
+        time = np.asarray(ct.data['time'],dtype=float)
+        if len(time) == 0:
+            continue
+        x, y = np.asarray(ct.data['x']).astype(np.int64), np.asarray(ct.data['y']).astype(np.int64)
+        lifespan = ct.lifespan() if hasattr(ct,'lifespan') else time[-1] - time[0]
+        Y, M = hoursToDates(time[-1]*24,reftime)[:2]
+
+        buf.append(sid=np.repeat(ct.sid,len(time)),time=time,x=x,y=y,\
+            lat=(np.nan if lats is None else np.asarray(lats)[y,x]),\
+            lon=(np.nan if lons is None else np.asarray(lons)[y,x]),\
+            type=np.asarray(ct.data['type']).astype(np.int64),p_cent=np.asarray(ct.data['p_cent'],dtype=float),\
+            lifespan=np.repeat(lifespan,len(time)),EndYear=np.repeat(Y,len(time)),EndMonth=np.repeat(M,len(time)))
+
+    return buf.toDataFrame()
+
+def centerFile(path,Y):
+    '''Returns the path of the file that holds the storm centers of the tracks
+    that end in year Y.
+    '''
+    return path+"/StormCenters_"+str(Y)+".parquet"
+
+class centertable:
+    '''The storm center tables written by 3A_BuildStormCenterTable.py, loaded as
+    one set of columns sorted by time (centers at the same time stay in the
+    order of the monthly files of system tracks). Finding the centers at a
+    given time is a binary search rather than a scan of every track.
+
+    path = the directory of the tables
+    years = the years of track end to load (default is all of them; include
+        the year after the last one needed, since tracks are filed by the
+        month they end)
+    '''
+    def __init__(self,path,years=None):
+        if years is None:
+            years = sorted([int(f[13:17]) for f in os.listdir(path) if re.match(r"^StormCenters_\d{4}\.parquet$",f)])
+        years = [Y for Y in years if os.path.exists(centerFile(path,Y))]
+        if len(years) == 0:
+            raise FileNotFoundError("No storm center tables in " + path)
+
+        df = pd.concat([pd.read_parquet(centerFile(path,Y)) for Y in sorted(years)],ignore_index=True)
+        o = np.argsort(df['time'].values,kind='stable')
+        self.columns = {c:df[c].values[o] for c in df.columns}
+        self.bytrack = None
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def at(self,time):
+        '''Returns a dictionary with an array for each column that holds every
+        center at time (days since reftime).
+        '''
+        i0 = np.searchsorted(self.columns['time'],time,'left')
+        i1 = np.searchsorted(self.columns['time'],time,'right')
+        return {c:a[i0:i1] for c, a in self.columns.items()}
+
+    def track(self,sid,Y,M):
+        '''Returns a dictionary with an array for each column that holds the
+        centers of one track in time order, given its sid and the year and
+        month that it ends (as recorded by stage 3).
+        '''
+        if self.bytrack is None: # Sort by track the first time it is needed
+            self.bytrack = np.lexsort((self.columns['time'],self.columns['sid'],\
+                            self.columns['EndYear']*12+self.columns['EndMonth']))
+            self.trackkeys = ((self.columns['EndYear']*12+self.columns['EndMonth'])*(2**32) + self.columns['sid'])[self.bytrack]
+
+        key = (int(Y)*12+int(M))*(2**32) + int(sid)
+        i0, i1 = np.searchsorted(self.trackkeys,key,'left'), np.searchsorted(self.trackkeys,key,'right')
+        return {c:a[self.bytrack[i0:i1]] for c, a in self.columns.items()}
+
+def haversine(lats1,lats2,lons1,lons2,units="meters",R=6371000.):
+    '''Calculates great circle distances for many pairs of points at once (a
+    vectorized version of the haversine function of the cyclone tracking).
+    Inputs are broadcast against each other, so that, e.g., a column of
+    query points and a row of storm centers give a matrix of distances.
+
+    lats1, lats2, lons1, lons2 = latitudes and longitudes (in degrees) of the
+        first and second points
+    units = "meters" or "km"
+    R = the radius of the earth in meters
+
+    Returns an array (or a scalar) of distances.
+    '''
+    lats1, lats2 = np.radians(lats1), np.radians(lats2)
+    dlat, dlon = lats2 - lats1, np.radians(lons2) - np.radians(lons1)
+
+    a = np.sin(dlat/2.)**2 + np.cos(lats1)*np.cos(lats2)*np.sin(dlon/2.)**2
+    d = R * 2*np.arctan2(np.sqrt(a),np.sqrt(1-a))
+
+    return d/1000. if units == "km" else d
+
+class centerindex:
+    '''A spatial index of storm centers (e.g., those at one time step) for
+    finding the centers within some distance of many points at once. If
+    scikit-learn is installed and there are at least mintree centers, the
+    centers are put in a BallTree with the haversine metric; otherwise (or if
+    the tree is not wanted) every distance is calculated with haversine.
+    Either way, the final distances are those of haversine, so the results
+    do not depend on whether the tree is used.
+
+    lats, lons = arrays of the latitude and longitude (in degrees) of each
+        storm center
+    mintree = the fewest centers for which to build a tree (None for never)
+    R = the radius of the earth in meters
+    blocksize = the most distances to hold in memory at once without a tree
+    '''
+    def __init__(self,lats,lons,mintree=64,R=6371000.,blocksize=2**20):
+        self.lats = np.asarray(lats,dtype=float).ravel()
+        self.lons = np.asarray(lons,dtype=float).ravel()
+        self.R = R
+        self.block = max(1,blocksize//max(1,len(self.lats)))
+        self.tree = None
+
+        if mintree is not None and len(self.lats) >= mintree:
+            try:
+                from sklearn.neighbors import BallTree # optional, for many centers
+                self.tree = BallTree(np.radians(np.column_stack((self.lats,self.lons))),metric='haversine')
+            except ImportError:
+                pass
+
+    def __len__(self):
+        return len(self.lats)
+
+    def distances(self,lats,lons):
+        '''Returns a (points, centers) matrix of the distance in meters from each
+        point to each center.
+        '''
+        return haversine(np.asarray(lats,dtype=float).reshape(-1,1),self.lats[np.newaxis,:],\
+                         np.asarray(lons,dtype=float).reshape(-1,1),self.lons[np.newaxis,:],R=self.R)
+
+    def within(self,lats,lons,dthresh):
+        '''Finds the centers less than dthresh meters from each point.
+
+        lats, lons = arrays of the latitude and longitude (in degrees) of the
+            points
+
+        Returns a list with an array for each point of the indices of those
+        centers (in increasing order) and a list of arrays of their distances.
+        '''
+        lats, lons = np.asarray(lats,dtype=float).ravel(), np.asarray(lons,dtype=float).ravel()
+        if self.tree is None:
+            idx, dists = [], []
+            for b in range(0,len(lats),self.block): # a block of points at a time
+                d = self.distances(lats[b:b+self.block],lons[b:b+self.block])
+                for di in d:
+                    idx.append(np.where(di < dthresh)[0])
+                    dists.append(di[idx[-1]])
+            return idx, dists
+
+        # The tree finds candidates (with a small margin for rounding), which
+        ## are then checked with the same distances as without the tree
+        cand = self.tree.query_radius(np.radians(np.column_stack((lats,lons))),dthresh/self.R*(1+1e-9))
+        idx, dists = [], []
+        for i, c in enumerate(cand):
+            c = np.sort(c)
+            d = haversine(lats[i],self.lats[c],lons[i],self.lons[c],R=self.R)
+            idx.append(c[d < dthresh])
+            dists.append(d[d < dthresh])
+
+        return idx, dists
+
+    def nearest(self,lats,lons,dthresh):
+        '''Finds the closest center to each point, if any are less than dthresh
+        meters away (ties go to the first center).
+
+        Returns an array with the index of that center for each point (-1 if
+        none are close enough).
+        '''
+        lats, lons = np.asarray(lats,dtype=float).ravel(), np.asarray(lons,dtype=float).ravel()
+        if self.tree is None:
+            near = np.repeat(-1,len(lats))
+            if len(self) == 0:
+                return near
+            for b in range(0,len(lats),self.block): # a block of points at a time
+                d = self.distances(lats[b:b+self.block],lons[b:b+self.block])
+                near[b:b+self.block] = np.where(np.any(d < dthresh,axis=1),np.argmin(d,axis=1),-1)
+            return near
+
+        idx, dists = self.within(lats,lons,dthresh)
+        return np.array([i[np.argmin(d)] if len(i) > 0 else -1 for i, d in zip(idx,dists)],dtype=np.int64)
+
+def labelField(fieldAreas):
+    '''Labels the area of each cyclone in a cyclone field (the fieldAreas of
+    a cyclone field object).
+
+    Returns (1) an array with a label from 1 to n for each cyclone area (0
+    outside of cyclones) and (2) the number of cyclone areas (n).
+    '''
+    from scipy import ndimage # only needed for cyclone fields
+
+    return ndimage.label(fieldAreas)
+
+def labelTime(Y,M,D,H):
+    '''Returns the time step Y, M, D, H as a datetime64 hour, the way that
+    the times of the labelled cyclone areas are stored.
+    '''
+    return np.datetime64("%04d-%02d-%02dT%02d" % (int(Y),int(M),int(D),int(H)),'h')
+
+def labelFiles(path,Y):
+    '''Returns the paths of the files that hold the labelled cyclone areas of
+    year Y: the (time, y, x) stack of labels, the time of each layer, and the
+    table of the storms in each labelled area.
+    '''
+    return path+"/CycloneLabels_"+str(Y)+".npy", path+"/CycloneLabels_"+str(Y)+"_Times.npy", \
+        path+"/CycloneLabels_"+str(Y)+"_Storms.parquet"
+
+def writeLabels(path,Y,times,labels):
+    '''Writes one year of labelled cyclone areas as a (time, y, x) stack in
+    the smallest unsigned integer type that holds every label (usually one
+    byte per cell), so that the stack stays small without compression and a
+    single time step can be read from a memory map.
+
+    path = the directory of the labels
+    Y = the year
+    times = a list of the time of each layer (see labelTime), in order
+    labels = a list of the arrays of labels (see labelField) for each time
+    '''
+    fstack, ftimes = labelFiles(path,Y)[:2]
+    dtype = np.min_scalar_type(max([int(np.max(l)) for l in labels]+[0]))
+    stack = np.lib.format.open_memmap(fstack+".tmp",mode='w+',dtype=dtype,shape=(len(labels),)+np.shape(labels[0]))
+    for i, l in enumerate(labels):
+        stack[i] = l
+    stack.flush()
+    del stack
+
+    with open(ftimes+".tmp","wb") as f:
+        np.save(f,np.array(times,dtype='datetime64[h]'))
+    os.replace(ftimes+".tmp",ftimes)
+    os.replace(fstack+".tmp",fstack)
+
+def readLabels(path,Y):
+    '''Returns (1) the times of the labelled cyclone areas of year Y and (2)
+    their (time, y, x) stack as a read-only memory map.
+    '''
+    fstack, ftimes = labelFiles(path,Y)[:2]
+    return np.load(ftimes), np.load(fstack,mmap_mode='r')
+
+def labelTable(times,stack,centers,reftime=[1900,1,1,0,0,0]):
+    '''Matches the labelled cyclone areas to the storms whose centers lie in
+    them.
+
+    times, stack = one year of labelled cyclone areas (see readLabels; the
+        lists given to writeLabels also work)
+    centers = a centertable holding the storm centers of those times
+    reftime = the reference time of the tracking
+
+    Returns a data frame with one row for each storm center in a cyclone area:
+    the time step (index of the layer in the stack), time (days since
+    reftime), label, and the sid, EndYear, EndMonth, and type of the storm.
+    '''
+    days = (np.asarray(times,dtype='datetime64[h]') - toDatetime64(reftime)).astype(np.int64)/24.
+
+    buf = eventbuffer([("step",np.int64),("time",float),("label",np.int64),("sid",np.int64),\
+        ("EndYear",np.int64),("EndMonth",np.int64),("type",np.int64)],len(times))
+    for i in range(len(times)):
+        c = centers.at(days[i])
+        label = np.asarray(stack[i])[c['y'],c['x']].astype(np.int64)
+        k = label > 0
+        buf.append(step=np.repeat(i,np.sum(k)),time=np.repeat(days[i],np.sum(k)),label=label[k],\
+            sid=c['sid'][k],EndYear=c['EndYear'][k],EndMonth=c['EndMonth'][k],type=c['type'][k])
+
+    return buf.toDataFrame()
@@ -0,0 +1,58 @@
+'''
+Shared fixtures: a small synthetic reanalysis held in memory, with the same
+read(key) and subset(cells) methods as a dailyreader.
+'''
+import os
+import sys
+import numpy as np
+import pytest
+
+pytest.importorskip("netCDF4") # imported by RainOnSnow_Module
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+import RainOnSnow_Module as ros
+
+class arrayreader:
+    '''Hourly data for a few grid cells from starttime to endtime.
+
+    data = dictionary of variable : (time, ncells) array
+    keys = the YYYYMMDD key of each day in data
+    rows, cols = arrays with the row and column of each grid cell
+    '''
+    def __init__(self,data,keys,rows,cols):
+        self.data, self.keys = data, keys
+        self.days = {k:i for i, k in enumerate(keys)}
+        self.rows, self.cols = np.asarray(rows), np.asarray(cols)
+
+    def read(self,key):
+        i = self.days[key]*24
+        return {v:a[i:i+24].copy() for v, a in self.data.items()}
+
+    def subset(self,cells):
+        return arrayreader({v:a[:,cells] for v, a in self.data.items()},self.keys,\
+                           self.rows[cells],self.cols[cells])
+
+def makeReader(starttime,endtime,ncells=6,dry=(),seed=0):
+    '''Returns an arrayreader with showery precip in every grid cell except
+    those in dry (no precip at all), in the units of MERRA2.
+    '''
+    rng = np.random.default_rng(seed)
+    keys = [k for k, t in ros.dayKeys(starttime,endtime)]
+    n = len(keys)*24
+
+    wet = rng.random((n,ncells)) < 0.25
+    wet[:,list(dry)] = False
+    prec = np.where(wet,rng.exponential(1.0,(n,ncells))/3600.,0).astype(np.float32)
+    data = {'PRECTOTLAND':prec,
+            'PRECSNOLAND':(prec*rng.random((n,ncells))).astype(np.float32),
+            'SNODP':rng.uniform(0,0.3,(n,ncells)).astype(np.float32),
+            'TSURF':rng.normal(271,4,(n,ncells)).astype(np.float32),
+            'T2M':rng.normal(271,4,(n,ncells)).astype(np.float32)}
+
+    return arrayreader(data,keys,np.arange(ncells)//3,np.arange(ncells)%3)
+
+@pytest.fixture
+def reader():
+    '''Six grid cells from Jan through Apr 1980; the last three never have
+    any precip.
+    '''
+    return makeReader([1980,1,1,0,0,0],[1980,5,1,0,0,0],dry=(3,4,5),seed=2)
@@ -0,0 +1,57 @@
+'''
+Tests of the event catalog in RainOnSnow_Module (Parquet files, one per
+month), in particular months with no events.
+'''
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("netCDF4") # imported by RainOnSnow_Module
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+import RainOnSnow_Module as ros
+
+def events(n):
+    '''Returns n made-up events with the columns of stage 2.'''
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({c:rng.integers(0,20,n) if t is np.int64 else rng.random(n) \
+                       for c, t in ros.catalogtypes.items() if c not in ("SID","CMonth","CYear")})
+    df['Frz01'] = rng.random(n)
+    return df
+
+def test_empty_month_keeps_types(tmp_path):
+    path = str(tmp_path/"cat")
+    ros.writeCatalog(events(0),path,"198001")
+    ros.writeCatalog(events(50),path,"198002")
+
+    df = ros.readCatalog(path)
+    assert len(df) == 50
+    for c in ["Year","Month","Day","Hour","X","Y","Length","EndTime","Ice"]:
+        assert df[c].dtype == np.int64
+    assert df['Frz01'].dtype == np.float64
+
+def test_month_from_header_only_csv(tmp_path):
+    # A month with no events that went through a csv file has no column types
+    events(0).to_csv(tmp_path/"empty.csv",index=0)
+    path = str(tmp_path/"cat")
+    ros.writeCatalog(pd.read_csv(tmp_path/"empty.csv"),path,"198001")
+    ros.writeCatalog(events(50),path,"198002")
+
+    df = ros.readCatalog(path,filters=[("X","<",10)])
+    assert len(df) == np.sum(events(50)['X'] < 10)
+    assert df['Year'].dtype == np.int64
+
+    df = ros.readCatalog(path,[1980,1,1,0,0,0],[1980,2,1,0,0,0])
+    assert len(df) == 0 and df['Length'].dtype == np.int64
+
+def test_month_without_schema(tmp_path):
+    # Written before writeCatalog cast the columns
+    path = str(tmp_path/"cat")
+    os.makedirs(os.path.dirname(ros.catalogFile(path,"198001")))
+    events(0).astype(object).to_parquet(ros.catalogFile(path,"198001"),index=False)
+    ros.writeCatalog(events(50),path,"198002")
+
+    df = ros.readCatalog(path)
+    assert len(df) == 50 and df['Year'].dtype == np.int64
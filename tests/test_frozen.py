@@ -0,0 +1,143 @@
+'''
+Tests of counting frozen hours after events (countFrozen and freezetracker)
+against a naive count of each event hour by hour, as in the original stage 2.
+'''
+import numpy as np
+import RainOnSnow_Module as ros
+
+reftime = [1900,1,1,0,0,0]
+windows = [24,240,720]
+
+def naiveCounts(frozen,t0,cells,ends,starts,tend):
+    '''Counts the frozen hours in each window for each event one hour and one
+    event at a time: hour t counts for an event that ended at E if
+    0 < t-E <= w and t is no earlier than the event's start.
+    '''
+    counts = {w:np.zeros(len(ends),dtype=np.int64) for w in windows}
+    for t in range(max(t0,int(np.min(starts))),tend):
+        for j in range(len(ends)):
+            if t >= starts[j]:
+                for w in windows:
+                    if 0 < t-ends[j] <= w:
+                        counts[w][j] += frozen[t-t0,cells[j]]
+    return counts
+
+def makeEvents(seed=1,ncells=4):
+    '''Returns hourly frozen surfaces from Jan through Mar 1980 and the
+    events of each month, which are counted from the start of their month
+    (when stage 2 loads them), including some that ended in the last hours
+    of the month before.
+    '''
+    rng = np.random.default_rng(seed)
+    t0 = ros.hoursSince(reftime,1980,1,1)
+    ms = [ros.hoursSince(reftime,1980,m,1) for m in (1,2,3,4)]
+    frozen = rng.random((ms[-1]-t0,ncells)) < 0.6
+
+    ends, starts = [], []
+    for m in range(3):
+        e = np.concatenate(([ms[m]-2,ms[m]-1,ms[m],ms[m+1]-1],rng.integers(ms[m],ms[m+1],16)))
+        ends.append(e)
+        starts.append(np.repeat(ms[m],len(e)))
+    ends, starts = np.concatenate(ends), np.concatenate(starts)
+    cells = rng.integers(0,ncells,len(ends))
+
+    return frozen, t0, ms, cells, ends, starts
+
+def test_countFrozen_matches_naive():
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    counts = ros.countFrozen(frozen,t0,cells,ends,starts,windows,ms[-1])
+    naive = naiveCounts(frozen,t0,cells,ends,starts,ms[-1])
+    for w in windows:
+        np.testing.assert_array_equal(counts[w],naive[w])
+
+def test_countFrozen_daily_after_trimming():
+    # As in stage 2: a list of daily arrays, without the days before the
+    ## first event still waiting (here Feb), and windows that cross into Mar
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    k = starts >= ms[1]
+    days = [frozen[i:i+24] for i in range(ms[1]-t0,ms[-1]-t0,24)]
+    counts = ros.countFrozen(days,ms[1],cells[k],ends[k],starts[k],windows,ms[-1])
+    naive = naiveCounts(frozen,t0,cells[k],ends[k],starts[k],ms[-1])
+    for w in windows:
+        np.testing.assert_array_equal(counts[w],naive[w])
+
+def test_countFrozen_preliminary():
+    # Data only through part of Mar (not on a day boundary), so the longer
+    ## windows are not complete; preliminary output divides each count by the
+    ## part of the window that has passed, min(tend-E, w)
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    tend = ms[2] + 9*24 + 5
+    k = ends < tend
+    counts = ros.countFrozen(frozen,t0,cells[k],ends[k],starts[k],windows,tend)
+    naive = naiveCounts(frozen,t0,cells[k],ends[k],starts[k],tend)
+    assert np.any(tend-ends[k] < 720)
+    for w in windows:
+        np.testing.assert_array_equal(counts[w],naive[w])
+        np.testing.assert_array_equal(counts[w]/np.minimum(tend-ends[k],float(w)),\
+            [naive[w][j]/np.min([tend-ends[k][j],float(w)]) for j in range(np.sum(k))])
+
+def runTracker(tracker,frozen,t0,tend,batches):
+    '''Feeds a freezetracker every hour from t0 to tend-1, adding each batch
+    of events (ids, cells, ends, start) before the hour it is keyed by.
+    '''
+    for t in range(t0,tend):
+        for b in batches.get(t,[]):
+            tracker.add(*b)
+        tracker.update(t,frozen[t-t0])
+
+def assertCounts(ids,cnts,naive,k):
+    '''Checks the counts popped for the events with ids (positions in k).'''
+    assert sorted(ids) == sorted(np.where(k)[0])
+    for i, w in enumerate(windows):
+        np.testing.assert_array_equal(cnts[:,i],naive[w][ids])
+
+def test_freezetracker_monthly():
+    # As in stage 2: each month's events are added when the month starts (so
+    ## events that ended in the month before come after later ones), and
+    ## each month is popped once its windows are complete
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    ids = np.arange(len(ends))
+    tracker = ros.freezetracker(windows,size=8)
+    runTracker(tracker,frozen,t0,ms[-1],{s:[(ids[starts == s],cells[starts == s],ends[starts == s])] for s in ms[:3]})
+    naive = naiveCounts(frozen,t0,cells,ends,starts,ms[-1])
+
+    assertCounts(*tracker.pop(ms[1]),naive,ends < ms[1])
+    assertCounts(*tracker.pop(ms[2],keep=True),naive,(ends >= ms[1]) & (ends < ms[2]))
+    assertCounts(*tracker.pop(ms[2]),naive,(ends >= ms[1]) & (ends < ms[2]))
+    assertCounts(*tracker.pop(ms[3]),naive,ends >= ms[2])
+    assert len(tracker) == 0
+
+def test_freezetracker_preliminary():
+    # Stopped partway through Mar: the counts so far, for the preliminary
+    ## output of Feb and Mar (divided by min(tend-E, w))
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    tend = ms[2] + 9*24 + 5
+    ids = np.arange(len(ends))
+    tracker = ros.freezetracker(windows)
+    runTracker(tracker,frozen,t0,tend,{s:[(ids[starts == s],cells[starts == s],ends[starts == s])] for s in ms[:3]})
+    naive = naiveCounts(frozen,t0,cells,ends,starts,tend)
+
+    tracker.pop(ms[1])
+    pids, cnts = tracker.pop(tend,keep=True)
+    k = (ends >= ms[1]) & (ends < tend)
+    assertCounts(pids,cnts,naive,k)
+    for i, w in enumerate(windows):
+        np.testing.assert_array_equal(cnts[:,i]/np.minimum(tend-ends[pids],float(w)),\
+            [naive[w][j]/np.min([tend-ends[j],float(w)]) for j in pids])
+
+def test_freezetracker_added_late():
+    # As in the fused stage 1: events are added when they are terminated,
+    ## hthresh hours after they ended, and count the hours since then from
+    ## the history (but none before the start of the run)
+    hthresh = 2
+    frozen, t0, ms, cells, ends, starts = makeEvents()
+    k = ends + hthresh < ms[-1]
+    ids = np.arange(len(ends))
+    batches = {}
+    for j in np.where(k)[0]:
+        batches.setdefault(ends[j]+hthresh,[]).append(([ids[j]],[cells[j]],[ends[j]],t0))
+    tracker = ros.freezetracker(windows,size=4,history=hthresh)
+    runTracker(tracker,frozen,t0,ms[-1],batches)
+    naive = naiveCounts(frozen,t0,cells,ends,np.repeat(t0,len(ends)),ms[-1])
+
+    assertCounts(*tracker.pop(ms[-1]),naive,k)
@@ -0,0 +1,69 @@
+'''
+Tests of incremental runs of the stage 2 script (2_ROS_ID_ByGrid.py) against
+a full run, using the extracted time series of a synthetic reader.
+'''
+import os
+import re
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+import RainOnSnow_Module as ros
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("MERRA_Module") # imported by the script
+
+repo = os.path.join(os.path.dirname(__file__),"..")
+name = "PrecipEvents_Alaska_Gap2_Rate0.254_Total0.254"
+
+def runScript(script,path,**variables):
+    '''Runs a copy of a script in path with the given variables replaced.'''
+    src = open(os.path.join(repo,script)).read()
+    for k, v in variables.items():
+        src, n = re.subn(r"^"+k+r" = .*$",k+" = "+repr(v),src,count=1,flags=re.M)
+        assert n == 1, k
+    with open(str(path)+"/"+script,"w") as f:
+        f.write(src)
+
+    env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.abspath(repo)]+sys.path))
+    subprocess.run([sys.executable,script],cwd=str(path),env=env,check=True,stdout=subprocess.DEVNULL)
+
+def stage1(reader,csvpath,monthtimes):
+    '''Writes the monthly event files of stage 1 for the reader.'''
+    os.makedirs(csvpath)
+    state = None
+    for m in range(len(monthtimes)-1):
+        edf, state = ros.detectEvents(reader,monthtimes[m],monthtimes[m+1],6.096/24,0.254,2,state=state)
+        ros.eventTable(edf,reader.rows,reader.cols).to_csv(csvpath+"/"+name+"_"+"%04d%02d" % tuple(monthtimes[m][:2])+".csv",index=0)
+
+@pytest.mark.parametrize("hourly",[0,1])
+def test_restart_from_later_month(reader,tmp_path,hourly):
+    monthtimes = [[1980,m,1,0,0,0] for m in range(1,6)]
+    tspath = str(tmp_path/"TimeSeries")
+    ros.extractTimeSeries(reader,monthtimes[0],monthtimes[-1],tspath,list(reader.data.keys()))
+
+    # Some events in the stage 1 file for Mar ended in Feb
+    stage1(reader,str(tmp_path/"check"),monthtimes)
+    mar = pd.read_csv(str(tmp_path/"check")+"/"+name+"_198003.csv")
+    endtime = ros.hoursSince([1900,1,1,0,0,0],mar['Year'],mar['Month'],mar['Day'],mar['Hour']) + mar['Length']
+    assert np.any(endtime < ros.hoursSince([1900,1,1,0,0,0],1980,3,1))
+
+    common = dict(fromcache=1,tspath=tspath,frzwindows=[24,240],hourly=hourly)
+    for run in ["full","inc"]:
+        stage1(reader,str(tmp_path/run/"csv"),monthtimes)
+        os.makedirs(str(tmp_path/run/"out"))
+        common.update(csvpath=str(tmp_path/run/"csv"),outpath=str(tmp_path/run/"out"))
+
+        if run == "full":
+            runScript("2_ROS_ID_ByGrid.py",tmp_path/run,starttime=monthtimes[0],endtime=monthtimes[-1],**common)
+        else:
+            # Through Mar, then continue from the first month with incomplete
+            ## freezing windows (Mar)
+            runScript("2_ROS_ID_ByGrid.py",tmp_path/run,starttime=monthtimes[0],endtime=monthtimes[3],**common)
+            runScript("2_ROS_ID_ByGrid.py",tmp_path/run,incremental=1,**common)
+
+    full = ros.readCatalog(str(tmp_path/"full"/"out")+"/"+name)
+    inc = ros.readCatalog(str(tmp_path/"inc"/"out")+"/"+name)
+    assert len(full) > 0
+    pd.testing.assert_frame_equal(inc.reset_index(drop=True),full.reset_index(drop=True))
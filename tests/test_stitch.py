@@ -0,0 +1,32 @@
+'''
+Tests of running precip event detection in chunks of time that are stitched
+together (stitchEvents, as used by detectEventsParallel) against a serial run
+of detectEvents.
+'''
+import numpy as np
+import pandas as pd
+import pytest
+import RainOnSnow_Module as ros
+
+rthresh, pthresh, hthresh = 6.096/24, 0.254, 2
+
+@pytest.mark.parametrize("means",[False,True])
+def test_stitched_equals_serial(reader,means):
+    # Boundaries with events active across them, including a chunk of one day
+    times = [[1980,1,1,0,0,0],[1980,1,19,0,0,0],[1980,2,1,0,0,0],[1980,2,2,0,0,0],\
+             [1980,2,9,0,0,0],[1980,3,17,0,0,0]]
+    edf, state = ros.detectEvents(reader,times[0],times[-1],rthresh,pthresh,hthresh,means=means)
+
+    # Each chunk starts with no active events, as in detectEventsParallel
+    chunks = []
+    for i in range(len(times)-1):
+        cdf, cstate = ros.detectEvents(reader,times[i],times[i+1],rthresh,pthresh,hthresh,means=means)
+        chunks.append((times[i],times[i+1],cdf,cstate))
+    assert all(np.any(c[3].active()) for c in chunks[:-1]) # events carried over
+
+    sdf, sstates = ros.stitchEvents(reader,chunks,rthresh,pthresh,hthresh)
+
+    pd.testing.assert_frame_equal(sdf.reset_index(drop=True),edf.reset_index(drop=True))
+    assert len(sstates) == len(chunks)
+    for k, v in vars(state).items():
+        np.testing.assert_array_equal(getattr(sstates[-1],k),v)
@@ -0,0 +1,25 @@
+'''
+Tests of running precip event detection in tiles of grid cells
+(detectEventsTile and mergeTiles) against a single run of detectEvents.
+'''
+import numpy as np
+import pandas as pd
+import RainOnSnow_Module as ros
+
+rthresh, pthresh, hthresh = 6.096/24, 0.254, 2
+monthtimes = [[1980,1,1,0,0,0],[1980,2,1,0,0,0],[1980,3,1,0,0,0],[1980,4,1,0,0,0]]
+
+def test_tile_with_empty_months(reader,tmp_path):
+    # The second tile is dry, so it has no events in any month
+    tiles = [np.arange(0,3),np.arange(3,6)]
+    tilepaths = [ros.detectEventsTile(reader,cells,monthtimes,rthresh,pthresh,hthresh,\
+                    tilepath=str(tmp_path/("Tile"+str(i)))) for i, cells in enumerate(tiles)]
+
+    state = None
+    for m in range(len(monthtimes)-1):
+        edf, state = ros.detectEvents(reader,monthtimes[m],monthtimes[m+1],rthresh,pthresh,hthresh,state=state)
+        tdf, tstate = ros.mergeTiles(tilepaths,"%04d%02d" % tuple(monthtimes[m][:2]))
+
+        assert len(tdf) > 0
+        pd.testing.assert_frame_equal(ros.eventTable(tdf,reader.rows,reader.cols),\
+                                      ros.eventTable(edf,reader.rows,reader.cols))